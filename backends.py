@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 09:31:18 2026
+
+@author: micaelavieira
+"""
+
+"""
+Registry of the algorithms to calculate sentence similarity.
+
+Backend modules and their models are loaded only when first needed. warm_up loads them in a
+background thread, so that the model is ready by the time the expert and student files are read.
+"""
+
+from cache_utils import hash_file, hash_list, hash_strings
+import importlib
+import json
+import threading
+from typing import Callable
+
+#module implementing each algorithm; every module has a load_model function and a <name>_score_batch function
+BACKEND_MODULES = {'sentencebert': 'sentencebert', 'doc2vec': 'doc2vec', 'infersent': 'infersent'}
+
+#threads loading a backend in the background and errors they raised, keyed by name of the backend
+warm_up_threads = {}
+warm_up_errors = {}
+
+def load_backend(name: str, model_name: str = None, precision: str = None):
+    """
+    Purpose
+    -------
+    Import the module of a backend and load its model (both only the first time).
+
+    Parameters
+    ----------
+    name : str
+        Name of the backend (sentencebert, doc2vec, or infersent).
+    model_name : str, optional
+        Name or path of the sentencebert model (default: sentencebert.MODEL_NAME).
+    precision : str, optional
+        Precision of the sentencebert model, fp32 or int8 (default: sentencebert.PRECISION).
+
+    Returns
+    -------
+    module
+        Module implementing the backend.
+    """
+    module = importlib.import_module(BACKEND_MODULES[name])
+    if name == 'sentencebert' and model_name:
+        module.set_model_name(model_name)
+    if name == 'sentencebert' and precision:
+        module.set_precision(precision)
+    module.load_model()
+    return module
+
+def warm_up(name: str, model_name: str = None, precision: str = None):
+    """
+    Purpose
+    -------
+    Start loading a backend in a background thread.
+
+    Parameters
+    ----------
+    name : str
+        Name of the backend (sentencebert, doc2vec, or infersent).
+    model_name : str, optional
+        Name or path of the sentencebert model (default: sentencebert.MODEL_NAME).
+    precision : str, optional
+        Precision of the sentencebert model, fp32 or int8 (default: sentencebert.PRECISION).
+    """
+    if name in warm_up_threads:
+        return
+    def load_and_store_error():
+        try:
+            load_backend(name, model_name, precision)
+        except Exception as error:
+            warm_up_errors[name] = error
+    thread = threading.Thread(target=load_and_store_error, name='warm_up_' + name, daemon=True)
+    warm_up_threads[name] = thread
+    thread.start()
+
+def get_backend(name: str, model_name: str = None, precision: str = None):
+    """
+    Purpose
+    -------
+    Return a loaded backend, waiting for its warm up if it was started.
+
+    Parameters
+    ----------
+    name : str
+        Name of the backend (sentencebert, doc2vec, or infersent).
+    model_name : str, optional
+        Name or path of the sentencebert model (default: sentencebert.MODEL_NAME).
+    precision : str, optional
+        Precision of the sentencebert model, fp32 or int8 (default: sentencebert.PRECISION).
+
+    Returns
+    -------
+    module
+        Module implementing the backend.
+    """
+    if name in warm_up_threads:
+        warm_up_threads[name].join()
+        if name in warm_up_errors:
+            raise warm_up_errors.pop(name)
+    module = load_backend(name, model_name, precision)
+    return module
+
+def get_algorithm_fingerprint(name: str, module, keywords: dict, **options) -> str:
+    """
+    Purpose
+    -------
+    Describe everything that changes the scores of a backend, apart from the expert sentences:
+    model, hyperparameters and options. Results are cached under it (see result_cache.py).
+
+    Parameters
+    ----------
+    name : str
+        Name of the backend (sentencebert, doc2vec, or infersent).
+    module
+        Module implementing the backend.
+    keywords : dict
+        Options passed to the batch scoring function.
+    **options
+        Options of the command line (see get_scoring_functions).
+
+    Returns
+    -------
+    algorithm_fingerprint : str
+        Fingerprint of the algorithm.
+    """
+    #category and subcategory only name the persistent index; the expert sentences are hashed separately
+    fingerprint = {'algorithm': name, 'options': {key: value for key, value in keywords.items() if key not in ['category', 'subcategory']}}
+    if name == 'sentencebert':
+        fingerprint['model'] = module.get_model_fingerprint()
+    elif name == 'doc2vec':
+        fingerprint['model'] = [module.MODEL_PARAMETERS, module.SEED, module.INFER_EPOCHS, module.INFER_ALPHA]
+    elif name == 'infersent':
+        translator = options.get('translator', 'google')
+        fingerprint['model'] = [module.MODEL_PATH, module.W2V_PATH, translator]
+        if translator == 'dictionary':
+            fingerprint['translation_dictionary'] = hash_file(options['translation_dictionary'])
+    algorithm_fingerprint = json.dumps(fingerprint, sort_keys=True)
+    return algorithm_fingerprint
+
+def get_scoring_functions(name: str, category: str = None, subcategory: str = None, **options) -> tuple[Callable, Callable]:
+    """
+    Purpose
+    -------
+    Return the functions scoring one and many target sentences with a backend, configured with
+    the options of the command line.
+
+    Parameters
+    ----------
+    name : str
+        Name of the backend (sentencebert, doc2vec, or infersent).
+    category : str, optional
+        Category of the expert sentences (used by sentencebert to name its persistent index).
+    subcategory : str, optional
+        Subcategory of the expert sentences (used by sentencebert to name its persistent index).
+    **options
+        model_name, precision, index_kind, nprobe, storage and pca_dimension for sentencebert; infer_epochs and infer_alpha for doc2vec;
+        translator and translation_dictionary for infersent; result_cache (a result_cache.ResultCache)
+        to reuse the matches of sentences already scored; label to search in expert banks pooled
+        across categories (default: category_subcategory).
+
+    Returns
+    -------
+    algorithm : Callable
+        Function (single_sentence, list_of_sentences, list_of_categories) -> (score, most similar sentence, category).
+    algorithm_batch : Callable
+        Function (list_of_single_sentences, list_of_sentences, list_of_categories, top_k, list_of_labels) -> list of matches;
+        if list_of_labels (the label of every expert sentence) is given, only the expert sentences
+        with the label are searched.
+    """
+    module = get_backend(name, options.get('model_name'), options.get('precision'))
+    score_batch = getattr(module, name + '_score_batch')
+    keywords = {}
+    if name == 'sentencebert':
+        #expert embeddings are stored in a persistent index per category and subcategory
+        keywords = {'category': category, 'subcategory': subcategory,
+                    'index_kind': options.get('index_kind') or 'exact', 'nprobe': options.get('nprobe'),
+                    'storage': options.get('storage') or 'float32', 'pca_dimension': options.get('pca_dimension')}
+    elif name == 'doc2vec':
+        keywords = {'infer_epochs': options.get('infer_epochs'), 'infer_alpha': options.get('infer_alpha')}
+    elif name == 'infersent':
+        from translation import get_translator
+        module.set_translator(get_translator(options.get('translator', 'google'), options.get('translation_dictionary')))
+    label = options.get('label') or (category + '_' + subcategory if category and subcategory else None)
+    result_cache = options.get('result_cache')
+    algorithm_fingerprint = get_algorithm_fingerprint(name, module, keywords, **options) if result_cache else None
+    def algorithm_batch(list_of_single_sentences: list, list_of_sentences: list, list_of_categories: list, top_k: int = 1, list_of_labels: list = None) -> list:
+        label_keywords = {}
+        if list_of_labels is not None and label is not None:
+            if label not in list_of_labels:
+                raise ValueError('No expert sentences with label ' + label)
+            if name == 'sentencebert':
+                #the nearest-neighbour index filters the rows with the label
+                label_keywords = {'list_of_labels': list_of_labels, 'label': label}
+            else:
+                #the other backends have no index: the sentences with the label are selected before scoring
+                rows = [i for i, sentence_label in enumerate(list_of_labels) if sentence_label == label]
+                list_of_sentences = [list_of_sentences[i] for i in rows]
+                list_of_categories = [list_of_categories[i] for i in rows]
+        if result_cache is None:
+            return score_batch(list_of_single_sentences, list_of_sentences, list_of_categories, top_k, **keywords, **label_keywords)
+        #score only the distinct sentences that are not in the cache yet
+        corpus_hash = hash_strings([hash_list(list_of_sentences), hash_list(list_of_categories), label if label_keywords else None, hash_list(list_of_labels) if label_keywords else None])
+        matches_of_sentences = result_cache.get(algorithm_fingerprint, corpus_hash, top_k, list_of_single_sentences)
+        sentences_to_score = [sent for sent in dict.fromkeys(list_of_single_sentences) if sent not in matches_of_sentences]
+        if sentences_to_score:
+            new_matches = dict(zip(sentences_to_score, score_batch(sentences_to_score, list_of_sentences, list_of_categories, top_k, **keywords, **label_keywords)))
+            result_cache.put(algorithm_fingerprint, corpus_hash, top_k, new_matches)
+            matches_of_sentences.update(new_matches)
+        return [matches_of_sentences[sent] for sent in list_of_single_sentences]
+    def algorithm(single_sentence: str, list_of_sentences: list, list_of_categories: list) -> tuple:
+        return algorithm_batch([single_sentence], list_of_sentences, list_of_categories)[0][0]
+    return algorithm, algorithm_batch
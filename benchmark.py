@@ -0,0 +1,380 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Tue Oct 20 10:12:36 2026
+
+@author: micaelavieira
+"""
+
+"""
+Offline benchmark of the algorithms, of the preprocessing and of their scaling.
+
+The benchmark runs on the shipped expert and student files and on synthetic corpora obtained by
+scaling the expert bank and the number of student sentences. When gbert-large or the infersent
+data are not available, small local stand-in encoders are used, so that the benchmark always
+runs offline. Results are stored as json and can be compared with a baseline to catch regressions.
+
+Usage:
+    python benchmark.py [--algorithms sentencebert doc2vec infersent] [--expert_scales 1 10 100]
+                        [--student_counts 10 100 1000] [--output results.json] [--baseline baseline.json]
+"""
+
+import argparse
+import cache_utils
+import glob
+import hashlib
+from instrumentation import peak_memory_mb
+import json
+import numpy as np
+import os
+import platform
+import sys
+import tempfile
+import time
+
+class HashingEncoder:
+    """
+    Stand-in encoder: bag of hashed words and word bigrams, projected to a fixed dimension.
+    It has the interface used by the algorithms (encode, build_vocab and update_vocab).
+    """
+
+    def __init__(self, dimension: int = 256):
+        self.dimension = dimension
+
+    def encode(self, list_of_sentences: list, **kwargs) -> np.ndarray:
+        embeddings = np.zeros((len(list_of_sentences), self.dimension), dtype=np.float32)
+        for row, sentence in enumerate(list_of_sentences):
+            tokens = sentence.lower().split()
+            for feature in tokens + [first + ' ' + second for first, second in zip(tokens, tokens[1:])]:
+                digest = int.from_bytes(hashlib.blake2b(feature.encode('utf-8'), digest_size=8).digest(), 'little')
+                embeddings[row, digest % self.dimension] += 1 if (digest >> 32) & 1 else -1
+        return embeddings
+
+    def build_vocab(self, list_of_sentences: list, tokenize: bool = True):
+        pass
+
+    def update_vocab(self, list_of_sentences: list, tokenize: bool = True):
+        pass
+
+def percentiles(latencies: list) -> dict:
+    """
+    Purpose
+    -------
+    Summarise a list of latencies (in seconds) with p50 and p95, in milliseconds.
+
+    Parameters
+    ----------
+    latencies : list
+        List of latencies.
+
+    Returns
+    -------
+    dict
+        Dictionary with p50_ms and p95_ms.
+    """
+    p50, p95 = np.percentile(np.array(latencies) * 1000, [50, 95])
+    return {'p50_ms': round(float(p50), 3), 'p95_ms': round(float(p95), 3)}
+
+def load_shipped_corpus() -> tuple[list, list, list]:
+    """
+    Purpose
+    -------
+    Read the raw (not preprocessed) expert statements, their categories and the student
+    statements of the shipped files.
+
+    Returns
+    -------
+    tuple
+        Expert sentences, expert categories, and student sentences.
+    """
+    expert_sentences, expert_categories, student_sentences = [], [], []
+    for filename in sorted(glob.glob('experts/*.tsv')):
+        with open(filename, 'r', encoding='utf-8') as infile:
+            for line in infile:
+                splitted_line = line.rstrip('\n').split('\t')
+                if len(splitted_line) >= 4 and splitted_line[1].strip():
+                    expert_sentences.append(splitted_line[1].strip())
+                    expert_categories.append(splitted_line[3].strip())
+    for filename in sorted(glob.glob('students/*.tsv')):
+        with open(filename, 'r', encoding='utf-8') as infile:
+            for line in infile:
+                student_sentences.extend(cell.strip() for cell in line.rstrip('\n').split('\t')[:3] if cell.strip())
+    return expert_sentences, expert_categories, student_sentences
+
+def generate_corpus(sentences: list, categories: list, number_of_sentences: int, seed: int = 0) -> tuple[list, list]:
+    """
+    Purpose
+    -------
+    Generate a synthetic corpus of a given size: the original sentences first, then new sentences
+    obtained by shuffling and mixing the words of random original sentences.
+
+    Parameters
+    ----------
+    sentences : list
+        List containing the original sentences.
+    categories : list
+        List containing the categories of the original sentences (None for student sentences).
+    number_of_sentences : int
+        Number of sentences to generate.
+    seed : int, optional
+        Seed of the random generator (default: 0).
+
+    Returns
+    -------
+    tuple
+        List of generated sentences and list of their categories.
+    """
+    random_generator = np.random.default_rng(seed)
+    generated_sentences = list(sentences[:number_of_sentences])
+    generated_categories = list(categories[:number_of_sentences]) if categories else [None] * len(generated_sentences)
+    while len(generated_sentences) < number_of_sentences:
+        first, second = random_generator.integers(0, len(sentences), 2)
+        words = sentences[first].split() + sentences[second].split()[:3]
+        random_generator.shuffle(words)
+        generated_sentences.append(' '.join(words))
+        generated_categories.append(categories[first] if categories else None)
+    return generated_sentences, generated_categories
+
+def setup_algorithm(name: str) -> tuple:
+    """
+    Purpose
+    -------
+    Import an algorithm and replace its model with a stand-in encoder when the real model is not
+    available. The translator of infersent is always the offline identity translator.
+
+    Parameters
+    ----------
+    name : str
+        Name of the algorithm (sentencebert, doc2vec, or infersent).
+
+    Returns
+    -------
+    tuple
+        Module of the algorithm and name of the encoder used (None if the algorithm cannot run).
+    """
+    try:
+        if name == 'sentencebert':
+            import sentencebert as module
+            try:
+                module.load_model()
+                encoder = module.MODEL_NAME
+            except Exception:
+                module.model = HashingEncoder()
+                module.MODEL_NAME = 'hashing-stand-in'
+                encoder = 'hashing-stand-in'
+        elif name == 'doc2vec':
+            import doc2vec as module
+            encoder = 'doc2vec'
+        elif name == 'infersent':
+            import infersent as module
+            from translation import IdentityTranslator
+            module.set_translator(IdentityTranslator())
+            try:
+                module.load_model()
+                encoder = 'infersent'
+            except Exception:
+                module.infersent = HashingEncoder()
+                encoder = 'hashing-stand-in'
+    except ImportError as error:
+        print('Skipping', name + ':', error)
+        return None, None
+    return module, encoder
+
+def benchmark_algorithm(name: str, module, expert_sentences: list, expert_categories: list, student_sentences: list, single_calls: int = 20) -> dict:
+    """
+    Purpose
+    -------
+    Measure an algorithm on one corpus: cold batch (including the expert side), warm batch, and
+    latency of single-sentence calls, plus a per-stage breakdown.
+
+    Parameters
+    ----------
+    name : str
+        Name of the algorithm (sentencebert, doc2vec, or infersent).
+    module
+        Module of the algorithm (see setup_algorithm).
+    expert_sentences : list
+        List containing the expert sentences.
+    expert_categories : list
+        List containing the categories of the expert sentences.
+    student_sentences : list
+        List containing the student sentences.
+    single_calls : int, optional
+        Number of single-sentence calls used for the latency percentiles (default: 20).
+
+    Returns
+    -------
+    result : dict
+        Dictionary with the measurements.
+    """
+    score_batch = getattr(module, name + '_score_batch')
+    score = getattr(module, name + '_score')
+    stages = {}
+    start = time.perf_counter()
+    score_batch(student_sentences, expert_sentences, expert_categories)
+    cold_time = time.perf_counter() - start
+    start = time.perf_counter()
+    score_batch(student_sentences, expert_sentences, expert_categories)
+    warm_time = time.perf_counter() - start
+    latencies = []
+    for sent in student_sentences[:single_calls]:
+        start = time.perf_counter()
+        score(sent, expert_sentences, expert_categories)
+        latencies.append(time.perf_counter() - start)
+    #per-stage breakdown of a warm batch
+    if name == 'sentencebert':
+        start = time.perf_counter()
+        encoded_sentences = module.encode(student_sentences)
+        stages['encode students'] = time.perf_counter() - start
+        from nn_index import ExactIndex
+        from embedding_index import get_expert_embeddings
+        start = time.perf_counter()
+        index = ExactIndex(get_expert_embeddings(expert_sentences, module.encode, module.get_model_fingerprint()))
+        stages['expert index'] = time.perf_counter() - start
+        start = time.perf_counter()
+        index.search(encoded_sentences)
+        stages['search'] = time.perf_counter() - start
+    elif name == 'doc2vec':
+        start = time.perf_counter()
+        model = module.get_model(expert_sentences)
+        stages['model'] = time.perf_counter() - start
+        start = time.perf_counter()
+        module.infer_vectors(model, student_sentences)
+        stages['infer students'] = time.perf_counter() - start
+    elif name == 'infersent':
+        start = time.perf_counter()
+        translated_sentences = module.translate(student_sentences)
+        stages['translate students'] = time.perf_counter() - start
+        start = time.perf_counter()
+        module.load_model().encode(translated_sentences, tokenize=True)
+        stages['encode students'] = time.perf_counter() - start
+    result = {'experts': len(expert_sentences), 'students': len(student_sentences),
+              'cold_batch_s': round(cold_time, 4), 'warm_batch_s': round(warm_time, 4),
+              'throughput_sentences_per_s': round(len(student_sentences) / warm_time, 1) if warm_time else None,
+              'single_sentence': percentiles(latencies),
+              'stages_s': {stage: round(seconds, 4) for stage, seconds in stages.items()},
+              'peak_rss_mb': round(peak_memory_mb(), 1)}
+    return result
+
+def benchmark_preprocessing(student_sentences: list, repetitions: int = 2) -> dict:
+    """
+    Purpose
+    -------
+    Measure sentence_preprocessing on the student sentences, with an empty cache (first pass) and
+    with the cache filled by the previous passes.
+
+    Parameters
+    ----------
+    student_sentences : list
+        List containing the sentences to preprocess.
+    repetitions : int, optional
+        Number of passes over the sentences (default: 2).
+
+    Returns
+    -------
+    result : dict
+        Dictionary with the measurements (empty if the spelling tools are not installed).
+    """
+    try:
+        import preprocessing
+        preprocessing.load_german_dictionary()
+    except ImportError as error:
+        print('Skipping preprocessing:', error)
+        return {}
+    result = {'sentences': len(student_sentences), 'passes': []}
+    for repetition in range(repetitions):
+        latencies = []
+        start = time.perf_counter()
+        for sent in student_sentences:
+            sentence_start = time.perf_counter()
+            preprocessing.sentence_preprocessing(sent, 'beobachtungen', ['d.h.', 's.a.', 'u.a.', 'z.B.'], 'Andreas')
+            latencies.append(time.perf_counter() - sentence_start)
+        elapsed_time = time.perf_counter() - start
+        result['passes'].append(dict(pass_number=repetition + 1, seconds=round(elapsed_time, 4),
+                                     throughput_sentences_per_s=round(len(student_sentences) / elapsed_time, 1), **percentiles(latencies)))
+    result['correction_statistics'] = preprocessing.get_correction_statistics()
+    result['peak_rss_mb'] = round(peak_memory_mb(), 1)
+    return result
+
+def compare_with_baseline(results: dict, baseline: dict, tolerance: float) -> list:
+    """
+    Purpose
+    -------
+    Compare results with a baseline: throughputs lower than, and latencies, times and peak
+    memory higher than the baseline by more than the tolerance are regressions.
+
+    Parameters
+    ----------
+    results : dict
+        Results of the current run.
+    baseline : dict
+        Results of the baseline run.
+    tolerance : float
+        Relative tolerance (e.g. 0.2 for 20%).
+
+    Returns
+    -------
+    regressions : list
+        List of strings describing the regressions.
+    """
+    regressions = []
+    def compare(current, reference, path):
+        if isinstance(current, dict) and isinstance(reference, dict):
+            for key in current:
+                if key in reference:
+                    compare(current[key], reference[key], path + '/' + key)
+        elif isinstance(current, list) and isinstance(reference, list):
+            for position, (current_element, reference_element) in enumerate(zip(current, reference)):
+                compare(current_element, reference_element, path + '/' + str(position))
+        elif isinstance(current, (int, float)) and isinstance(reference, (int, float)) and reference > 0:
+            #throughputs only regress when they decrease (their names end with _s as well)
+            if 'throughput' in path:
+                if current < reference * (1 - tolerance):
+                    regressions.append('%s: %s < %s' % (path, current, reference))
+            elif (path.endswith('_ms') or path.endswith('_s') or '/stages_s/' in path or path.endswith('/seconds') or path.endswith('peak_rss_mb')) and current > reference * (1 + tolerance):
+                regressions.append('%s: %s > %s' % (path, current, reference))
+    compare(results['runs'], baseline.get('runs', {}), 'runs')
+    return regressions
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Offline benchmark of the algorithms and of the preprocessing.')
+    parser.add_argument('--algorithms', nargs='+', choices=['sentencebert', 'doc2vec', 'infersent'], default=['sentencebert', 'doc2vec', 'infersent'], help='Algorithms to benchmark (default: all)')
+    parser.add_argument('--expert_scales', type=int, nargs='+', default=[1, 10, 100], help='Factors by which the expert bank is scaled (default: 1 10 100)')
+    parser.add_argument('--student_counts', type=int, nargs='+', default=[10, 100, 1000], help='Numbers of student sentences (default: 10 100 1000)')
+    parser.add_argument('--no_preprocessing', action='store_true', help='Do not benchmark the preprocessing')
+    parser.add_argument('--output', default='benchmark_results.json', help='Json file of the results (default: benchmark_results.json)')
+    parser.add_argument('--baseline', help='Json file of a previous run to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Relative tolerance of the comparison with the baseline (default: 0.2)')
+    args = vars(parser.parse_args())
+    #caches are written to a temporary directory, so that runs are independent of each other
+    cache_utils.CACHE_DIR = tempfile.mkdtemp(prefix='benchmark_cache_')
+    expert_sentences, expert_categories, student_sentences = load_shipped_corpus()
+    results = {'machine': {'python': platform.python_version(), 'platform': platform.platform(), 'cpus': os.cpu_count()},
+               'arguments': args, 'runs': {}}
+    if not args['no_preprocessing']:
+        results['runs']['preprocessing'] = benchmark_preprocessing(student_sentences)
+    for name in args['algorithms']:
+        module, encoder = setup_algorithm(name)
+        if module is None:
+            continue
+        results['runs'][name] = {'encoder': encoder}
+        for expert_scale in args['expert_scales']:
+            scaled_expert_sentences, scaled_expert_categories = generate_corpus(expert_sentences, expert_categories, len(expert_sentences) * expert_scale)
+            for student_count in args['student_counts']:
+                scaled_student_sentences, _ = generate_corpus(student_sentences, None, student_count, seed=1)
+                key = 'experts_x%d_students_%d' % (expert_scale, student_count)
+                results['runs'][name][key] = benchmark_algorithm(name, module, scaled_expert_sentences, scaled_expert_categories, scaled_student_sentences)
+                run = results['runs'][name][key]
+                print ("{:<14s} {:<28s} {:>12s} sent/s   p50 {:>9s} ms   p95 {:>9s} ms   peak {:>8s} MB".format(
+                    name, key, str(run['throughput_sentences_per_s']), str(run['single_sentence']['p50_ms']), str(run['single_sentence']['p95_ms']), str(run['peak_rss_mb'])))
+    with open(args['output'], 'w') as out:
+        json.dump(results, out, indent=2)
+    print('Results stored in', args['output'])
+    if args['baseline']:
+        with open(args['baseline'], 'r') as infile:
+            regressions = compare_with_baseline(results, json.load(infile), args['tolerance'])
+        for regression in regressions:
+            print('REGRESSION', regression)
+        if regressions:
+            sys.exit(1)
+        print('No regressions with respect to', args['baseline'])
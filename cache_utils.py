@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 15:10:12 2026
+
+@author: micaelavieira
+"""
+
+"""
+Helper functions shared by the on-disk caches of the project.
+"""
+
+import hashlib
+import os
+
+#directory where all the cached artifacts are stored
+CACHE_DIR = 'cache'
+#hashes of the last lists passed to hash_list, keyed by identity of the list
+list_hashes = {}
+LIST_HASHES_SIZE = 64
+
+def hash_strings(list_of_strings: list) -> str:
+    """
+    Purpose
+    -------
+    Compute a content hash of a list of strings (order matters).
+
+    Parameters
+    ----------
+    list_of_strings : list
+        List containing the strings to hash.
+
+    Returns
+    -------
+    content_hash : str
+        Hexadecimal SHA-256 digest of the strings.
+    """
+    hasher = hashlib.sha256()
+    for element in list_of_strings:
+        encoded_element = str(element).encode('utf-8')
+        #prefix each element with its length so that ['ab', 'c'] and ['a', 'bc'] differ
+        hasher.update(str(len(encoded_element)).encode('utf-8') + b':')
+        hasher.update(encoded_element)
+    content_hash = hasher.hexdigest()
+    return content_hash
+
+def hash_list(list_of_strings: list) -> str:
+    """
+    Purpose
+    -------
+    Same as hash_strings, but the hash is remembered for the list object, so that a list passed
+    with every batch (e.g. the expert sentences) is hashed only once. The list must not be
+    modified afterwards (only a change of its length is detected).
+
+    Parameters
+    ----------
+    list_of_strings : list
+        List containing the strings to hash.
+
+    Returns
+    -------
+    content_hash : str
+        Hexadecimal SHA-256 digest of the strings.
+    """
+    entry = list_hashes.get(id(list_of_strings))
+    if entry is not None and entry[0] is list_of_strings and entry[1] == len(list_of_strings):
+        return entry[2]
+    content_hash = hash_strings(list_of_strings)
+    if len(list_hashes) >= LIST_HASHES_SIZE:
+        #forget the oldest list
+        del list_hashes[next(iter(list_hashes))]
+    #the list itself is kept, so that its id is not reused by another list
+    list_hashes[id(list_of_strings)] = (list_of_strings, len(list_of_strings), content_hash)
+    return content_hash
+
+def hash_file(filename: str) -> str:
+    """
+    Purpose
+    -------
+    Compute the content hash of a file.
+
+    Parameters
+    ----------
+    filename : str
+        Name of the file to hash.
+
+    Returns
+    -------
+    content_hash : str
+        Hexadecimal SHA-256 digest of the file content.
+    """
+    hasher = hashlib.sha256()
+    with open(filename, 'rb') as infile:
+        for block in iter(lambda: infile.read(1 << 20), b''):
+            hasher.update(block)
+    content_hash = hasher.hexdigest()
+    return content_hash
+
+def cache_path(*parts: str) -> str:
+    """
+    Purpose
+    -------
+    Build a path inside the cache directory, creating the parent folders if needed.
+
+    Parameters
+    ----------
+    *parts : str
+        Path components relative to the cache directory.
+
+    Returns
+    -------
+    path : str
+        Path of the cached artifact.
+    """
+    path = os.path.join(CACHE_DIR, *parts)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
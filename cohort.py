@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 14:22:10 2026
+
+@author: micaelavieira
+"""
+
+"""
+Whole-cohort batch mode: score every student file of a directory (or glob) for all subcategories.
+
+Student files are preprocessed by a pool of worker processes while the main process, which
+loads the algorithm only once, scores the files already preprocessed. The category of a file is
+inferred from its name (Anamnese_... or Spielsit_...).
+
+With --vocabulary_first, the expert and student statements of the whole cohort are preprocessed
+at once (see preprocessing.corpus_preprocessing): every distinct token is corrected only once,
+by the pool of worker processes, before the files are scored.
+
+Usage:
+    python cohort.py students/ [-A ALGORITHM] [-O OUTPUT_DIRECTORY] [-j WORKERS] [--vocabulary_first]
+"""
+
+import argparse
+from backends import get_scoring_functions, warm_up
+from concurrent.futures import as_completed, ProcessPoolExecutor
+from expert_corpus import build_expert_corpus, SUBCATEGORIES
+import glob
+import numpy as np
+import os
+from preprocessing import add_corrections
+
+#prefixes of the names of the student files and corresponding categories
+CATEGORY_PREFIXES = {'anamnese': 'anamnese', 'spielsit': 'spielsituation'}
+
+def get_student_files(students: str) -> list:
+    """
+    Purpose
+    -------
+    List the student files of a directory or matching a glob pattern.
+
+    Parameters
+    ----------
+    students : str
+        Directory containing the student files, or glob pattern.
+
+    Returns
+    -------
+    filenames : list
+        Sorted list of the names of the student files.
+    """
+    if os.path.isdir(students):
+        students = os.path.join(students, '*.tsv')
+    filenames = sorted(glob.glob(students))
+    return filenames
+
+def infer_category(filename: str, default_category: str = None) -> str:
+    """
+    Purpose
+    -------
+    Infer the category of a student file from its name.
+
+    Parameters
+    ----------
+    filename : str
+        Name of the student file.
+    default_category : str, optional
+        Category to return if the name does not start with a known prefix.
+
+    Returns
+    -------
+    category : str
+        Category of the file (either anamnese or spielsituation).
+    """
+    basename = os.path.basename(filename).lower()
+    for prefix, category in CATEGORY_PREFIXES.items():
+        if basename.startswith(prefix):
+            return category
+    return default_category
+
+def preprocess_student_file(filename: str, subcategory: str, abbreviation_list: list, substitution_name: str) -> tuple[str, str, list, dict]:
+    """
+    Purpose
+    -------
+    Extract and preprocess the student statements of a file (runs in a worker process).
+
+    Parameters
+    ----------
+    filename : str
+        Name of the file containing the student sentences.
+    subcategory : str
+        Subcategory we are interested in (beobachtungen, herausforderungen, or ressourcen).
+    abbreviation_list : list
+        List of abbreviations to keep unchanged during preprocessing.
+    substitution_name : str
+        Name to use to substitute the initial character of the real name of the patient.
+
+    Returns
+    -------
+    tuple
+        Name of the file, subcategory, list containing the preprocessed student statements, and
+        new entries of the correction lexicon.
+    """
+    import preprocessing
+    student_sentences = preprocessing.get_student_statements(filename, subcategory, abbreviation_list, substitution_name)
+    #worker processes do not run atexit handlers: the new corrections are saved by the main process
+    return filename, subcategory, student_sentences, preprocessing.take_new_corrections()
+
+def preprocess_cohort(tasks: list, abbreviation_list: list, substitution_name: str, workers: int = None) -> list:
+    """
+    Purpose
+    -------
+    Extract the student statements of all files and preprocess them at once, correcting every
+    distinct token only once (see preprocessing.corpus_preprocessing).
+
+    Parameters
+    ----------
+    tasks : list
+        List of tuples (file, category, subcategory).
+    abbreviation_list : list
+        List of abbreviations to keep unchanged during preprocessing.
+    substitution_name : str
+        Name to use to substitute the initial character of the real name of the patient.
+    workers : int, optional
+        Number of correction processes (default: number of cores).
+
+    Returns
+    -------
+    preprocessed_files : list
+        List of tuples (file, subcategory, list containing the preprocessed student statements).
+    """
+    import preprocessing
+    statements = [(filename, subcategory, preprocessing.read_student_file(filename, subcategory)) for filename, _, subcategory in tasks]
+    preprocessed_sentences = preprocessing.corpus_preprocessing([(sent, subcategory) for _, subcategory, sentences in statements for sent in sentences],
+                                                                abbreviation_list, substitution_name, workers)
+    preprocessed_files = []
+    start = 0
+    for filename, subcategory, sentences in statements:
+        preprocessed_files.append((filename, subcategory, preprocessed_sentences[start:start + len(sentences)]))
+        start += len(sentences)
+    return preprocessed_files
+
+def run_cohort(students: str, algorithm_name: str, abbreviation_list: list, substitution_name: str, output_directory: str = 'cohort_output',
+               subcategories: list = None, default_category: str = None, workers: int = None, top_k: int = 1, vocabulary_first: bool = False, **options) -> list:
+    """
+    Purpose
+    -------
+    Score all student files for all subcategories, write one output file per student file and
+    subcategory and a combined report of the cohort.
+
+    Parameters
+    ----------
+    students : str
+        Directory containing the student files, or glob pattern.
+    algorithm_name : str
+        Algorithm to use (sentencebert, doc2vec, or infersent).
+    abbreviation_list : list
+        List of abbreviations to keep unchanged during preprocessing.
+    substitution_name : str
+        Name to use to substitute the initial character of the real name of the patient.
+    output_directory : str, optional
+        Directory of the output files (default: cohort_output).
+    subcategories : list, optional
+        Subcategories to score (default: all).
+    default_category : str, optional
+        Category of the files whose name does not reveal it (default: files are skipped).
+    workers : int, optional
+        Number of preprocessing processes (default: number of cores).
+    top_k : int, optional
+        Number of most similar expert sentences to store for each student sentence (default: 1).
+    vocabulary_first : bool, optional
+        Whether to preprocess the statements of the whole cohort at once before scoring (default: False).
+    **options
+        Options of the algorithm (see backends.get_scoring_functions).
+
+    Returns
+    -------
+    cohort_rows : list
+        List of tuples (file, category, subcategory, expert category, number of elements, sum of the scores).
+    """
+    subcategories = subcategories or SUBCATEGORIES
+    os.makedirs(output_directory, exist_ok=True)
+    tasks = []
+    for filename in get_student_files(students):
+        category = infer_category(filename, default_category)
+        if category is None:
+            print('Skipping', filename, '(unknown category)')
+            continue
+        for subcategory in subcategories:
+            tasks.append((filename, category, subcategory))
+    categories_of_files = {filename: category for filename, category, _ in tasks}
+    cohort_rows = []
+    algorithms = {}
+
+    #score the preprocessed statements of a file, write its output file and its rows of the report
+    def score_file(filename, subcategory, student_sentences):
+        category = categories_of_files[filename]
+        entry = corpus[category + '_' + subcategory]
+        expert_sentences, expert_categories = entry['sentences'], entry['categories']
+        if (category, subcategory) not in algorithms:
+            algorithms[(category, subcategory)] = get_scoring_functions(algorithm_name, category, subcategory, **options)[1]
+        all_matches = algorithms[(category, subcategory)](student_sentences, expert_sentences, expert_categories, top_k)
+        categories_and_scores_most_similar_sentences = {i: [] for i in set(expert_categories)}
+        outname = os.path.join(output_directory, os.path.basename(filename)[:-4] + '_' + subcategory + '_outfile.txt')
+        with open(outname, 'w') as out:
+            out.write('Student_sentence \t Similarity_score \t Most_sililar_sentence \t Category\n')
+            for sent, matches in zip(student_sentences, all_matches):
+                score_most_similar_sentence, most_similar_sentence, most_similar_sentence_category = matches[0]
+                categories_and_scores_most_similar_sentences[most_similar_sentence_category].append(score_most_similar_sentence)
+                out.write(sent + '\t' + str(score_most_similar_sentence) + '\t' + most_similar_sentence + '\t' + most_similar_sentence_category + '\n')
+        #sums are kept unrounded, so that the averages over the cohort are exact
+        for key, value in categories_and_scores_most_similar_sentences.items():
+            cohort_rows.append((filename, category, subcategory, key, len(value), float(np.sum(value))))
+        print('Scored', filename, subcategory, '(' + str(len(student_sentences)) + ' statements)')
+
+    if vocabulary_first:
+        #the expert files that changed and all student files share one vocabulary pass each;
+        #the model is loaded only afterwards, so that the worker processes are not forked from it
+        corpus = build_expert_corpus(abbreviation_list, substitution_name, vocabulary_first=True, workers=workers)
+        preprocessed_files = preprocess_cohort(tasks, abbreviation_list, substitution_name, workers)
+        warm_up(algorithm_name, options.get('model_name'), options.get('precision'))
+        for filename, subcategory, student_sentences in preprocessed_files:
+            score_file(filename, subcategory, student_sentences)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            #the worker processes are started before the model is loaded in the background
+            futures = [executor.submit(preprocess_student_file, filename, subcategory, abbreviation_list, substitution_name) for filename, _, subcategory in tasks]
+            warm_up(algorithm_name, options.get('model_name'), options.get('precision'))
+            #the expert statements are read (and checked against their files) once for all files
+            corpus = build_expert_corpus(abbreviation_list, substitution_name)
+            #score the files in the order in which their preprocessing ends
+            for future in as_completed(futures):
+                filename, subcategory, student_sentences, corrections = future.result()
+                add_corrections(corrections)
+                score_file(filename, subcategory, student_sentences)
+    cohort_rows.sort()
+    with open(os.path.join(output_directory, 'cohort_report.tsv'), 'w') as out:
+        out.write('File\tCategory\tSubcategory\tExpert_category\tNr_elements\tAverage\n')
+        for filename, category, subcategory, expert_category, count, total in cohort_rows:
+            out.write('\t'.join([filename, category, subcategory, expert_category, str(count), str(round(total / count, 3) if count else 0)]) + '\n')
+    return cohort_rows
+
+def print_cohort_report(cohort_rows: list):
+    """
+    Purpose
+    -------
+    Print the report of the cohort: for every category and subcategory, the number of student
+    sentences and the average score of each expert category over all files.
+
+    Parameters
+    ----------
+    cohort_rows : list
+        List of tuples returned by run_cohort.
+    """
+    aggregates = {}
+    for _, category, subcategory, expert_category, count, total in cohort_rows:
+        aggregate = aggregates.setdefault((category, subcategory, expert_category), [0, 0.0])
+        aggregate[0] += count
+        aggregate[1] += total
+    print('\n\n***************************************************************************************')
+    print('COHORT REPORT')
+    print('***************************************************************************************')
+    print ("{:^30s} {:^30s} {:^30s}".format('CATEGORY', 'NR. ELEMENTS', 'AVERAGE'))
+    last_key = None
+    for (category, subcategory, expert_category), (count, total) in sorted(aggregates.items()):
+        if (category, subcategory) != last_key:
+            print('---', category, subcategory, '---')
+            last_key = (category, subcategory)
+        print ("{:^30s} {:^30s} {:^30s}".format(expert_category, str(count), str(round(total / count, 3)) if count else str(0)))
+    print('***************************************************************************************')
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Score a whole cohort of student files.')
+    parser.add_argument('students', help='Directory containing the student files, or glob pattern')
+    parser.add_argument('-A', '--algorithm', choices=['sentencebert', 'doc2vec', 'infersent'], default='sentencebert', help='Algorithm to use (default: sentencebert)')
+    parser.add_argument('-s', '--subcategory', choices=['beobachtungen', 'herausforderungen', 'ressourcen'], action='append', help='Subcategory to look at, can be repeated (default: all)')
+    parser.add_argument('-a', '--abbreviations', default='["d.h.", "s.a.", "u.a.", "z.B."]', help='List of abbreviations not to preprocess (default: ["d.h.", "s.a.", "u.a.", "z.B."])')
+    parser.add_argument('-p', '--patient', default='Andreas', help='Patient name (default: Andreas)')
+    parser.add_argument('-O', '--output_directory', default='cohort_output', help='Directory of the output files (default: cohort_output)')
+    parser.add_argument('-j', '--workers', type=int, help='Number of preprocessing processes (default: number of cores)')
+    parser.add_argument('--vocabulary_first', action='store_true', help='Preprocess the whole cohort at once, correcting every distinct token only once')
+    args = vars(parser.parse_args())
+    abbreviations = args['abbreviations'].replace('"', '').replace('[', '').replace(']', '').split(', ')
+    print_cohort_report(run_cohort(args['students'], args['algorithm'], abbreviations, args['patient'], args['output_directory'], args['subcategory'], workers=args['workers'],
+                                  vocabulary_first=args['vocabulary_first']))
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Thu Oct 22 16:51:20 2026
+
+@author: micaelavieira
+"""
+
+"""
+Report on the compact sentencebert expert embeddings (float16 storage and PCA projection, see
+embedding_index.get_compact_expert_embeddings) compared with full precision.
+
+All shipped student files are scored for every subcategory with the float32 embeddings and
+with every compact configuration. The report gives the size of the expert embeddings, how often
+the best expert match and its category change, how many rows of the FINAL REPORT change their
+number of sentences, and how much the average scores of the other rows change.
+
+Usage:
+    python compact_embeddings_report.py [--configurations float16 float16:256 float32:128] [-m MODEL]
+"""
+
+import argparse
+from cohort import get_student_files, infer_category
+from expert_corpus import CATEGORIES, load_expert_statements_and_categories, SUBCATEGORIES
+import numpy as np
+from preprocessing import get_student_statements
+from quantization_validation import compare_matches
+import sentencebert
+
+def parse_configuration(configuration: str) -> tuple[str, int]:
+    """
+    Purpose
+    -------
+    Split a configuration (storage, or storage:pca_dimension) in storage and number of components.
+
+    Parameters
+    ----------
+    configuration : str
+        Configuration to split.
+
+    Returns
+    -------
+    tuple
+        Storage (float16 or float32) and number of principal components (None without projection).
+    """
+    if ':' in configuration:
+        storage, pca_dimension = configuration.split(':')
+        return storage, int(pca_dimension)
+    return configuration, None
+
+def get_final_report(matches: list) -> dict:
+    """
+    Purpose
+    -------
+    Compute the rows of the FINAL REPORT of a list of best matches.
+
+    Parameters
+    ----------
+    matches : list
+        List of best matches (score, most similar sentence, category).
+
+    Returns
+    -------
+    final_report : dict
+        Dictionary mapping every category to the number of sentences and the rounded average score.
+    """
+    categories_and_scores = {}
+    for score, _, category in matches:
+        categories_and_scores.setdefault(category, []).append(score)
+    final_report = {category: (len(scores), round(float(np.average(scores)), 3)) for category, scores in categories_and_scores.items()}
+    return final_report
+
+def score_all(abbreviation_list: list, substitution_name: str, storage: str = 'float32', pca_dimension: int = None) -> tuple[dict, float]:
+    """
+    Purpose
+    -------
+    Score all shipped student files for every subcategory with one storage of the expert embeddings.
+
+    Parameters
+    ----------
+    abbreviation_list : list
+        List of abbreviations to keep unchanged during preprocessing.
+    substitution_name : str
+        Name to use to substitute the initial character of the real name of the patient.
+    storage : str, optional
+        Storage of the expert embeddings: float32 or float16 (default: float32).
+    pca_dimension : int, optional
+        Number of principal components (default: no projection).
+
+    Returns
+    -------
+    tuple
+        Dictionary mapping every file and subcategory to its best matches, and size in MB of all
+        expert embeddings.
+    """
+    matches = {}
+    size = 0
+    for category in CATEGORIES:
+        for subcategory in SUBCATEGORIES:
+            expert_sentences, expert_categories = load_expert_statements_and_categories(category, subcategory, abbreviation_list, substitution_name)
+            for filename in get_student_files('students'):
+                if infer_category(filename) != category:
+                    continue
+                student_sentences = get_student_statements(filename, subcategory, abbreviation_list, substitution_name)
+                file_matches = sentencebert.sentencebert_score_batch(student_sentences, expert_sentences, expert_categories, 1, category, subcategory,
+                                                                     storage=storage, pca_dimension=pca_dimension)
+                matches[filename + ' ' + subcategory] = [sentence_matches[0] for sentence_matches in file_matches]
+            for index in sentencebert.expert_indexes.values():
+                size += index.embeddings.nbytes
+            sentencebert.expert_indexes.clear()
+    return matches, round(size / 2**20, 2)
+
+def report(configurations: list, abbreviation_list: list, substitution_name: str):
+    """
+    Purpose
+    -------
+    Print the comparison of every compact configuration with the float32 embeddings.
+
+    Parameters
+    ----------
+    configurations : list
+        List of configurations (storage, or storage:pca_dimension).
+    abbreviation_list : list
+        List of abbreviations to keep unchanged during preprocessing.
+    substitution_name : str
+        Name to use to substitute the initial character of the real name of the patient.
+    """
+    reference_matches, reference_size = score_all(abbreviation_list, substitution_name)
+    reference_reports = {key: get_final_report(matches) for key, matches in reference_matches.items()}
+    print ("{:^16s} {:^12s} {:^14s} {:^16s} {:^16s} {:^22s} {:^20s}".format('STORAGE', 'SIZE (MB)', 'MEAN |DIFF|', 'SAME BEST MATCH', 'SAME CATEGORY', 'REPORT COUNTS CHANGED', 'REPORT MEAN |DIFF|'))
+    print ("{:^16s} {:^12s} {:^14s} {:^16s} {:^16s} {:^22s} {:^20s}".format('float32', str(reference_size), '0', '1.0', '1.0', '0', '0'))
+    for configuration in configurations:
+        storage, pca_dimension = parse_configuration(configuration)
+        matches, size = score_all(abbreviation_list, substitution_name, storage, pca_dimension)
+        comparison = compare_matches(reference_matches, matches)
+        #rows of the final report whose number of sentences changes, and differences of the averages of the other rows
+        changed_rows, rows, average_differences = 0, 0, []
+        for key, reference_report in reference_reports.items():
+            final_report = get_final_report(matches[key])
+            for category in set(reference_report) | set(final_report):
+                rows += 1
+                reference_count, reference_average = reference_report.get(category, (0, 0))
+                count, average = final_report.get(category, (0, 0))
+                if count != reference_count:
+                    changed_rows += 1
+                else:
+                    average_differences.append(abs(average - reference_average))
+        print ("{:^16s} {:^12s} {:^14s} {:^16s} {:^16s} {:^22s} {:^20s}".format(configuration, str(size), str(comparison['mean_score_difference']), str(comparison['best_match_agreement']),
+                                                                              str(comparison['category_agreement']), '%d of %d' % (changed_rows, rows),
+                                                                              str(round(float(np.mean(average_differences)), 4)) if average_differences else '0'))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare compact sentencebert expert embeddings with full precision.')
+    parser.add_argument('--configurations', nargs='+', default=['float16', 'float16:256', 'float16:128'], help='Compact configurations: storage, or storage:number_of_components (default: float16 float16:256 float16:128)')
+    parser.add_argument('-m', '--model', help='Name or directory of the sentencebert model (default: gbert-large)')
+    parser.add_argument('-a', '--abbreviations', default='["d.h.", "s.a.", "u.a.", "z.B."]', help='List of abbreviations not to preprocess (default: ["d.h.", "s.a.", "u.a.", "z.B."])')
+    parser.add_argument('-p', '--patient', default='Andreas', help='Patient name (default: Andreas)')
+    args = vars(parser.parse_args())
+    if args['model']:
+        sentencebert.set_model_name(args['model'])
+    abbreviations = args['abbreviations'].replace('"', '').replace('[', '').replace(']', '').split(', ')
+    report(args['configurations'], abbreviations, args['patient'])
@@ -10,8 +10,141 @@ from gensim.models.doc2vec import Doc2Vec, TaggedDocument
 from nltk.tokenize import word_tokenize
 #import nltk
 #nltk.download('punkt')
+from cache_utils import cache_path, hash_strings
+from instrumentation import increment, observe, timer
+import json
+import numpy as np
+import os
+from similarity import best_matches, cosine_similarities
 from typing import Tuple
 
+#hyperparameters of the model trained on the expert sentences
+MODEL_PARAMETERS = {'vector_size': 20, 'window': 4, 'min_count': 1, 'epochs': 100}
+#seed used for training and inference, so that scores are reproducible
+SEED = 42
+#number of epochs and initial learning rate used to infer the vector of a target sentence
+#(None means the values used for training): fewer epochs are faster but less stable
+INFER_EPOCHS = None
+INFER_ALPHA = None
+
+#models already loaded in this process, keyed by hash of the expert sentences
+loaded_models = {}
+
+def load_model():
+    """
+    Purpose
+    -------
+    Nothing to load in advance: the doc2vec model depends on the expert sentences (see get_model).
+    """
+    pass
+
+def get_model(list_of_sentences: list) -> Doc2Vec:
+    """
+    Purpose
+    -------
+    Return the doc2vec model trained on a list of sentences. The model is trained only once per
+    list of sentences and stored in cache/doc2vec, named after the hash of the sentences and
+    of the hyperparameters.
+
+    Parameters
+    ----------
+    list_of_sentences : list
+        List containing the sentences on which the model is trained; the i-th sentence is tagged with i.
+
+    Returns
+    -------
+    model : Doc2Vec
+        Trained model.
+    """
+    model_hash = hash_strings([json.dumps(MODEL_PARAMETERS, sort_keys=True), str(SEED)] + list_of_sentences)
+    if model_hash in loaded_models:
+        return loaded_models[model_hash]
+    filename = cache_path('doc2vec', model_hash + '.model')
+    if os.path.exists(filename):
+        model = Doc2Vec.load(filename)
+    else:
+        tokenized_lowecase_sentences = [word_tokenize(sentence.lower()) for sentence in list_of_sentences]
+        #a single worker keeps the training deterministic
+        with timer('doc2vec.train'):
+            model = Doc2Vec([TaggedDocument(d, [i]) for i, d in enumerate(tokenized_lowecase_sentences)],
+                            seed = SEED, workers = 1, **MODEL_PARAMETERS)
+        model.save(filename + '.tmp')
+        os.replace(filename + '.tmp', filename)
+    loaded_models[model_hash] = model
+    return model
+
+def infer_vectors(model: Doc2Vec, list_of_single_sentences: list, epochs: int = None, alpha: float = None) -> np.ndarray:
+    """
+    Purpose
+    -------
+    Infer the vectors of a list of sentences. The random generator of the model is reset before
+    every sentence, so the same sentence always gets the same vector.
+
+    Parameters
+    ----------
+    model : Doc2Vec
+        Trained model.
+    list_of_single_sentences : list
+        List containing the sentences to vectorise.
+    epochs : int, optional
+        Number of inference epochs (default: INFER_EPOCHS).
+    alpha : float, optional
+        Initial learning rate of the inference (default: INFER_ALPHA).
+
+    Returns
+    -------
+    vectorised_sentences : np.ndarray
+        Matrix whose rows are the vectors of the sentences.
+    """
+    epochs = epochs or INFER_EPOCHS
+    alpha = alpha or INFER_ALPHA
+    increment('doc2vec.sentences_inferred', len(list_of_single_sentences))
+    observe('doc2vec.batch_size', len(list_of_single_sentences))
+    vectorised_sentences = np.empty((len(list_of_single_sentences), model.dv.vector_size), dtype=np.float32)
+    with timer('doc2vec.infer'):
+        for index, sentence in enumerate(list_of_single_sentences):
+            model.random = np.random.RandomState(SEED)
+            vectorised_sentences[index] = model.infer_vector(word_tokenize(sentence.lower()), alpha=alpha, epochs=epochs)
+    return vectorised_sentences
+
+def doc2vec_score_batch(list_of_single_sentences: list, list_of_sentences: list, list_of_categories: list, top_k: int = 1, infer_epochs: int = None, infer_alpha: float = None) -> list:
+    """
+    Purpose
+    -------
+    Find the most similar sentences to each target sentence with the doc2vec method.
+    The model is trained only once on list_of_sentences and then reused (see get_model).
+
+    Parameters
+    ----------
+    list_of_single_sentences : list
+        List containing the target sentences.
+    list_of_sentences : list
+        List containing sentences as strings among which to find the most similar to each target sentence.
+    list_of_categories : list
+        List containing categories of the sentences in list_of_sentences.
+    top_k : int, optional
+        Number of most similar sentences to return for each target sentence (default: 1).
+    infer_epochs : int, optional
+        Number of inference epochs (default: INFER_EPOCHS).
+    infer_alpha : float, optional
+        Initial learning rate of the inference (default: INFER_ALPHA).
+
+    Returns
+    -------
+    matches : list
+        List containing, for each target sentence, a list of top_k tuples
+        (score_most_similar_sentence, most_similar_sentence, most_similar_sentence_category).
+    """
+    if not list_of_single_sentences:
+        return []
+    model = get_model(list_of_sentences)
+    vectorised_sentences = infer_vectors(model, list_of_single_sentences, infer_epochs, infer_alpha)
+    #document vectors are tagged with their position in list_of_sentences
+    with timer('doc2vec.similarity'):
+        similarities = cosine_similarities(vectorised_sentences, model.dv.vectors)
+        matches = best_matches(similarities, list_of_sentences, list_of_categories, top_k)
+    return matches
+
 def doc2vec_score(single_sentence: str, list_of_sentences: list, list_of_categories: list) -> Tuple[float, str, str]:
     """
     Purpose
@@ -36,12 +169,5 @@ def doc2vec_score(single_sentence: str, list_of_sentences: list, list_of_categor
     most_similar_sentence_category : str
         Category of the most_similar_sentence.
     """
-    tokenized_lowecase_sentences = [word_tokenize(sentence.lower()) for sentence in list_of_sentences]
-    model = Doc2Vec([TaggedDocument(d, [i]) for i, d in enumerate(tokenized_lowecase_sentences)], 
-                    vector_size = 20, window = 4, min_count = 1, epochs = 100)
-    vectorised_sentence = model.infer_vector(word_tokenize(single_sentence.lower()))
-    score_most_similar_sentence = round(model.dv.most_similar(positive = [vectorised_sentence])[0][1], 2)
-    index_most_similar_sentence = model.dv.most_similar(positive = [vectorised_sentence])[0][0]
-    most_similar_sentence = list_of_sentences[index_most_similar_sentence]
-    most_similar_sentence_category = list_of_categories[index_most_similar_sentence]
-    return score_most_similar_sentence, most_similar_sentence, most_similar_sentence_category
\ No newline at end of file
+    score_most_similar_sentence, most_similar_sentence, most_similar_sentence_category = doc2vec_score_batch([single_sentence], list_of_sentences, list_of_categories)[0][0]
+    return score_most_similar_sentence, most_similar_sentence, most_similar_sentence_category
@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 15:14:40 2026
+
+@author: micaelavieira
+"""
+
+"""
+Persistent index of the expert sentence embeddings.
+
+For every (model, category, subcategory) the L2-normalised embeddings of the preprocessed
+expert sentences are stored in cache/expert_index as a .npy matrix (loaded memory-mapped)
+together with a .json file containing the hash of every row. When the expert files change,
+only the new or edited sentences are encoded again.
+
+Optionally, a compact copy of an index is stored next to it (see get_compact_expert_embeddings):
+float16 values, possibly projected on the principal components of the expert embeddings. The
+compact copy is opened read-only and memory-mapped, so worker processes share its pages.
+"""
+
+import json
+import numpy as np
+import os
+from cache_utils import cache_path, hash_strings
+from instrumentation import increment
+from similarity import normalize_rows
+from typing import Callable
+
+#embeddings already loaded in this process, keyed by index name
+loaded_indexes = {}
+#compact embeddings and principal components already loaded in this process, keyed by name of the compact index
+loaded_compact_indexes = {}
+
+def get_index_name(model_name: str, category: str, subcategory: str) -> str:
+    """
+    Purpose
+    -------
+    Build the file name (without extension) of the index of a model, category and subcategory.
+
+    Parameters
+    ----------
+    model_name : str
+        Name or path of the model used to encode the sentences.
+    category : str
+        Category of the expert sentences (either anamnese or spielsituation).
+    subcategory : str
+        Subcategory of the expert sentences (beobachtungen, herausforderungen, or ressourcen).
+
+    Returns
+    -------
+    index_name : str
+        Name of the index.
+    """
+    model_label = os.path.basename(os.path.normpath(model_name))
+    index_name = model_label + '_' + hash_strings([model_name])[:8] + '_' + category + '_' + subcategory
+    return index_name
+
+def load_expert_index(index_name: str) -> tuple[dict, np.ndarray]:
+    """
+    Purpose
+    -------
+    Load an index from disk. The embeddings are memory-mapped, not read into memory.
+
+    Parameters
+    ----------
+    index_name : str
+        Name of the index.
+
+    Returns
+    -------
+    metadata : dict
+        Dictionary containing the content hash and the hashes of the sentences of each row
+        (empty if the index does not exist).
+    embeddings : np.ndarray
+        Memory-mapped matrix of the embeddings (None if the index does not exist).
+    """
+    metadata_filename = cache_path('expert_index', index_name + '.json')
+    embeddings_filename = cache_path('expert_index', index_name + '.npy')
+    if not (os.path.exists(metadata_filename) and os.path.exists(embeddings_filename)):
+        return {}, None
+    with open(metadata_filename, 'r', encoding='utf-8') as infile:
+        metadata = json.load(infile)
+    embeddings = np.load(embeddings_filename, mmap_mode='r')
+    #an index whose files are out of sync is treated as missing
+    if embeddings.shape[0] != len(metadata.get('sentence_hashes', [])):
+        return {}, None
+    return metadata, embeddings
+
+def save_expert_index(index_name: str, metadata: dict, embeddings: np.ndarray):
+    """
+    Purpose
+    -------
+    Store an index to disk. Files are first written to a temporary name and then renamed,
+    so an interrupted run never leaves a corrupted index behind.
+
+    Parameters
+    ----------
+    index_name : str
+        Name of the index.
+    metadata : dict
+        Dictionary containing the content hash and the hashes of the sentences of each row.
+    embeddings : np.ndarray
+        Matrix of the embeddings.
+    """
+    metadata_filename = cache_path('expert_index', index_name + '.json')
+    embeddings_filename = cache_path('expert_index', index_name + '.npy')
+    with open(embeddings_filename + '.tmp', 'wb') as out:
+        np.save(out, np.ascontiguousarray(embeddings, dtype=np.float32))
+    os.replace(embeddings_filename + '.tmp', embeddings_filename)
+    with open(metadata_filename + '.tmp', 'w', encoding='utf-8') as out:
+        json.dump(metadata, out)
+    os.replace(metadata_filename + '.tmp', metadata_filename)
+
+def get_expert_embeddings(list_of_sentences: list, encode: Callable, model_name: str, category: str = None, subcategory: str = None, content_hash: str = None) -> np.ndarray:
+    """
+    Purpose
+    -------
+    Return the normalised embeddings of the expert sentences, encoding only the sentences that
+    are not yet in the index. If category or subcategory are missing, the embeddings are only
+    kept in memory for the current process.
+
+    Parameters
+    ----------
+    list_of_sentences : list
+        List containing the preprocessed expert sentences.
+    encode : Callable
+        Function mapping a list of sentences to a matrix of embeddings.
+    model_name : str
+        Name or path of the model used by encode.
+    category : str, optional
+        Category of the expert sentences (either anamnese or spielsituation).
+    subcategory : str, optional
+        Subcategory of the expert sentences (beobachtungen, herausforderungen, or ressourcen).
+    content_hash : str, optional
+        hash_strings of list_of_sentences, if the caller already computed it.
+
+    Returns
+    -------
+    embeddings : np.ndarray
+        Matrix whose i-th row is the normalised embedding of the i-th sentence of list_of_sentences.
+    """
+    persistent = category is not None and subcategory is not None
+    content_hash = content_hash or hash_strings(list_of_sentences)
+    if persistent:
+        index_name = get_index_name(model_name, category, subcategory)
+    else:
+        index_name = get_index_name(model_name, 'adhoc', content_hash)
+    #index already loaded in this process
+    if index_name in loaded_indexes and loaded_indexes[index_name][0] == content_hash:
+        return loaded_indexes[index_name][1]
+    metadata, old_embeddings = load_expert_index(index_name) if persistent else ({}, None)
+    #index on disk is up to date
+    if metadata.get('content_hash') == content_hash:
+        loaded_indexes[index_name] = (content_hash, old_embeddings)
+        return old_embeddings
+    #otherwise reuse the rows of unchanged sentences and encode the others
+    sentence_hashes = [hash_strings([sent]) for sent in list_of_sentences]
+    old_rows = {sentence_hash: row for row, sentence_hash in enumerate(metadata.get('sentence_hashes', []))}
+    new_rows = {}
+    for sent, sentence_hash in zip(list_of_sentences, sentence_hashes):
+        if sentence_hash not in old_rows and sent not in new_rows:
+            new_rows[sent] = len(new_rows)
+    sentences_to_encode = list(new_rows)
+    increment('embedding_index.reused_rows', sum(sentence_hash in old_rows for sentence_hash in sentence_hashes))
+    new_embeddings = normalize_rows(encode(sentences_to_encode)) if sentences_to_encode else None
+    dimension = new_embeddings.shape[1] if new_embeddings is not None else old_embeddings.shape[1]
+    embeddings = np.empty((len(list_of_sentences), dimension), dtype=np.float32)
+    for row, (sent, sentence_hash) in enumerate(zip(list_of_sentences, sentence_hashes)):
+        if sentence_hash in old_rows:
+            embeddings[row] = old_embeddings[old_rows[sentence_hash]]
+        else:
+            embeddings[row] = new_embeddings[new_rows[sent]]
+    if persistent:
+        metadata = {'model_name': model_name, 'category': category, 'subcategory': subcategory,
+                    'content_hash': content_hash, 'sentence_hashes': sentence_hashes}
+        save_expert_index(index_name, metadata, embeddings)
+        metadata, embeddings = load_expert_index(index_name)
+    loaded_indexes[index_name] = (content_hash, embeddings)
+    return embeddings
+
+def fit_principal_components(embeddings: np.ndarray, dimension: int, block_size: int = 65536) -> np.ndarray:
+    """
+    Purpose
+    -------
+    Find the directions that keep most of the (uncentred) energy of the embeddings, so that dot
+    products between normalised embeddings are approximated best. The second-moment matrix is
+    accumulated in blocks of rows, so memory does not grow with the number of embeddings.
+
+    Parameters
+    ----------
+    embeddings : np.ndarray
+        Matrix whose rows are normalised embeddings.
+    dimension : int
+        Number of components to keep.
+    block_size : int, optional
+        Number of rows processed at once (default: 65536).
+
+    Returns
+    -------
+    components : np.ndarray
+        Matrix of shape (dimension, embedding dimension) whose rows are the components.
+    """
+    second_moment = np.zeros((embeddings.shape[1], embeddings.shape[1]), dtype=np.float64)
+    for start in range(0, embeddings.shape[0], block_size):
+        block = np.asarray(embeddings[start:start + block_size], dtype=np.float64)
+        second_moment += block.T @ block
+    #eigenvalues are in increasing order
+    _, eigenvectors = np.linalg.eigh(second_moment)
+    components = np.ascontiguousarray(eigenvectors[:, ::-1][:, :dimension].T, dtype=np.float32)
+    return components
+
+def get_compact_expert_embeddings(list_of_sentences: list, encode: Callable, model_name: str, category: str = None, subcategory: str = None,
+                                  storage: str = 'float16', pca_dimension: int = None, block_size: int = 65536, content_hash: str = None) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Purpose
+    -------
+    Return a compact, read-only and memory-mapped copy of the expert embeddings (see
+    get_expert_embeddings), with the components needed to project the queries. Rows are
+    normalised again after the projection, so similarities remain cosine similarities.
+
+    Parameters
+    ----------
+    list_of_sentences : list
+        List containing the preprocessed expert sentences.
+    encode : Callable
+        Function mapping a list of sentences to a matrix of embeddings.
+    model_name : str
+        Name or path of the model used by encode.
+    category : str, optional
+        Category of the expert sentences (either anamnese or spielsituation).
+    subcategory : str, optional
+        Subcategory of the expert sentences (beobachtungen, herausforderungen, or ressourcen).
+    storage : str, optional
+        Type of the stored values: float16 or float32 (default: float16).
+    pca_dimension : int, optional
+        Number of principal components to keep (default: no projection).
+    block_size : int, optional
+        Number of rows projected at once (default: 65536).
+    content_hash : str, optional
+        hash_strings of list_of_sentences, if the caller already computed it.
+
+    Returns
+    -------
+    compact_embeddings : np.ndarray
+        Read-only memory-mapped matrix of the compact embeddings.
+    components : np.ndarray
+        Matrix projecting a query on the principal components (None without projection).
+    """
+    content_hash = content_hash or hash_strings(list_of_sentences)
+    embeddings = get_expert_embeddings(list_of_sentences, encode, model_name, category, subcategory, content_hash)
+    if category is not None and subcategory is not None:
+        index_name = get_index_name(model_name, category, subcategory)
+    else:
+        index_name = get_index_name(model_name, 'adhoc', content_hash)
+    pca_dimension = min(pca_dimension, embeddings.shape[1]) if pca_dimension else None
+    compact_name = index_name + '_' + storage + ('_pca%d' % pca_dimension if pca_dimension else '')
+    if compact_name in loaded_compact_indexes and loaded_compact_indexes[compact_name][0] == content_hash:
+        return loaded_compact_indexes[compact_name][1:]
+    metadata_filename = cache_path('expert_index', compact_name + '.json')
+    embeddings_filename = cache_path('expert_index', compact_name + '.npy')
+    components_filename = cache_path('expert_index', compact_name + '_components.npy')
+    metadata = {}
+    if os.path.exists(metadata_filename):
+        with open(metadata_filename, 'r', encoding='utf-8') as infile:
+            metadata = json.load(infile)
+    #the compact copy is rebuilt whenever the expert sentences change
+    if metadata.get('content_hash') != content_hash or not os.path.exists(embeddings_filename):
+        components = fit_principal_components(embeddings, pca_dimension, block_size) if pca_dimension else None
+        compact_embeddings = np.lib.format.open_memmap(embeddings_filename + '.tmp', mode='w+', dtype=storage,
+                                                       shape=(embeddings.shape[0], pca_dimension or embeddings.shape[1]))
+        for start in range(0, embeddings.shape[0], block_size):
+            block = np.asarray(embeddings[start:start + block_size], dtype=np.float32)
+            if components is not None:
+                block = normalize_rows(block @ components.T)
+            compact_embeddings[start:start + block_size] = block
+        compact_embeddings.flush()
+        del compact_embeddings
+        os.replace(embeddings_filename + '.tmp', embeddings_filename)
+        if components is not None:
+            with open(components_filename + '.tmp', 'wb') as out:
+                np.save(out, components)
+            os.replace(components_filename + '.tmp', components_filename)
+        with open(metadata_filename + '.tmp', 'w', encoding='utf-8') as out:
+            json.dump({'model_name': model_name, 'content_hash': content_hash, 'storage': storage, 'pca_dimension': pca_dimension}, out)
+        os.replace(metadata_filename + '.tmp', metadata_filename)
+    compact_embeddings = np.load(embeddings_filename, mmap_mode='r')
+    components = np.load(components_filename) if pca_dimension else None
+    loaded_compact_indexes[compact_name] = (content_hash, compact_embeddings, components)
+    return compact_embeddings, components
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 19:12:27 2026
+
+@author: micaelavieira
+"""
+
+"""
+Compiled corpus of the preprocessed expert statements.
+
+All expert files (experts/<category>_<subcategory>.tsv) are preprocessed once and stored in a
+single json artifact in cache/expert_corpus, one per list of abbreviations, substitution name
+and version of the spelling tools. Every entry keeps the hash of its source file, so an entry
+is rebuilt automatically as soon as the corresponding file changes.
+
+Usage:
+    python expert_corpus.py [-a ABBREVIATIONS] [-p PATIENT] [--rebuild] [--vocabulary_first [-j WORKERS]]
+"""
+
+import argparse
+from cache_utils import cache_path, hash_file, hash_strings
+import json
+import os
+from preprocessing import corpus_preprocessing, get_expert_filename, get_spelling_version, read_expert_file, sentence_preprocessing
+
+CATEGORIES = ['anamnese', 'spielsituation']
+SUBCATEGORIES = ['beobachtungen', 'herausforderungen', 'ressourcen']
+
+def get_corpus_filename(abbreviation_list: list, substitution_name: str) -> str:
+    """
+    Purpose
+    -------
+    Return the name of the artifact for a list of abbreviations, a substitution name and the
+    versions of the spelling tools (so that the statements are corrected again when they change).
+
+    Parameters
+    ----------
+    abbreviation_list : list
+        List of abbreviations to keep unchanged during preprocessing.
+    substitution_name : str
+        Name to use to substitute the initial character of the real name of the patient.
+
+    Returns
+    -------
+    filename : str
+        Name of the artifact.
+    """
+    corpus_hash = hash_strings([get_spelling_version(), substitution_name] + sorted(abbreviation_list))
+    filename = cache_path('expert_corpus', corpus_hash + '.json')
+    return filename
+
+def compile_expert_file(category: str, subcategory: str, abbreviation_list: list, substitution_name: str, expert_sentences: list = None) -> dict:
+    """
+    Purpose
+    -------
+    Read and preprocess one expert file.
+
+    Parameters
+    ----------
+    category : str
+        Category of the file (either anamnese or spielsituation).
+    subcategory : str
+        Subcategory of the file (beobachtungen, herausforderungen, or ressourcen).
+    abbreviation_list : list
+        List of abbreviations to keep unchanged during preprocessing.
+    substitution_name : str
+        Name to use to substitute the initial character of the real name of the patient.
+    expert_sentences : list, optional
+        Statements already preprocessed (default: preprocess them with sentence_preprocessing).
+
+    Returns
+    -------
+    entry : dict
+        Dictionary containing the hash of the file, the preprocessed statements, their categories
+        and the IDs of the experts.
+    """
+    filename = get_expert_filename(category, subcategory)
+    source_hash = hash_file(filename)
+    expert_data = read_expert_file(category, subcategory)
+    if expert_sentences is None:
+        expert_sentences = [sentence_preprocessing(sent, subcategory, abbreviation_list, substitution_name) for sent in expert_data['statement'].tolist()]
+    entry = {'source_hash': source_hash,
+             'sentences': expert_sentences,
+             'categories': [i.strip() for i in expert_data['category_main'].tolist()],
+             'expert_ids': [str(i) for i in expert_data['expert_ID'].tolist()]}
+    return entry
+
+def build_expert_corpus(abbreviation_list: list, substitution_name: str, rebuild: bool = False, vocabulary_first: bool = False, workers: int = None) -> dict:
+    """
+    Purpose
+    -------
+    Load the artifact and recompile the entries whose source file changed (or all entries if
+    rebuild is True). The artifact is written to disk only if an entry was recompiled.
+
+    Parameters
+    ----------
+    abbreviation_list : list
+        List of abbreviations to keep unchanged during preprocessing.
+    substitution_name : str
+        Name to use to substitute the initial character of the real name of the patient.
+    rebuild : bool, optional
+        Whether to recompile all entries (default: False).
+    vocabulary_first : bool, optional
+        Whether to preprocess the statements of all recompiled files at once with
+        preprocessing.corpus_preprocessing (default: False).
+    workers : int, optional
+        Number of correction processes of corpus_preprocessing (default: number of cores).
+
+    Returns
+    -------
+    corpus : dict
+        Dictionary mapping category_subcategory to the entry of the corresponding file
+        (see compile_expert_file).
+    """
+    corpus_filename = get_corpus_filename(abbreviation_list, substitution_name)
+    corpus = {}
+    if os.path.exists(corpus_filename) and not rebuild:
+        with open(corpus_filename, 'r', encoding='utf-8') as infile:
+            corpus = json.load(infile)
+    stale_files = []
+    for category in CATEGORIES:
+        for subcategory in SUBCATEGORIES:
+            key = category + '_' + subcategory
+            filename = get_expert_filename(category, subcategory)
+            if not os.path.exists(filename):
+                continue
+            if key not in corpus or corpus[key]['source_hash'] != hash_file(filename):
+                stale_files.append((category, subcategory))
+    preprocessed_statements = {}
+    if vocabulary_first and stale_files:
+        statements = {(category, subcategory): read_expert_file(category, subcategory)['statement'].tolist() for category, subcategory in stale_files}
+        preprocessed_sentences = corpus_preprocessing([(sent, subcategory) for (_, subcategory), sentences in statements.items() for sent in sentences],
+                                                      abbreviation_list, substitution_name, workers)
+        start = 0
+        for key, sentences in statements.items():
+            preprocessed_statements[key] = preprocessed_sentences[start:start + len(sentences)]
+            start += len(sentences)
+    for category, subcategory in stale_files:
+        corpus[category + '_' + subcategory] = compile_expert_file(category, subcategory, abbreviation_list, substitution_name, preprocessed_statements.get((category, subcategory)))
+    if stale_files:
+        with open(corpus_filename + '.tmp', 'w', encoding='utf-8') as out:
+            json.dump(corpus, out, ensure_ascii=False)
+        os.replace(corpus_filename + '.tmp', corpus_filename)
+    return corpus
+
+def load_expert_statements_and_categories(category: str, subcategory: str, abbreviation_list: list, substitution_name: str) -> tuple[list, list]:
+    """
+    Purpose
+    -------
+    Same as preprocessing.get_expert_statements_and_categories, but read from the compiled artifact.
+
+    Parameters
+    ----------
+    category : str
+        Category we are interested in (either anamnese or spielsituation).
+    subcategory : str
+        Subcategory we are interested in (beobachtungen, herausforderungen, or ressourcen).
+    abbreviation_list : list
+        List of abbreviations to keep unchanged during preprocessing.
+    substitution_name : str
+        Name to use to substitute the initial character of the real name of the patient.
+
+    Returns
+    -------
+    expert_sentences : list
+        List containing the preprocessed experts statements.
+    expert_categories : list
+        List containing the categories of the extracted sentences.
+    """
+    corpus = build_expert_corpus(abbreviation_list, substitution_name)
+    entry = corpus[category + '_' + subcategory]
+    expert_sentences, expert_categories = entry['sentences'], entry['categories']
+    return expert_sentences, expert_categories
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compile the preprocessed expert statements into a single artifact.')
+    parser.add_argument('-a', '--abbreviations', default='["d.h.", "s.a.", "u.a.", "z.B."]', help='List of abbreviations not to preprocess (default: ["d.h.", "s.a.", "u.a.", "z.B."])')
+    parser.add_argument('-p', '--patient', default='Andreas', help='Patient name (default: Andreas)')
+    parser.add_argument('--rebuild', action='store_true', help='Recompile all expert files, even if they did not change')
+    parser.add_argument('--vocabulary_first', action='store_true', help='Preprocess all expert files at once, correcting every distinct token only once')
+    parser.add_argument('-j', '--workers', type=int, help='Number of correction processes used with argument --vocabulary_first (default: number of cores)')
+    args = vars(parser.parse_args())
+    abbreviations = args['abbreviations'].replace('"', '').replace('[', '').replace(']', '').split(', ')
+    corpus = build_expert_corpus(abbreviations, args['patient'], args['rebuild'], args['vocabulary_first'], args['workers'])
+    for key, entry in corpus.items():
+        print(key, '\t', len(entry['sentences']), 'statements')
+    print('Stored in', get_corpus_filename(abbreviations, args['patient']))
@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 18:03:44 2026
+
+@author: micaelavieira
+"""
+
+"""
+Compact binary store of the GloVe word vectors used by infersent.
+
+The text file glove.840B.300d.txt is converted once into a .npy matrix (float32 or float16),
+loaded memory-mapped, and a SQLite table mapping every word to its row. When building the
+vocabulary, only the rows of the words actually needed are read from disk.
+
+Usage:
+    python glove_store.py convert [--float16]
+    python glove_store.py report
+"""
+
+import argparse
+import glob
+from instrumentation import peak_memory_mb
+import json
+import numpy as np
+import os
+import sqlite3
+import string
+import subprocess
+import sys
+import time
+
+#default location of the GloVe vectors and of their binary version
+GLOVE_TEXT_PATH = 'infersent_data/glove.840B.300d.txt'
+GLOVE_PREFIX = 'infersent_data/glove.840B.300d'
+DIMENSION = 300
+
+#stores already opened in this process, keyed by prefix
+opened_stores = {}
+
+def convert_glove(text_filename: str = GLOVE_TEXT_PATH, prefix: str = GLOVE_PREFIX, dtype: str = 'float32', dimension: int = DIMENSION):
+    """
+    Purpose
+    -------
+    Convert the GloVe text file into prefix.npy (matrix of the vectors) and prefix.sqlite
+    (table mapping every word to its row in the matrix). Malformed lines are skipped and a
+    repeated word overwrites the row of its first occurrence, so the matrix has exactly one row
+    per word.
+
+    Parameters
+    ----------
+    text_filename : str, optional
+        Name of the GloVe text file (default: GLOVE_TEXT_PATH).
+    prefix : str, optional
+        Prefix of the output files (default: GLOVE_PREFIX).
+    dtype : str, optional
+        Type of the stored vectors, float32 or float16 (default: float32).
+    dimension : int, optional
+        Dimension of the vectors (default: DIMENSION).
+    """
+    #first pass: count the vectors, to allocate the matrix on disk
+    with open(text_filename, 'rb') as infile:
+        number_of_lines = sum(1 for _ in infile)
+    matrix = np.lib.format.open_memmap(prefix + '.npy.tmp', mode='w+', dtype=dtype, shape=(number_of_lines, dimension))
+    if os.path.exists(prefix + '.sqlite.tmp'):
+        os.remove(prefix + '.sqlite.tmp')
+    connection = sqlite3.connect(prefix + '.sqlite.tmp')
+    connection.execute('CREATE TABLE words (word TEXT PRIMARY KEY, row INTEGER)')
+    #second pass: fill the matrix and the word index
+    rows_of_words = {}
+    words_and_rows = []
+    with open(text_filename, 'r', encoding='utf-8') as infile:
+        for line in infile:
+            splitted_line = line.rstrip('\n').rstrip(' ').split(' ')
+            if len(splitted_line) <= dimension:
+                continue
+            #a few GloVe words contain spaces, so the vector is taken from the end of the line
+            word = ' '.join(splitted_line[:-dimension])
+            #like InferSent, the last vector of a repeated word wins
+            if word in rows_of_words:
+                matrix[rows_of_words[word]] = np.array(splitted_line[-dimension:], dtype=np.float32)
+                continue
+            row = rows_of_words[word] = len(rows_of_words)
+            matrix[row] = np.array(splitted_line[-dimension:], dtype=np.float32)
+            words_and_rows.append((word, row))
+            if len(words_and_rows) == 100000:
+                connection.executemany('INSERT INTO words VALUES (?, ?)', words_and_rows)
+                words_and_rows = []
+    connection.executemany('INSERT INTO words VALUES (?, ?)', words_and_rows)
+    connection.commit()
+    connection.close()
+    matrix.flush()
+    number_of_rows = len(rows_of_words)
+    if number_of_rows < number_of_lines:
+        #skipped and repeated lines left unused rows at the end: copy the used ones to a matrix of the right shape
+        trimmed_matrix = np.lib.format.open_memmap(prefix + '.npy.trimmed', mode='w+', dtype=dtype, shape=(number_of_rows, dimension))
+        for start in range(0, number_of_rows, 100000):
+            end = min(start + 100000, number_of_rows)
+            trimmed_matrix[start:end] = matrix[start:end]
+        trimmed_matrix.flush()
+        del trimmed_matrix
+        del matrix
+        os.replace(prefix + '.npy.trimmed', prefix + '.npy.tmp')
+    else:
+        del matrix
+    os.replace(prefix + '.npy.tmp', prefix + '.npy')
+    os.replace(prefix + '.sqlite.tmp', prefix + '.sqlite')
+
+def store_exists(prefix: str = GLOVE_PREFIX) -> bool:
+    """
+    Purpose
+    -------
+    Check whether the binary store has been created.
+
+    Parameters
+    ----------
+    prefix : str, optional
+        Prefix of the binary store (default: GLOVE_PREFIX).
+
+    Returns
+    -------
+    bool
+        True if both files of the store exist.
+    """
+    return os.path.exists(prefix + '.npy') and os.path.exists(prefix + '.sqlite')
+
+def get_word_vectors(word_dict: dict, prefix: str = GLOVE_PREFIX) -> dict:
+    """
+    Purpose
+    -------
+    Read from the binary store the vectors of the words in word_dict. It can replace
+    InferSent.get_w2v, which scans the whole text file instead.
+
+    Parameters
+    ----------
+    word_dict : dict
+        Dictionary (or any iterable) of the words whose vectors are needed.
+    prefix : str, optional
+        Prefix of the binary store (default: GLOVE_PREFIX).
+
+    Returns
+    -------
+    word_vec : dict
+        Dictionary mapping each word found in the store to its vector (as float32).
+    """
+    if prefix not in opened_stores:
+        opened_stores[prefix] = (np.load(prefix + '.npy', mmap_mode='r'), sqlite3.connect(prefix + '.sqlite', check_same_thread=False))
+    matrix, connection = opened_stores[prefix]
+    words = list(word_dict)
+    words_and_rows = []
+    #sqlite limits the number of parameters of a query
+    for start in range(0, len(words), 500):
+        chunk = words[start:start + 500]
+        query = 'SELECT word, row FROM words WHERE word IN (' + ', '.join('?' * len(chunk)) + ')'
+        words_and_rows.extend(connection.execute(query, chunk).fetchall())
+    #reading the rows in order keeps the disk access sequential
+    words_and_rows.sort(key=lambda word_and_row: word_and_row[1])
+    word_vec = {word: np.asarray(matrix[row], dtype=np.float32) for word, row in words_and_rows}
+    return word_vec
+
+def get_word_vectors_from_text(word_dict: dict, text_filename: str = GLOVE_TEXT_PATH) -> dict:
+    """
+    Purpose
+    -------
+    Read the vectors of the words in word_dict by scanning the text file, as InferSent.get_w2v does.
+
+    Parameters
+    ----------
+    word_dict : dict
+        Dictionary (or any iterable) of the words whose vectors are needed.
+    text_filename : str, optional
+        Name of the GloVe text file (default: GLOVE_TEXT_PATH).
+
+    Returns
+    -------
+    word_vec : dict
+        Dictionary mapping each word found in the file to its vector.
+    """
+    word_vec = {}
+    with open(text_filename, 'r', encoding='utf-8') as infile:
+        for line in infile:
+            word, vec = line.split(' ', 1)
+            if word in word_dict:
+                word_vec[word] = np.array(vec.split(), dtype=np.float32)
+    return word_vec
+
+def get_corpus_words() -> set:
+    """
+    Purpose
+    -------
+    Collect the words of the expert and student files, as a realistic vocabulary for the report.
+
+    Returns
+    -------
+    words : set
+        Set containing the words.
+    """
+    words = {'<s>', '</s>'}
+    for filename in glob.glob('experts/*.tsv') + glob.glob('students/*.tsv'):
+        with open(filename, 'r', encoding='utf-8') as infile:
+            for token in infile.read().split():
+                words.add(token.strip(string.punctuation))
+    return words
+
+def measure(method: str) -> dict:
+    """
+    Purpose
+    -------
+    Load the vectors of the corpus words with one method and measure time and peak memory.
+
+    Parameters
+    ----------
+    method : str
+        Either text (scan of the text file) or binary (memory-mapped store).
+
+    Returns
+    -------
+    measurements : dict
+        Dictionary containing the loading time in seconds, the peak resident memory in MB and
+        the number of words found.
+    """
+    words = get_corpus_words()
+    start = time.perf_counter()
+    if method == 'text':
+        word_vec = get_word_vectors_from_text(words)
+    else:
+        word_vec = get_word_vectors(words)
+    elapsed_time = time.perf_counter() - start
+    peak_memory = peak_memory_mb()
+    measurements = {'method': method, 'seconds': round(elapsed_time, 3), 'peak_rss_mb': round(peak_memory, 1), 'words_found': len(word_vec)}
+    return measurements
+
+def report():
+    """
+    Purpose
+    -------
+    Print loading time and peak memory of the text file and of the binary store. Each method runs
+    in its own process, so the memory of one does not affect the other.
+    """
+    print ("{:^15s} {:^15s} {:^15s} {:^15s}".format('METHOD', 'SECONDS', 'PEAK RSS (MB)', 'WORDS FOUND'))
+    for method in ['text', 'binary']:
+        if (method == 'text' and not os.path.exists(GLOVE_TEXT_PATH)) or (method == 'binary' and not store_exists()):
+            print ("{:^15s} {:^15s}".format(method, 'not available'))
+            continue
+        output = subprocess.run([sys.executable, __file__, 'measure', method], capture_output=True, text=True, check=True).stdout
+        measurements = json.loads(output)
+        print ("{:^15s} {:^15s} {:^15s} {:^15s}".format(method, str(measurements['seconds']), str(measurements['peak_rss_mb']), str(measurements['words_found'])))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Binary store of the GloVe vectors used by infersent.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    convert_parser = subparsers.add_parser('convert', help='Convert the GloVe text file to the binary store')
+    convert_parser.add_argument('--glove', default=GLOVE_TEXT_PATH, help='GloVe text file (default: ' + GLOVE_TEXT_PATH + ')')
+    convert_parser.add_argument('--prefix', default=GLOVE_PREFIX, help='Prefix of the binary store (default: ' + GLOVE_PREFIX + ')')
+    convert_parser.add_argument('--float16', action='store_true', help='Store the vectors as float16 (half the size)')
+    subparsers.add_parser('report', help='Compare loading time and memory of the text file and of the binary store')
+    measure_parser = subparsers.add_parser('measure')
+    measure_parser.add_argument('method', choices=['text', 'binary'])
+    args = vars(parser.parse_args())
+    if args['command'] == 'convert':
+        convert_glove(args['glove'], args['prefix'], 'float16' if args['float16'] else 'float32')
+    elif args['command'] == 'report':
+        report()
+    elif args['command'] == 'measure':
+        print(json.dumps(measure(args['method'])))
@@ -6,21 +6,164 @@ Created on Fri Nov 26 13:52:19 2021
 @author: micaelavieira
 """
 
-from deep_translator import GoogleTranslator
-from infersent_data.models import InferSent
-from sklearn.metrics.pairwise import cosine_similarity
-import torch
+from cache_utils import hash_strings
+from glove_store import get_word_vectors, GLOVE_PREFIX, store_exists
+from instrumentation import increment, observe, timed, timer
+from similarity import best_matches, cosine_similarities, normalize_rows
+import threading
+from translation import get_translator, Translator
 from typing import Tuple
 
-#load model and word embeddings
+#model and word embeddings
 V = 2
 MODEL_PATH = 'infersent_data/infersent%s.pkl' % V
 params_model = {'bsize': 64, 'word_emb_dim': 300, 'enc_lstm_dim': 2048,
                 'pool_type': 'max', 'dpout_model': 0.0, 'version': V}
-infersent = InferSent(params_model)
-infersent.load_state_dict(torch.load(MODEL_PATH))
 W2V_PATH = 'infersent_data/glove.840B.300d.txt'
-infersent.set_w2v_path(W2V_PATH)
+
+#the model is loaded on first use (see load_model)
+infersent = None
+model_lock = threading.Lock()
+
+def load_model():
+    """
+    Purpose
+    -------
+    Load the infersent model and set the path of its word embeddings, only the first time the
+    function is called.
+
+    Returns
+    -------
+    infersent : InferSent
+        Loaded model.
+    """
+    global infersent
+    with model_lock:
+        if infersent is None:
+            with timer('infersent.load_model'):
+                from infersent_data.models import InferSent
+                import torch
+                model = InferSent(params_model)
+                model.load_state_dict(torch.load(MODEL_PATH))
+                model.set_w2v_path(W2V_PATH)
+                #read only the vectors of the vocabulary from the binary store, if it was created with glove_store.py
+                if store_exists(GLOVE_PREFIX):
+                    model.get_w2v = lambda word_dict: get_word_vectors(word_dict, GLOVE_PREFIX)
+                infersent = model
+    return infersent
+
+#translator to english (see translation.py), set with set_translator
+translator = None
+#translated sentences whose words are already in the vocabulary of the model
+vocabulary_sentences = set()
+#normalised embeddings of the translated expert sentences, keyed by hash of the sentences
+expert_embeddings = {}
+
+def set_translator(new_translator: Translator):
+    """
+    Purpose
+    -------
+    Set the translator used to bring the sentences to English.
+
+    Parameters
+    ----------
+    new_translator : Translator
+        Translator to use.
+    """
+    global translator
+    translator = new_translator
+
+def translate(list_of_sentences: list) -> list:
+    """
+    Purpose
+    -------
+    Translate a list of sentences to English, by default with the cached Google translator.
+
+    Parameters
+    ----------
+    list_of_sentences : list
+        List containing the sentences to translate.
+
+    Returns
+    -------
+    translated_sentences : list
+        List containing the translated sentences.
+    """
+    if translator is None:
+        set_translator(get_translator('google'))
+    with timer('infersent.translate'):
+        translated_sentences = translator.translate(list_of_sentences)
+    return translated_sentences
+
+@timed('infersent.vocabulary')
+def update_vocabulary(translated_sentences: list):
+    """
+    Purpose
+    -------
+    Add the words of the sentences to the vocabulary of the model. The vocabulary is built the
+    first time and only extended with the words of new sentences afterwards.
+
+    Parameters
+    ----------
+    translated_sentences : list
+        List containing the translated sentences.
+    """
+    new_sentences = [sent for sent in dict.fromkeys(translated_sentences) if sent not in vocabulary_sentences]
+    if not new_sentences:
+        return
+    if not vocabulary_sentences:
+        load_model().build_vocab(new_sentences, tokenize=True)
+    else:
+        load_model().update_vocab(new_sentences, tokenize=True)
+    vocabulary_sentences.update(new_sentences)
+
+def infersent_score_batch(list_of_single_sentences: list, list_of_sentences: list, list_of_categories: list, top_k: int = 1) -> list:
+    """
+    Purpose
+    -------
+    Find the most similar sentences to each target sentence with the infersent method.
+    Translations are cached, expert sentences are encoded only once and all target sentences
+    are encoded in one batch and compared with one matrix product.
+
+    Parameters
+    ----------
+    list_of_single_sentences : list
+        List containing the target sentences.
+    list_of_sentences : list
+        List containing sentences as strings among which to find the most similar to each target sentence.
+    list_of_categories : list
+        List containing categories of the sentences in list_of_sentences.
+    top_k : int, optional
+        Number of most similar sentences to return for each target sentence (default: 1).
+
+    Returns
+    -------
+    matches : list
+        List containing, for each target sentence, a list of top_k tuples
+        (score_most_similar_sentence, most_similar_sentence, most_similar_sentence_category).
+    """
+    if not list_of_single_sentences:
+        return []
+    #translate sentences to english
+    translated_sentences = translate(list_of_sentences)
+    translated_single_sentences = translate(list_of_single_sentences)
+    #build the vocabulary once over expert and student sentences together
+    update_vocabulary(translated_sentences + translated_single_sentences)
+    #encode the expert sentences in a single batch, only once
+    translated_sentences_hash = hash_strings(translated_sentences)
+    if translated_sentences_hash not in expert_embeddings:
+        increment('infersent.sentences_encoded', len(translated_sentences))
+        with timer('infersent.encode_experts'):
+            expert_embeddings[translated_sentences_hash] = normalize_rows(load_model().encode(translated_sentences, tokenize=True))
+    vectorised_sentences = expert_embeddings[translated_sentences_hash]
+    increment('infersent.sentences_encoded', len(translated_single_sentences))
+    observe('infersent.batch_size', len(translated_single_sentences))
+    with timer('infersent.encode'):
+        vectorised_single_sentences = load_model().encode(translated_single_sentences, tokenize=True)
+    with timer('infersent.similarity'):
+        similarities = cosine_similarities(vectorised_single_sentences, vectorised_sentences, normalized=True)
+        matches = best_matches(similarities, list_of_sentences, list_of_categories, top_k)
+    return matches
 
 def infersent_score(single_sentence: str, list_of_sentences: list, list_of_categories: list) -> Tuple[float, str, str]:
     """
@@ -46,21 +189,5 @@ def infersent_score(single_sentence: str, list_of_sentences: list, list_of_categ
     most_similar_sentence_category : str
         Category of the most_similar_sentence.
     """
-    #translate sentences to english
-    translated_sentences = [GoogleTranslator(source='auto', target='en').translate(sent) for sent in list_of_sentences]
-    infersent.build_vocab(list_of_sentences, tokenize=True)
-    vectorised_single_sentence = infersent.encode(GoogleTranslator(source='auto', target='en').translate(single_sentence))[0]
-    score_most_similar_sentence = 0
-    best_index = 0
-    sentence_index = 0
-    for sentence in translated_sentences:
-        vectorised_sentence = infersent.encode([sentence])[0]
-        similarity = cosine_similarity([vectorised_single_sentence], [vectorised_sentence])[0][0]
-        if similarity > score_most_similar_sentence:
-            score_most_similar_sentence = similarity
-            best_index = sentence_index
-        sentence_index += 1
-    score_most_similar_sentence = round(score_most_similar_sentence, 2)
-    most_similar_sentence = list_of_sentences[best_index]
-    most_similar_sentence_category = list_of_categories[best_index]
-    return score_most_similar_sentence, most_similar_sentence, most_similar_sentence_category
\ No newline at end of file
+    score_most_similar_sentence, most_similar_sentence, most_similar_sentence_category = infersent_score_batch([single_sentence], list_of_sentences, list_of_categories)[0][0]
+    return score_most_similar_sentence, most_similar_sentence, most_similar_sentence_category
@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Tue Oct 20 15:47:05 2026
+
+@author: micaelavieira
+"""
+
+"""
+Counters, timers and distributions (e.g. of batch sizes) recorded by preprocessing, the
+algorithms and the main script.
+
+Instrumentation is disabled by default: until enable is called, every function returns
+immediately (timer returns a shared object that does nothing), so the cost is one function call.
+The recorded values can be printed (print_profile) or exported as json or in the Prometheus
+text format (write_metrics). peak_memory_mb reports the peak resident memory of the process,
+whether instrumentation is enabled or not.
+"""
+
+import functools
+import json
+import re
+import sys
+import threading
+import time
+from typing import Callable
+
+enabled = False
+#counters: name -> value
+counters = {}
+#timers: name -> [number of calls, total seconds]
+timers = {}
+#distributions: name -> [number of observations, sum, minimum, maximum]
+distributions = {}
+#backends may be loaded in a background thread (see backends.warm_up)
+instrumentation_lock = threading.Lock()
+
+def enable():
+    """
+    Purpose
+    -------
+    Start recording counters, timers and distributions.
+    """
+    global enabled
+    enabled = True
+
+def reset():
+    """
+    Purpose
+    -------
+    Forget all the recorded values.
+    """
+    with instrumentation_lock:
+        counters.clear()
+        timers.clear()
+        distributions.clear()
+
+def increment(name: str, value: int = 1):
+    """
+    Purpose
+    -------
+    Add a value to a counter.
+
+    Parameters
+    ----------
+    name : str
+        Name of the counter (e.g. preprocessing.tokens).
+    value : int, optional
+        Value to add (default: 1).
+    """
+    if not enabled:
+        return
+    with instrumentation_lock:
+        counters[name] = counters.get(name, 0) + value
+
+def observe(name: str, value: float):
+    """
+    Purpose
+    -------
+    Add an observation (e.g. the size of a batch) to a distribution.
+
+    Parameters
+    ----------
+    name : str
+        Name of the distribution (e.g. sentencebert.batch_size).
+    value : float
+        Observed value.
+    """
+    if not enabled:
+        return
+    with instrumentation_lock:
+        if name in distributions:
+            distribution = distributions[name]
+            distribution[0] += 1
+            distribution[1] += value
+            distribution[2] = min(distribution[2], value)
+            distribution[3] = max(distribution[3], value)
+        else:
+            distributions[name] = [1, value, value, value]
+
+class Timer:
+    """
+    Context manager adding the wall time of a block to a timer.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exception):
+        elapsed_time = time.perf_counter() - self.start
+        with instrumentation_lock:
+            timer_values = timers.setdefault(self.name, [0, 0.0])
+            timer_values[0] += 1
+            timer_values[1] += elapsed_time
+        return False
+
+class NullTimer:
+    """
+    Context manager doing nothing, used when instrumentation is disabled.
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        return False
+
+NULL_TIMER = NullTimer()
+
+def timer(name: str):
+    """
+    Purpose
+    -------
+    Return a context manager measuring the wall time of a block.
+
+    Parameters
+    ----------
+    name : str
+        Name of the timer (e.g. main.scoring).
+
+    Returns
+    -------
+    Timer or NullTimer
+        Context manager.
+    """
+    return Timer(name) if enabled else NULL_TIMER
+
+def timed(name: str) -> Callable:
+    """
+    Purpose
+    -------
+    Decorator measuring the wall time of every call of a function.
+
+    Parameters
+    ----------
+    name : str
+        Name of the timer.
+
+    Returns
+    -------
+    Callable
+        Decorator.
+    """
+    def decorator(function: Callable) -> Callable:
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return function(*args, **kwargs)
+            with Timer(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def get_profile() -> dict:
+    """
+    Purpose
+    -------
+    Return a copy of the recorded values.
+
+    Returns
+    -------
+    profile : dict
+        Dictionary with counters, timers (calls and seconds) and distributions (count, sum,
+        mean, min and max), sorted by name.
+    """
+    with instrumentation_lock:
+        profile = {'counters': dict(sorted(counters.items())),
+                   'timers': {name: {'calls': calls, 'seconds': round(seconds, 6)} for name, (calls, seconds) in sorted(timers.items())},
+                   'distributions': {name: {'count': count, 'sum': total, 'mean': round(total / count, 3), 'min': minimum, 'max': maximum}
+                                     for name, (count, total, minimum, maximum) in sorted(distributions.items())}}
+    return profile
+
+def print_profile():
+    """
+    Purpose
+    -------
+    Print the recorded values as tables, in the format of the final report.
+    """
+    profile = get_profile()
+    print('PROFILE')
+    print ("{:^40s} {:^20s} {:^20s}".format('TIMER', 'CALLS', 'SECONDS'))
+    for name, values in profile['timers'].items():
+        print ("{:<40s} {:^20s} {:^20s}".format(name, str(values['calls']), str(round(values['seconds'], 3))))
+    print ("{:^40s} {:^20s}".format('COUNTER', 'VALUE'))
+    for name, value in profile['counters'].items():
+        print ("{:<40s} {:^20s}".format(name, str(value)))
+    if profile['distributions']:
+        print ("{:^40s} {:^20s} {:^20s} {:^20s}".format('DISTRIBUTION', 'COUNT', 'MEAN', 'MAX'))
+        for name, values in profile['distributions'].items():
+            print ("{:<40s} {:^20s} {:^20s} {:^20s}".format(name, str(values['count']), str(values['mean']), str(values['max'])))
+    print('***************************************************************************************')
+
+def get_prometheus_text(prefix: str = 'psychomotor') -> str:
+    """
+    Purpose
+    -------
+    Format the recorded values in the Prometheus text exposition format.
+
+    Parameters
+    ----------
+    prefix : str, optional
+        Prefix of the names of the metrics (default: psychomotor).
+
+    Returns
+    -------
+    text : str
+        Metrics, one per line.
+    """
+    def metric_name(name):
+        return prefix + '_' + re.sub('[^a-zA-Z0-9_]', '_', name)
+    profile = get_profile()
+    lines = []
+    for name, value in profile['counters'].items():
+        lines += ['# TYPE %s_total counter' % metric_name(name), '%s_total %s' % (metric_name(name), value)]
+    for name, values in profile['timers'].items():
+        lines += ['# TYPE %s_seconds summary' % metric_name(name),
+                  '%s_seconds_count %s' % (metric_name(name), values['calls']),
+                  '%s_seconds_sum %s' % (metric_name(name), values['seconds'])]
+    for name, values in profile['distributions'].items():
+        lines += ['# TYPE %s summary' % metric_name(name),
+                  '%s_count %s' % (metric_name(name), values['count']),
+                  '%s_sum %s' % (metric_name(name), values['sum'])]
+    text = '\n'.join(lines) + '\n'
+    return text
+
+def write_metrics(filename: str):
+    """
+    Purpose
+    -------
+    Write the recorded values to a file: json if the name ends with .json, otherwise the
+    Prometheus text format.
+
+    Parameters
+    ----------
+    filename : str
+        Name of the file.
+    """
+    with open(filename, 'w') as out:
+        if filename.endswith('.json'):
+            json.dump(get_profile(), out, indent=2)
+        else:
+            out.write(get_prometheus_text())
+
+def peak_memory_mb() -> float:
+    """
+    Purpose
+    -------
+    Return the peak resident memory of the process so far, in MB (0.0 if it cannot be measured).
+
+    Returns
+    -------
+    float
+        Peak resident memory.
+    """
+    #resource only exists on POSIX systems; elsewhere psutil gives the peak working set, if installed
+    try:
+        import resource
+    except ImportError:
+        try:
+            import psutil
+        except ImportError:
+            return 0.0
+        memory_info = psutil.Process().memory_info()
+        return getattr(memory_info, 'peak_wset', memory_info.rss) / (1024 * 1024)
+    #ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 * 1024 if sys.platform == 'darwin' else 1024)
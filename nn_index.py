@@ -0,0 +1,379 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 16:40:03 2026
+
+@author: micaelavieira
+"""
+
+"""
+Nearest-neighbour indexes over normalised expert embeddings.
+
+ExactIndex scans all embeddings with blocked matrix products. IVFIndex clusters the embeddings
+with spherical k-means and only scans the nprobe clusters closest to each query: larger nprobe
+gives higher recall and higher latency. Both indexes can restrict a search to the rows with a
+given label (e.g. category_subcategory), so that expert banks pooled across cases can be queried
+per category; when the probed clusters hold fewer than k rows with the label, IVFIndex scans
+all rows with the label exactly.
+
+Usage (recall-vs-latency report on synthetic data or on a stored expert index):
+    python nn_index.py [--rows ROWS] [--dimension DIMENSION] [--index_file FILE.npy] [--nprobe 1 2 4 8 ...]
+"""
+
+import argparse
+import numpy as np
+from similarity import normalize_rows
+import time
+
+def merge_top_k(scores: np.ndarray, indices: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Purpose
+    -------
+    Keep, for every row, the k highest scores; ties are broken in favour of the lowest index.
+
+    Parameters
+    ----------
+    scores : np.ndarray
+        Matrix of candidate scores, one row per query.
+    indices : np.ndarray
+        Matrix of the indices of the candidates (same shape as scores).
+    k : int
+        Number of results to keep.
+
+    Returns
+    -------
+    top_scores : np.ndarray
+        Matrix of shape (number of queries, k) with the highest scores, in decreasing order.
+    top_indices : np.ndarray
+        Matrix of shape (number of queries, k) with the corresponding indices.
+    """
+    k = min(k, scores.shape[1])
+    if k == 1:
+        #argmax returns the first maximum, i.e. the lowest index when candidates are in increasing order
+        best = np.argmax(scores, axis=1)[:, np.newaxis]
+        return np.take_along_axis(scores, best, axis=1), np.take_along_axis(indices, best, axis=1)
+    if scores.shape[1] > k:
+        partition = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        scores = np.take_along_axis(scores, partition, axis=1)
+        indices = np.take_along_axis(indices, partition, axis=1)
+    top_scores = np.empty_like(scores)
+    top_indices = np.empty_like(indices)
+    for row in range(scores.shape[0]):
+        order = np.lexsort((indices[row], -scores[row]))
+        top_scores[row] = scores[row, order]
+        top_indices[row] = indices[row, order]
+    return top_scores, top_indices
+
+class NearestNeighbourIndex:
+    """
+    Base class of the indexes.
+    """
+
+    def __init__(self, embeddings: np.ndarray, labels: list = None):
+        self.embeddings = embeddings
+        self.labels = np.asarray(labels) if labels is not None else None
+        #rows of every label, computed on first use
+        self.label_rows = {}
+
+    def get_label_rows(self, label: str) -> np.ndarray:
+        """
+        Purpose
+        -------
+        Return the rows with a given label (all rows if label is None).
+
+        Parameters
+        ----------
+        label : str
+            Label to filter on.
+
+        Returns
+        -------
+        rows : np.ndarray
+            Sorted array of row indices.
+        """
+        if label is None:
+            return None
+        if label not in self.label_rows:
+            self.label_rows[label] = np.flatnonzero(self.labels == label)
+        rows = self.label_rows[label]
+        return rows
+
+    def search(self, queries: np.ndarray, k: int = 1, label: str = None) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Purpose
+        -------
+        Find the k embeddings most similar to every query.
+
+        Parameters
+        ----------
+        queries : np.ndarray
+            Matrix whose rows are the query embeddings (normalised by the index).
+        k : int, optional
+            Number of results per query (default: 1).
+        label : str, optional
+            If given, only rows with this label are searched.
+
+        Returns
+        -------
+        scores : np.ndarray
+            Matrix of shape (number of queries, k) with the cosine similarities, in decreasing order.
+        indices : np.ndarray
+            Matrix of shape (number of queries, k) with the rows of the results.
+        """
+        raise NotImplementedError
+
+class ExactIndex(NearestNeighbourIndex):
+    """
+    Exact search: all (or all filtered) rows are scanned in blocks of block_size rows, so that
+    the memory of the similarity matrix stays bounded.
+    """
+
+    def __init__(self, embeddings: np.ndarray, labels: list = None, block_size: int = 65536):
+        super().__init__(embeddings, labels)
+        self.block_size = block_size
+
+    def search(self, queries: np.ndarray, k: int = 1, label: str = None) -> tuple[np.ndarray, np.ndarray]:
+        queries = normalize_rows(queries)
+        rows = self.get_label_rows(label)
+        number_of_rows = self.embeddings.shape[0] if rows is None else len(rows)
+        top_scores = np.empty((queries.shape[0], 0), dtype=np.float32)
+        top_indices = np.empty((queries.shape[0], 0), dtype=np.int64)
+        for start in range(0, number_of_rows, self.block_size):
+            if rows is None:
+                block_indices = np.arange(start, min(start + self.block_size, number_of_rows))
+                block = self.embeddings[start:start + self.block_size]
+            else:
+                block_indices = rows[start:start + self.block_size]
+                block = self.embeddings[block_indices]
+            block_scores = queries @ np.asarray(block, dtype=np.float32).T
+            scores = np.concatenate([top_scores, block_scores], axis=1)
+            indices = np.concatenate([top_indices, np.broadcast_to(block_indices, block_scores.shape)], axis=1)
+            top_scores, top_indices = merge_top_k(scores, indices, k)
+        return top_scores, top_indices
+
+class IVFIndex(NearestNeighbourIndex):
+    """
+    Approximate search with an inverted file: embeddings are clustered with spherical k-means and
+    a query only scans the nprobe clusters whose centroids are the most similar to it.
+    """
+
+    def __init__(self, embeddings: np.ndarray, labels: list = None, number_of_lists: int = None, nprobe: int = 8, iterations: int = 10, seed: int = 0):
+        super().__init__(embeddings, labels)
+        number_of_rows = embeddings.shape[0]
+        #about sqrt(n) lists is the usual trade-off between centroid and list scanning
+        self.number_of_lists = min(number_of_lists or max(1, int(np.sqrt(number_of_rows))), number_of_rows)
+        self.nprobe = nprobe
+        self.centroids = self.train_centroids(iterations, seed)
+        #assigned in blocks, so that float16 or memory-mapped embeddings are upcast one block at a time
+        assignments = self.assign(embeddings)
+        order = np.argsort(assignments, kind='stable')
+        boundaries = np.searchsorted(assignments[order], np.arange(self.number_of_lists + 1))
+        self.lists = [order[boundaries[i]:boundaries[i + 1]] for i in range(self.number_of_lists)]
+        #exact index over the same embeddings, for the queries whose probed lists hold too few rows
+        self.exact_index = ExactIndex(embeddings, labels)
+
+    def assign(self, vectors: np.ndarray, block_size: int = 65536) -> np.ndarray:
+        """
+        Purpose
+        -------
+        Assign every vector to its most similar centroid.
+
+        Parameters
+        ----------
+        vectors : np.ndarray
+            Matrix of normalised vectors (of any float type; every block is upcast to float32).
+        block_size : int, optional
+            Number of vectors compared at once with the centroids (default: 65536).
+
+        Returns
+        -------
+        assignments : np.ndarray
+            Index of the centroid of every vector.
+        """
+        assignments = np.empty(vectors.shape[0], dtype=np.int64)
+        for start in range(0, vectors.shape[0], block_size):
+            assignments[start:start + block_size] = np.argmax(np.asarray(vectors[start:start + block_size], dtype=np.float32) @ self.centroids.T, axis=1)
+        return assignments
+
+    def train_centroids(self, iterations: int, seed: int) -> np.ndarray:
+        """
+        Purpose
+        -------
+        Run spherical k-means on (a sample of) the embeddings.
+
+        Parameters
+        ----------
+        iterations : int
+            Number of k-means iterations.
+        seed : int
+            Seed of the random generator.
+
+        Returns
+        -------
+        centroids : np.ndarray
+            Matrix of the normalised centroids.
+        """
+        random_generator = np.random.default_rng(seed)
+        number_of_rows = self.embeddings.shape[0]
+        #a sample of 256 points per list is enough to place the centroids
+        sample_size = min(number_of_rows, 256 * self.number_of_lists)
+        sample = np.asarray(self.embeddings[np.sort(random_generator.choice(number_of_rows, sample_size, replace=False))], dtype=np.float32)
+        self.centroids = sample[random_generator.choice(sample_size, self.number_of_lists, replace=False)]
+        for _ in range(iterations):
+            assignments = self.assign(sample)
+            sums = np.zeros_like(self.centroids)
+            np.add.at(sums, assignments, sample)
+            empty = np.bincount(assignments, minlength=self.number_of_lists) == 0
+            #empty clusters keep their previous centroid
+            sums[empty] = self.centroids[empty]
+            self.centroids = normalize_rows(sums)
+        return self.centroids
+
+    def search(self, queries: np.ndarray, k: int = 1, label: str = None, nprobe: int = None) -> tuple[np.ndarray, np.ndarray]:
+        queries = normalize_rows(queries)
+        nprobe = min(nprobe or self.nprobe, self.number_of_lists)
+        rows = self.get_label_rows(label)
+        centroid_scores = queries @ self.centroids.T
+        probed_lists = np.argpartition(-centroid_scores, nprobe - 1, axis=1)[:, :nprobe]
+        top_scores = np.full((queries.shape[0], k), -np.inf, dtype=np.float32)
+        top_indices = np.full((queries.shape[0], k), -1, dtype=np.int64)
+        for query_index, query in enumerate(queries):
+            candidates = np.concatenate([self.lists[list_index] for list_index in probed_lists[query_index]])
+            if rows is not None:
+                candidates = candidates[np.isin(candidates, rows, assume_unique=True)]
+            if len(candidates) == 0:
+                continue
+            candidate_scores = np.asarray(self.embeddings[candidates], dtype=np.float32) @ query
+            scores, indices = merge_top_k(candidate_scores[np.newaxis, :], candidates[np.newaxis, :], k)
+            top_scores[query_index, :scores.shape[1]] = scores[0]
+            top_indices[query_index, :indices.shape[1]] = indices[0]
+        #queries with fewer than k results (e.g. a label that is rare in the probed lists) are searched exactly
+        number_of_rows = self.embeddings.shape[0] if rows is None else len(rows)
+        incomplete = np.flatnonzero(np.sum(top_indices >= 0, axis=1) < min(k, number_of_rows))
+        if len(incomplete) > 0:
+            scores, indices = self.exact_index.search(queries[incomplete], k, label)
+            top_scores[incomplete, :scores.shape[1]] = scores
+            top_indices[incomplete, :indices.shape[1]] = indices
+        return top_scores, top_indices
+
+def build_index(embeddings: np.ndarray, labels: list = None, kind: str = 'exact', **parameters) -> NearestNeighbourIndex:
+    """
+    Purpose
+    -------
+    Create an index by name.
+
+    Parameters
+    ----------
+    embeddings : np.ndarray
+        Matrix of the normalised embeddings.
+    labels : list, optional
+        Label of every row (e.g. category_subcategory), used to filter the searches.
+    kind : str, optional
+        Either exact or ivf (default: exact).
+    **parameters
+        Parameters of the index (block_size for exact; number_of_lists, nprobe, iterations and seed for ivf).
+
+    Returns
+    -------
+    index : NearestNeighbourIndex
+        Index.
+    """
+    if kind == 'exact':
+        index = ExactIndex(embeddings, labels, **parameters)
+    elif kind == 'ivf':
+        index = IVFIndex(embeddings, labels, **parameters)
+    else:
+        raise ValueError('Unknown index: ' + kind)
+    return index
+
+def recall_report(embeddings: np.ndarray, queries: np.ndarray, k: int = 10, nprobe_values: list = [1, 2, 4, 8, 16, 32], number_of_lists: int = None) -> list:
+    """
+    Purpose
+    -------
+    Measure recall@k and latency of the IVF index for several values of nprobe, against exact search.
+
+    Parameters
+    ----------
+    embeddings : np.ndarray
+        Matrix of the normalised embeddings.
+    queries : np.ndarray
+        Matrix of the query embeddings.
+    k : int, optional
+        Number of results per query (default: 10).
+    nprobe_values : list, optional
+        Values of nprobe to measure (default: [1, 2, 4, 8, 16, 32]).
+    number_of_lists : int, optional
+        Number of lists of the IVF index (default: about sqrt of the number of rows).
+
+    Returns
+    -------
+    rows : list
+        List of dictionaries with index, nprobe, recall and milliseconds per query.
+    """
+    exact_index = ExactIndex(embeddings)
+    start = time.perf_counter()
+    _, exact_indices = exact_index.search(queries, k)
+    exact_time = time.perf_counter() - start
+    rows = [{'index': 'exact', 'nprobe': None, 'recall': 1.0, 'ms_per_query': 1000 * exact_time / len(queries)}]
+    start = time.perf_counter()
+    ivf_index = IVFIndex(embeddings, number_of_lists=number_of_lists)
+    print('IVF index with', ivf_index.number_of_lists, 'lists built in', round(time.perf_counter() - start, 2), 's')
+    for nprobe in nprobe_values:
+        start = time.perf_counter()
+        _, ivf_indices = ivf_index.search(queries, k, nprobe=nprobe)
+        ivf_time = time.perf_counter() - start
+        recall = np.mean([len(np.intersect1d(exact_row, ivf_row)) / len(exact_row) for exact_row, ivf_row in zip(exact_indices, ivf_indices)])
+        rows.append({'index': 'ivf', 'nprobe': nprobe, 'recall': float(recall), 'ms_per_query': 1000 * ivf_time / len(queries)})
+    return rows
+
+def generate_clustered_embeddings(number_of_rows: int, dimension: int, number_of_clusters: int = 2000, seed: int = 0) -> np.ndarray:
+    """
+    Purpose
+    -------
+    Generate normalised synthetic embeddings grouped in clusters, similar to sentence embeddings
+    of many paraphrased statements.
+
+    Parameters
+    ----------
+    number_of_rows : int
+        Number of embeddings.
+    dimension : int
+        Dimension of the embeddings.
+    number_of_clusters : int, optional
+        Number of clusters (default: 2000).
+    seed : int, optional
+        Seed of the random generator (default: 0).
+
+    Returns
+    -------
+    embeddings : np.ndarray
+        Matrix of the embeddings.
+    """
+    random_generator = np.random.default_rng(seed)
+    centers = random_generator.standard_normal((number_of_clusters, dimension), dtype=np.float32)
+    embeddings = centers[random_generator.integers(0, number_of_clusters, number_of_rows)]
+    embeddings += 1.0 * random_generator.standard_normal((number_of_rows, dimension), dtype=np.float32)
+    embeddings = normalize_rows(embeddings)
+    return embeddings
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Recall-vs-latency report of the approximate nearest-neighbour index.')
+    parser.add_argument('--rows', type=int, default=200000, help='Number of synthetic embeddings (default: 200000)')
+    parser.add_argument('--dimension', type=int, default=1024, help='Dimension of the synthetic embeddings (default: 1024)')
+    parser.add_argument('--index_file', help='Stored .npy matrix of embeddings to use instead of synthetic ones (e.g. from cache/expert_index)')
+    parser.add_argument('--queries', type=int, default=200, help='Number of queries (default: 200)')
+    parser.add_argument('-k', type=int, default=10, help='Number of results per query (default: 10)')
+    parser.add_argument('--lists', type=int, help='Number of lists of the IVF index (default: about sqrt of the number of rows)')
+    parser.add_argument('--nprobe', type=int, nargs='+', default=[1, 2, 4, 8, 16, 32], help='Values of nprobe to measure (default: 1 2 4 8 16 32)')
+    args = vars(parser.parse_args())
+    if args['index_file']:
+        embeddings = np.load(args['index_file'], mmap_mode='r')
+    else:
+        embeddings = generate_clustered_embeddings(args['rows'], args['dimension'])
+    #queries are perturbed copies of random rows, like paraphrases of expert statements
+    random_generator = np.random.default_rng(1)
+    queries = np.asarray(embeddings[random_generator.choice(embeddings.shape[0], args['queries'], replace=False)], dtype=np.float32)
+    queries = normalize_rows(queries + 0.05 * random_generator.standard_normal(queries.shape, dtype=np.float32))
+    print ("{:^10s} {:^10s} {:^15s} {:^15s}".format('INDEX', 'NPROBE', 'RECALL@' + str(args['k']), 'MS/QUERY'))
+    for row in recall_report(embeddings, queries, args['k'], args['nprobe'], args['lists']):
+        print ("{:^10s} {:^10s} {:^15s} {:^15s}".format(row['index'], str(row['nprobe'] or '-'), str(round(row['recall'], 3)), str(round(row['ms_per_query'], 3))))
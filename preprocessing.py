@@ -6,13 +6,224 @@ Created on Mon Nov 29 09:42:58 2021
 @author: micaelavieira
 """
 
-import enchant
-german_dictionary = enchant.Dict("de_DE")
+import atexit
+from cache_utils import cache_path, hash_strings
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from importlib import metadata
+from instrumentation import increment, timed, timer
+import json
+import multiprocessing
+import os
 import pandas as pd
-from spellchecker import SpellChecker
-german_spellchecker = SpellChecker(language='de')
-import splitter
 import string
+import threading
+
+#German dictionary and spellchecker are created on first use (see load_german_dictionary and load_german_spellchecker)
+german_dictionary = None
+german_spellchecker = None
+spelling_tools_lock = threading.Lock()
+
+#maximum number of tokens kept in the in-process cache of token_preprocessing
+TOKEN_CACHE_SIZE = 100000
+#persistent lexicon mapping tokens to their preprocessed version, as read from disk (see get_correction_lexicon)
+correction_lexicon = None
+#corrections made by this process (or received from worker processes) and not saved yet
+new_corrections = {}
+#maximum number of new corrections kept in memory: when it is reached, they are saved and forgotten,
+#so that memory is bounded by the lexicon read at startup, these and the in-process cache
+NEW_CORRECTIONS_SIZE = 10000
+#number of tokens found in the persistent lexicon and number of tokens actually corrected
+#(corpus_calls and corpus_memory_hits count the tokens preprocessed by corpus_preprocessing)
+correction_statistics = {'lexicon_hits': 0, 'corrections': 0, 'corpus_calls': 0, 'corpus_memory_hits': 0}
+#minimum number of tokens to correct for corpus_preprocessing to start a process pool
+PARALLEL_MIN_TOKENS = 200
+
+def load_german_dictionary():
+    """
+    Purpose
+    -------
+    Create the German dictionary, only the first time the function is called.
+
+    Returns
+    -------
+    german_dictionary : enchant.Dict
+        German dictionary.
+    """
+    global german_dictionary
+    with spelling_tools_lock:
+        if german_dictionary is None:
+            import enchant
+            german_dictionary = enchant.Dict("de_DE")
+    return german_dictionary
+
+def load_german_spellchecker():
+    """
+    Purpose
+    -------
+    Create the German spellchecker, only the first time the function is called (this takes
+    about a second, so it is skipped entirely when all tokens are in the correction lexicon).
+
+    Returns
+    -------
+    german_spellchecker : SpellChecker
+        German spellchecker.
+    """
+    global german_spellchecker
+    with spelling_tools_lock:
+        if german_spellchecker is None:
+            from spellchecker import SpellChecker
+            german_spellchecker = SpellChecker(language='de')
+    return german_spellchecker
+
+def get_spelling_version() -> str:
+    """
+    Purpose
+    -------
+    Compute a fingerprint of the German dictionary, of the compound splitter and of the
+    spellchecker, so that the persistent lexicon is discarded when one of them changes.
+
+    Returns
+    -------
+    spelling_version : str
+        Hash of the versions of the tools used by token_preprocessing.
+    """
+    dictionary = load_german_dictionary()
+    versions = [dictionary.tag, dictionary.provider.name, dictionary.provider.file]
+    #the dictionary of the spellchecker is shipped with the package, so its version is enough
+    for package in ['pyenchant', 'pyspellchecker', 'compound-word-splitter']:
+        try:
+            versions.append(metadata.version(package))
+        except metadata.PackageNotFoundError:
+            versions.append('unknown')
+    spelling_version = hash_strings(versions)[:16]
+    return spelling_version
+
+def get_correction_lexicon() -> dict:
+    """
+    Purpose
+    -------
+    Load (once per process) the persistent lexicon of preprocessed tokens, shared across runs.
+    The new corrections of the process are kept apart (see add_corrections), so the lexicon
+    does not grow while the process runs.
+
+    Returns
+    -------
+    correction_lexicon : dict
+        Dictionary mapping tokens to their preprocessed version.
+    """
+    global correction_lexicon
+    if correction_lexicon is None:
+        correction_lexicon = {}
+        filename = cache_path('spelling', get_spelling_version() + '.json')
+        if os.path.exists(filename):
+            with open(filename, 'r', encoding='utf-8') as infile:
+                correction_lexicon = json.load(infile)
+    return correction_lexicon
+
+@atexit.register
+def save_correction_lexicon():
+    """
+    Purpose
+    -------
+    Store the new entries of the lexicon to disk, merging them with the entries written in the
+    meantime by other programs. Called automatically when the program ends; worker processes
+    return their new entries to the main process instead (see take_new_corrections), so that
+    they do not replace the file concurrently.
+    """
+    if not new_corrections:
+        return
+    filename = cache_path('spelling', get_spelling_version() + '.json')
+    merged_lexicon = {}
+    if os.path.exists(filename):
+        with open(filename, 'r', encoding='utf-8') as infile:
+            merged_lexicon = json.load(infile)
+    saved_corrections = dict(new_corrections)
+    merged_lexicon.update(saved_corrections)
+    temporary_filename = filename + '.' + str(os.getpid()) + '.tmp'
+    with open(temporary_filename, 'w', encoding='utf-8') as out:
+        json.dump(merged_lexicon, out, ensure_ascii=False)
+    os.replace(temporary_filename, filename)
+    for token in saved_corrections:
+        new_corrections.pop(token, None)
+
+def take_new_corrections() -> dict:
+    """
+    Purpose
+    -------
+    Return and forget the entries of the lexicon not saved yet (called by worker processes, which
+    send them to the main process).
+
+    Returns
+    -------
+    corrections : dict
+        Dictionary mapping tokens to their preprocessed version.
+    """
+    corrections = dict(new_corrections)
+    new_corrections.clear()
+    return corrections
+
+def add_corrections(corrections: dict):
+    """
+    Purpose
+    -------
+    Add new corrections; they are saved when the program ends, or as soon as there are
+    NEW_CORRECTIONS_SIZE of them in the main process (worker processes keep them until they
+    send them to the main process).
+
+    Parameters
+    ----------
+    corrections : dict
+        Dictionary mapping tokens to their preprocessed version.
+    """
+    new_corrections.update(corrections)
+    if len(new_corrections) >= NEW_CORRECTIONS_SIZE and multiprocessing.parent_process() is None:
+        save_correction_lexicon()
+
+def find_correction(token: str) -> tuple[bool, str]:
+    """
+    Purpose
+    -------
+    Look up a token in the persistent lexicon and in the corrections not saved yet.
+
+    Parameters
+    ----------
+    token : str
+        Token to look up.
+
+    Returns
+    -------
+    tuple
+        Whether the token was found, and its preprocessed version.
+    """
+    lexicon = get_correction_lexicon()
+    if token in lexicon:
+        return True, lexicon[token]
+    if token in new_corrections:
+        return True, new_corrections[token]
+    return False, None
+
+def get_correction_statistics() -> dict:
+    """
+    Purpose
+    -------
+    Report how many calls of token_preprocessing were answered by the in-process cache or by the
+    persistent lexicon, and how many needed the dictionary and the spellchecker.
+
+    Returns
+    -------
+    statistics : dict
+        Dictionary containing the number of calls, memory hits, lexicon hits, corrections and
+        the hit rate (fraction of calls that did not need a correction).
+    """
+    memory_hits = cached_token_preprocessing.cache_info().hits + correction_statistics['corpus_memory_hits']
+    calls = cached_token_preprocessing.cache_info().hits + cached_token_preprocessing.cache_info().misses + correction_statistics['corpus_calls']
+    statistics = {'calls': calls, 'memory_hits': memory_hits,
+                  'lexicon_hits': correction_statistics['lexicon_hits'],
+                  'corrections': correction_statistics['corrections'],
+                  'hit_rate': round(1 - correction_statistics['corrections'] / calls, 3) if calls else 0}
+    return statistics
 
 def token_preprocessing(token: str) -> str:
     """
@@ -32,6 +243,59 @@ def token_preprocessing(token: str) -> str:
     output_token : str
         Preprocessed token.
     """
+    #results are cached in memory and in the persistent lexicon
+    increment('preprocessing.tokens')
+    output_token = cached_token_preprocessing(token)
+    return output_token
+
+@lru_cache(maxsize=TOKEN_CACHE_SIZE)
+def cached_token_preprocessing(token: str) -> str:
+    """
+    Purpose
+    -------
+    Look up a token in the persistent lexicon and preprocess it only if it is not there yet.
+
+    Parameters
+    ----------
+    token : str
+        Token to preprocess.
+
+    Returns
+    -------
+    output_token : str
+        Preprocessed token.
+    """
+    found, output_token = find_correction(token)
+    if found:
+        correction_statistics['lexicon_hits'] += 1
+        increment('preprocessing.token_lexicon_hits')
+        return output_token
+    output_token = correct_token(token)
+    correction_statistics['corrections'] += 1
+    increment('preprocessing.tokens_corrected')
+    add_corrections({token: output_token})
+    return output_token
+
+@timed('preprocessing.spell_correction')
+def correct_token(token: str) -> str:
+    """
+    Purpose
+    -------
+    Check a token against the German dictionary and the compound splitter and, if needed,
+    correct it with the spellchecker (see token_preprocessing).
+
+    Parameters
+    ----------
+    token : str
+        Token to preprocess.
+
+    Returns
+    -------
+    output_token : str
+        Preprocessed token.
+    """
+    import splitter
+    german_dictionary = load_german_dictionary()
     #if token is in dictionary, we are fine
     if german_dictionary.check(token):
         output_token = token
@@ -43,30 +307,45 @@ def token_preprocessing(token: str) -> str:
             output_token = token
         #otherwise try to fix the typo using the Levenshtein distance
         else:
-            output_token = german_spellchecker.correction(token)
+            output_token = load_german_spellchecker().correction(token)
     return output_token
 
-def sentence_preprocessing(sentence: str, subcategory: str, abbreviation_list: list, substitution_name: str) -> str:
+def correct_tokens(tokens: list) -> list:
     """
     Purpose
     -------
-    Preprocess a sentence.
+    Correct a list of tokens with correct_token (runs in a worker process of corpus_preprocessing).
+
+    Parameters
+    ----------
+    tokens : list
+        List of tokens to preprocess.
+
+    Returns
+    -------
+    output_tokens : list
+        List of preprocessed tokens.
+    """
+    output_tokens = [correct_token(token) for token in tokens]
+    return output_tokens
+
+def split_sentence(sentence: str, subcategory: str) -> list:
+    """
+    Purpose
+    -------
+    Split a sentence in tokens and remove the label that an expert put at its beginning.
 
     Parameters
     ----------
     sentence : str
-        Sentence to preprocess.
+        Sentence to split.
     subcategory : str
         Subcategory to which the sentence belong (beobachtungen, herausforderungen, or ressourcen).
-    abbreviation_list : list
-        List of abbreviations to keep unchanged.
-    substitution_name : str
-        Name to use to substitute the initial character of the real name of the patient.
 
     Returns
     -------
-    preprocessed_sentence : str
-        Preprocessed sentence.
+    splitted_sentence : list
+        List of tokens.
     """
     #replace ’ with '
     sentence = sentence.replace("’", "'")
@@ -78,32 +357,215 @@ def sentence_preprocessing(sentence: str, subcategory: str, abbreviation_list: l
     elif subcategory == 'ressourcen':
             if splitted_sentence[0] in ['R.', 'R:']:
                 splitted_sentence.pop(0)
+    return splitted_sentence
+
+def token_rule(token: str, abbreviation_list: list, substitution_name: str) -> str:
+    """
+    Purpose
+    -------
+    Apply the substitution rules of sentence_preprocessing to a token.
+
+    Parameters
+    ----------
+    token : str
+        Token to preprocess.
+    abbreviation_list : list
+        List of abbreviations to keep unchanged.
+    substitution_name : str
+        Name to use to substitute the initial character of the real name of the patient.
+
+    Returns
+    -------
+    output_token : str
+        Substituted token, or None if the token has to be spell-corrected (see token_preprocessing).
+    """
+    #substitute Th. or Th.: to Therapeut
+    if token in ['Th.', 'Th.:']:
+        output_token = 'Therapeut'
+    #substitute initial character of the real name of the patient
+    #substitute single uppercase characters (e.g., C)
+    elif len(token) == 1 and token.isalpha() and token.isupper():
+        output_token = substitution_name
+    #substitute uppercase characters with punctuation (e.g., C.)
+    elif len(token) == 2 and token[0].isupper() and token[1] in string.punctuation and token not in abbreviation_list:
+        output_token = substitution_name
+    #substitute uppercase characters with punctuation and s (e.g., C's)
+    elif len(token) == 3 and token[0].isupper() and token[1] in string.punctuation and token not in abbreviation_list:
+        output_token = substitution_name + "'s"
+    #substitute uppercase characters with point, punctuation and s (e.g., C.'s)
+    elif len(token) == 4 and token[0].isupper() and token[1] == '.' and token[2] in string.punctuation and token not in abbreviation_list:
+        output_token = substitution_name + "'s"
+    #substitute typos
+    elif token not in abbreviation_list and token.isalpha():
+        output_token = None
+    else:
+        output_token = token
+    return output_token
+
+@timed('preprocessing.sentence')
+def sentence_preprocessing(sentence: str, subcategory: str, abbreviation_list: list, substitution_name: str) -> str:
+    """
+    Purpose
+    -------
+    Preprocess a sentence.
+
+    Parameters
+    ----------
+    sentence : str
+        Sentence to preprocess.
+    subcategory : str
+        Subcategory to which the sentence belong (beobachtungen, herausforderungen, or ressourcen).
+    abbreviation_list : list
+        List of abbreviations to keep unchanged.
+    substitution_name : str
+        Name to use to substitute the initial character of the real name of the patient.
+
+    Returns
+    -------
+    preprocessed_sentence : str
+        Preprocessed sentence.
+    """
+    splitted_sentence = split_sentence(sentence, subcategory)
     token_index = 0
     for token in splitted_sentence:
-        #substitute Th. or Th.: to Therapeut
-        if token in ['Th.', 'Th.:']:
-            splitted_sentence[token_index] = 'Therapeut'
-        #substitute initial character of the real name of the patient
-        #substitute single uppercase characters (e.g., C)
-        elif len(token) == 1 and token.isalpha() and token.isupper():
-            splitted_sentence[token_index] = substitution_name
-        #substitute uppercase characters with punctuation (e.g., C.)
-        elif len(token) == 2 and token[0].isupper() and token[1] in string.punctuation and token not in abbreviation_list:
-            splitted_sentence[token_index] = substitution_name
-        #substitute uppercase characters with punctuation and s (e.g., C's)
-        elif len(token) == 3 and token[0].isupper() and token[1] in string.punctuation and token not in abbreviation_list:
-            splitted_sentence[token_index] = substitution_name + "'s"
-        #substitute uppercase characters with point, punctuation and s (e.g., C.'s)
-        elif len(token) == 4 and token[0].isupper() and token[1] == '.' and token[2] in string.punctuation and token not in abbreviation_list:
-            splitted_sentence[token_index] = substitution_name + "'s"
-        #substitute typos
-        elif token not in abbreviation_list and token.isalpha():
-            correct_token = token_preprocessing(token)
-            splitted_sentence[token_index] = correct_token
+        output_token = token_rule(token, abbreviation_list, substitution_name)
+        if output_token is None:
+            output_token = token_preprocessing(token)
+        splitted_sentence[token_index] = output_token
         token_index += 1
     preprocessed_sentence = ' '.join(splitted_sentence)
     return preprocessed_sentence
 
+@timed('preprocessing.corpus')
+def corpus_preprocessing(sentences_and_subcategories: list, abbreviation_list: list, substitution_name: str, workers: int = None) -> list:
+    """
+    Purpose
+    -------
+    Preprocess a whole corpus of sentences, with the same output as sentence_preprocessing: the
+    rules are applied once per distinct token, and the distinct tokens that are not in the
+    persistent lexicon are corrected once, by a pool of worker processes.
+
+    Parameters
+    ----------
+    sentences_and_subcategories : list
+        List of tuples (sentence, subcategory to which the sentence belong).
+    abbreviation_list : list
+        List of abbreviations to keep unchanged.
+    substitution_name : str
+        Name to use to substitute the initial character of the real name of the patient.
+    workers : int, optional
+        Number of correction processes (default: number of cores; 1 corrects in this process).
+
+    Returns
+    -------
+    preprocessed_sentences : list
+        List containing the preprocessed sentences, in the same order.
+    """
+    splitted_sentences = [split_sentence(sentence, subcategory) for sentence, subcategory in sentences_and_subcategories]
+    token_counts = Counter(token for splitted_sentence in splitted_sentences for token in splitted_sentence)
+    #rules of every distinct token; None marks the tokens to spell-correct
+    token_mapping = {token: token_rule(token, abbreviation_list, substitution_name) for token in token_counts}
+    tokens_to_correct = [token for token, output_token in token_mapping.items() if output_token is None]
+    known_corrections = {}
+    for token in tokens_to_correct:
+        found, output_token = find_correction(token)
+        if found:
+            known_corrections[token] = output_token
+    missing_tokens = [token for token in tokens_to_correct if token not in known_corrections]
+    if missing_tokens:
+        if workers == 1 or len(missing_tokens) < PARALLEL_MIN_TOKENS:
+            corrected_tokens = correct_tokens(missing_tokens)
+        else:
+            workers = workers or os.cpu_count() or 1
+            #a few chunks per worker, so that slow tokens do not leave the other workers idle
+            chunk_size = max(1, -(-len(missing_tokens) // (workers * 4)))
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                chunks = executor.map(correct_tokens, [missing_tokens[i:i + chunk_size] for i in range(0, len(missing_tokens), chunk_size)])
+                corrected_tokens = [output_token for chunk in chunks for output_token in chunk]
+        corrections = dict(zip(missing_tokens, corrected_tokens))
+        add_corrections(corrections)
+        known_corrections.update(corrections)
+    for token in tokens_to_correct:
+        token_mapping[token] = known_corrections[token]
+    #statistics as if every token had been preprocessed by token_preprocessing
+    calls = sum(token_counts[token] for token in tokens_to_correct)
+    correction_statistics['corpus_calls'] += calls
+    correction_statistics['corpus_memory_hits'] += calls - len(tokens_to_correct)
+    correction_statistics['lexicon_hits'] += len(tokens_to_correct) - len(missing_tokens)
+    correction_statistics['corrections'] += len(missing_tokens)
+    increment('preprocessing.tokens', calls)
+    increment('preprocessing.token_lexicon_hits', len(tokens_to_correct) - len(missing_tokens))
+    increment('preprocessing.tokens_corrected', len(missing_tokens))
+    preprocessed_sentences = [' '.join(token_mapping[token] for token in splitted_sentence) for splitted_sentence in splitted_sentences]
+    return preprocessed_sentences
+
+def read_student_file(filename: str, subcategory: str) -> list:
+    """
+    Purpose
+    -------
+    Read the student statements of a subcategory, without preprocessing them.
+
+    Parameters
+    ----------
+    filename : str
+        Name of the file containing the student sentences.
+    subcategory : str
+        Subcategory we are interested in (beobachtungen, herausforderungen, or ressourcen).
+
+    Returns
+    -------
+    extracted_sentences : list
+        List containing the student statements (empty cells are removed).
+    """
+    with timer('preprocessing.read_student_file'):
+        student_data = pd.read_csv(filename, sep='\t', header=None, names=['beobachtungen', 'herausforderungen', 'ressourcen', 'other'], encoding='utf-8', dtype=str)
+    extracted_sentences = [sent for sent in student_data[subcategory].tolist() if sent == sent]
+    return extracted_sentences
+
+def get_expert_filename(category: str, subcategory: str) -> str:
+    """
+    Purpose
+    -------
+    Return the name of the file containing the experts statements of a category and subcategory.
+
+    Parameters
+    ----------
+    category : str
+        Category we are interested in (either anamnese or spielsituation).
+    subcategory : str
+        Subcategory we are interested in (beobachtungen, herausforderungen, or ressourcen).
+
+    Returns
+    -------
+    filename : str
+        Name of the file.
+    """
+    filename = 'experts/' + category + '_' + subcategory + '.tsv'
+    return filename
+
+def read_expert_file(category: str, subcategory: str) -> pd.DataFrame:
+    """
+    Purpose
+    -------
+    Read the file containing the experts statements of a category and subcategory.
+
+    Parameters
+    ----------
+    category : str
+        Category we are interested in (either anamnese or spielsituation).
+    subcategory : str
+        Subcategory we are interested in (beobachtungen, herausforderungen, or ressourcen).
+
+    Returns
+    -------
+    expert_data : pd.DataFrame
+        Dataframe with columns expert_ID, statement, category_ID, category_main, and category_sub.
+    """
+    filename = get_expert_filename(category, subcategory)
+    with timer('preprocessing.read_expert_file'):
+        expert_data = pd.read_csv(filename, sep='\t', header=None, names=['expert_ID', 'statement', 'category_ID', 'category_main', 'category_sub'], encoding='utf-8')
+    return expert_data
+
 def get_expert_statements_and_categories(category: str, subcategory: str, abbreviation_list: list, substitution_name: str) -> tuple[list, list]:
     """
     Purpose
@@ -129,8 +591,7 @@ def get_expert_statements_and_categories(category: str, subcategory: str, abbrev
         List containing the categories of the extracted sentences.
     
     """
-    filename = 'experts/' + category + '_' + subcategory + '.tsv'
-    expert_data = pd.read_csv(filename, sep='\t', header=None, names=['expert_ID', 'statement', 'category_ID', 'category_main', 'category_sub'], encoding='utf-8')
+    expert_data = read_expert_file(category, subcategory)
     expert_categories = [i.strip() for i in expert_data['category_main'].tolist()]
     extracted_sentences = expert_data['statement'].tolist()
     #preprocessing
@@ -139,6 +600,48 @@ def get_expert_statements_and_categories(category: str, subcategory: str, abbrev
         expert_sentences.append(sentence_preprocessing(sent, subcategory, abbreviation_list, substitution_name))
     return expert_sentences, expert_categories
 
+def iterate_student_statements(filename: str, subcategory: str, abbreviation_list: list, substitution_name: str, chunk_size: int = 1000):
+    """
+    Purpose
+    -------
+    Read a file of student statements in chunks of rows and yield the preprocessed statements of
+    every chunk, so that memory does not grow with the size of the file.
+
+    Parameters
+    ----------
+    filename : str
+        Name of the file containing the student sentences.
+    subcategory : str
+        Subcategory we are interested in (beobachtungen, herausforderungen, or ressourcen).
+    abbreviation_list : list
+        List of abbreviations to keep unchanged during preprocessing.
+    substitution_name : str
+        Name to use to substitute the initial character of the real name of the patient.
+    chunk_size : int, optional
+        Number of rows read at a time (default: 1000).
+
+    Yields
+    ------
+    student_sentences : list
+        List containing the preprocessed student statements of a chunk (chunks without
+        statements are skipped).
+    """
+    student_chunks = pd.read_csv(filename, sep='\t', header=None, names=['beobachtungen', 'herausforderungen', 'ressourcen', 'other'], encoding='utf-8', dtype=str, chunksize=chunk_size)
+    while True:
+        with timer('preprocessing.read_student_file'):
+            student_data = next(student_chunks, None)
+        if student_data is None:
+            break
+        extracted_sentences = student_data[subcategory].tolist()
+        #remove empty cells
+        extracted_sentences = [sent for sent in extracted_sentences if sent == sent]
+        #preprocessing
+        student_sentences = []
+        for sent in extracted_sentences:
+            student_sentences.append(sentence_preprocessing(sent, subcategory, abbreviation_list, substitution_name))
+        if student_sentences:
+            yield student_sentences
+
 def get_student_statements(filename: str, subcategory: str, abbreviation_list: list, substitution_name: str) -> list:
     """
     Purpose
@@ -161,12 +664,7 @@ def get_student_statements(filename: str, subcategory: str, abbreviation_list: l
     student_sentences : list
         List containing the preprocessed student statements.
     """
-    student_data = pd.read_csv(filename, sep='\t', header=None, names=['beobachtungen', 'herausforderungen', 'ressourcen', 'other'], encoding='utf-8')
-    extracted_sentences = student_data[subcategory].tolist()
-    #remove empty cells
-    extracted_sentences = [sent for sent in extracted_sentences if sent == sent]
-    #preprocessing
     student_sentences = []
-    for sent in extracted_sentences:
-        student_sentences.append(sentence_preprocessing(sent, subcategory, abbreviation_list, substitution_name))
-    return student_sentences
\ No newline at end of file
+    for chunk_sentences in iterate_student_statements(filename, subcategory, abbreviation_list, substitution_name):
+        student_sentences.extend(chunk_sentences)
+    return student_sentences
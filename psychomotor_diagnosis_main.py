@@ -10,9 +10,12 @@ Created on Mon Nov 29 11:40:37 2021
 Code to perform computer-aided exercises in psychomotor diagnosis.
 """
 
+import time
+startup_start = time.perf_counter()
 import argparse
-from preprocessing import get_expert_statements_and_categories, get_student_statements
-import numpy as np
+import instrumentation
+import os
+import sys
 
 #define parser
 parser = argparse.ArgumentParser(description='Main code for computer-aided exercises in psychomotor diagnosis.')
@@ -24,87 +27,227 @@ parser.add_argument('-p', '--patient', default='Andreas', help='Patient name (de
 group = parser.add_mutually_exclusive_group()
 group.add_argument('-f', '--filename_student', help='Filename containing the student answers')
 group.add_argument('-w', '--write_sentence', action='store_true', help='Enter student answers directly in command line')
+group.add_argument('-d', '--students_directory', help='Directory (or glob pattern) of student files to score all at once, for all subcategories; categories are inferred from the file names')
 parser.add_argument('-o', '--outfile', action='store_true', help='Store scores, most similar sentences, and sentences\' categories to file')
+parser.add_argument('--output_format', choices=['tsv', 'jsonl', 'parquet'], default='tsv', help='Format of the outfile of argument -o; parquet needs pyarrow (default: tsv)')
+parser.add_argument('--chunk_size', type=int, default=1000, help='Number of rows of the student file read, scored and written at a time (default: 1000)')
+parser.add_argument('-m', '--model', help='Name or directory of the sentencebert model, e.g. a model fine-tuned with sentencebert_finetuning.py (default: gbert-large)')
+parser.add_argument('--precision', choices=['fp32', 'int8'], default='fp32', help='Precision of the sentencebert model; int8 is smaller and faster on CPU, see quantization_validation.py (default: fp32)')
+parser.add_argument('--index', choices=['exact', 'ivf'], default='exact', help='Nearest-neighbour index over the sentencebert expert embeddings; ivf is approximate, for large expert banks (default: exact)')
+parser.add_argument('--nprobe', type=int, help='Number of clusters scanned by the ivf index: higher is slower but more accurate (default: 8)')
+parser.add_argument('--storage', choices=['float32', 'float16'], default='float32', help='Storage of the sentencebert expert embeddings; float16 halves their memory (default: float32)')
+parser.add_argument('--pca', type=int, help='Project the sentencebert embeddings on this number of principal components of the expert embeddings (default: no projection)')
+parser.add_argument('--infer_epochs', type=int, help='Number of epochs to infer the doc2vec vector of a student sentence (default: epochs used for training)')
+parser.add_argument('--infer_alpha', type=float, help='Initial learning rate to infer the doc2vec vector of a student sentence (default: learning rate used for training)')
+parser.add_argument('-t', '--translator', choices=['google', 'identity', 'dictionary'], default='google', help='Translator to English used by infersent; identity and dictionary work offline (default: google)')
+parser.add_argument('--translation_dictionary', help='Tsv file with German sentences or words and their English translations, used by the dictionary translator')
+parser.add_argument('--cache_statistics', action='store_true', help='Print how much work the caches saved after the final report')
+parser.add_argument('--no_result_cache', action='store_true', help='Score all student sentences again instead of reusing the results of previous runs')
+parser.add_argument('--result_cache_size', type=int, default=100000, help='Maximum number of results kept in the result cache (default: 100000)')
+parser.add_argument('-k', '--top_k', type=int, default=1, help='Number of most similar expert sentences to display for each student sentence (default: 1)')
+parser.add_argument('--startup_timings', action='store_true', help='Print how long each startup step took')
+parser.add_argument('-O', '--output_directory', default='cohort_output', help='Directory of the output files of argument -d (default: cohort_output)')
+parser.add_argument('-j', '--workers', type=int, help='Number of preprocessing processes used with argument -d (default: number of cores)')
+parser.add_argument('--vocabulary_first', action='store_true', help='With argument -d, preprocess the whole cohort at once, correcting every distinct token only once')
+parser.add_argument('--profile', action='store_true', help='Print counters and timings of preprocessing, translation, encoding and similarity after the final report')
+parser.add_argument('--metrics_out', help='Write counters and timings to a file: json if its name ends with .json, otherwise Prometheus text format')
 args = vars(parser.parse_args())
+#validate arguments before loading anything heavy
+if args['filename_student'] and not os.path.isfile(args['filename_student']):
+    parser.error('file not found: ' + args['filename_student'])
+if args['top_k'] < 1:
+    parser.error('--top_k must be at least 1')
+if args['pca'] is not None and args['pca'] < 1:
+    parser.error('--pca must be at least 1')
+if args['result_cache_size'] < 1:
+    parser.error('--result_cache_size must be at least 1')
+if args['chunk_size'] < 1:
+    parser.error('--chunk_size must be at least 1')
+if args['translator'] == 'dictionary' and not args['translation_dictionary']:
+    parser.error('the dictionary translator needs --translation_dictionary')
+startup_timings = {'argument parsing': time.perf_counter() - startup_start}
+#record counters and timings only if they are going to be printed or written
+if args['profile'] or args['metrics_out']:
+    instrumentation.enable()
 
-#import algorithm to calculate sentence similarity
-algorithm_to_use = args['algorithm']
-if algorithm_to_use == 'doc2vec':
-    from doc2vec import doc2vec_score as algorithm
-elif algorithm_to_use == 'sentencebert':
-    from sentencebert import sentencebert_score as algorithm
-elif algorithm_to_use == 'infersent':
-    from infersent import infersent_score as algorithm
+#options of the algorithm to calculate sentence similarity (see backends.get_scoring_functions)
+algorithm_options = {'model_name': args['model'], 'precision': args['precision'],
+                     'index_kind': args['index'], 'nprobe': args['nprobe'], 'storage': args['storage'], 'pca_dimension': args['pca'],
+                     'infer_epochs': args['infer_epochs'], 'infer_alpha': args['infer_alpha'],
+                     'translator': args['translator'], 'translation_dictionary': args['translation_dictionary']}
+#reuse the results of sentences already scored with the same algorithm and expert statements (see result_cache.py)
+result_cache = None
+if not args['no_result_cache']:
+    from result_cache import ResultCache
+    result_cache = ResultCache(max_entries=args['result_cache_size'])
+    algorithm_options['result_cache'] = result_cache
 
-#get expert sentences and categories
+def print_result_cache_statistics():
+    """
+    Purpose
+    -------
+    Print hits, misses and evictions of the result cache, if it was used.
+    """
+    if result_cache is None:
+        return
+    result_cache_statistics = result_cache.get_statistics()
+    print('RESULT CACHE')
+    print ("{:^22s} {:^22s} {:^22s} {:^22s}".format('HITS', 'MISSES', 'EVICTIONS', 'STORED RESULTS'))
+    print ("{:^22s} {:^22s} {:^22s} {:^22s}".format(str(result_cache_statistics['hits']), str(result_cache_statistics['misses']), str(result_cache_statistics['evictions']), str(result_cache_statistics['entries'])))
+    print('Hit rate:', result_cache_statistics['hit_rate'])
+    print('***************************************************************************************')
+
+#score the whole cohort if argument -d was chosen
+if args['students_directory']:
+    from cohort import print_cohort_report, run_cohort
+    abbreviations = args['abbreviations'].replace('"', '').replace('[', '').replace(']', '').split(', ')
+    cohort_rows = run_cohort(args['students_directory'], args['algorithm'], abbreviations, args['patient'], args['output_directory'],
+                             default_category=args['category'], workers=args['workers'], top_k=args['top_k'],
+                             vocabulary_first=args['vocabulary_first'], **algorithm_options)
+    print_cohort_report(cohort_rows)
+    print_result_cache_statistics()
+    #only the scoring is recorded: preprocessing runs in the worker processes
+    if args['profile']:
+        instrumentation.print_profile()
+    if args['metrics_out']:
+        instrumentation.write_metrics(args['metrics_out'])
+    sys.exit()
+
+#get category and subcategory to look at
 category = args['category']
 subcategory = args['subcategory']
+
+#start loading the algorithm to calculate sentence similarity in the background
+step_start = time.perf_counter()
+from backends import get_scoring_functions, warm_up
+algorithm_to_use = args['algorithm']
+warm_up(algorithm_to_use, args['model'], args['precision'])
+from expert_corpus import load_expert_statements_and_categories
+from preprocessing import get_correction_statistics, iterate_student_statements
+from result_writer import EXTENSIONS, get_result_writer
+startup_timings['imports'] = time.perf_counter() - step_start
+
+#get expert sentences and categories
 abbreviations = args['abbreviations'].replace('"', '').replace('[', '').replace(']', '').split(', ')
 patient_name = args['patient']
-expert_sentences, expert_categories = get_expert_statements_and_categories(category, subcategory, abbreviations, patient_name)
+#expert statements are preprocessed once and read from the compiled corpus (see expert_corpus.py)
+step_start = time.perf_counter()
+with instrumentation.timer('main.expert_statements'):
+    expert_sentences, expert_categories = load_expert_statements_and_categories(category, subcategory, abbreviations, patient_name)
+startup_timings['expert statements'] = time.perf_counter() - step_start
+
+#wait for the algorithm (only the part of its loading not overlapped with the steps above)
+step_start = time.perf_counter()
+with instrumentation.timer('main.model_loading'):
+    algorithm, algorithm_batch = get_scoring_functions(algorithm_to_use, category, subcategory, **algorithm_options)
+startup_timings['model loading (waiting)'] = time.perf_counter() - step_start
+startup_timings['total'] = time.perf_counter() - startup_start
+#print startup timings if argument --startup_timings was chosen
+if args['startup_timings']:
+    for step, seconds in startup_timings.items():
+        print ("{:<30s} {:>10.3f} s".format(step, seconds))
 
 #define threshold above which the most similar expert sentence is displayed by default
 threshold = 0.9
 
-#define dictionary to accomodate scores of most similar sentences divided for categories
-categories_and_scores_most_similar_sentences = {i: [] for i in set(expert_categories)}
+#define dictionary to accomodate number and sum of scores of most similar sentences divided for categories
+#(running aggregates, so that memory does not grow with the number of student sentences)
+categories_and_scores_most_similar_sentences = {i: [0, 0.0] for i in set(expert_categories)}
 
 #get student sentences if argument -f was chosen
 if args['filename_student']:
     #create outfile if argument -o was chosen
+    writer = None
     if args['outfile']:
-        outname = args['filename_student'][:-4]+'_outfile.txt'
-        with open(outname, 'w') as out:
-            out.write('Student_sentence \t Similarity_score \t Most_sililar_sentence \t Category\n')
-    student_sentences = get_student_statements(args['filename_student'], subcategory, abbreviations, patient_name)
-    for sent in student_sentences:
-        score_most_similar_sentence, most_similar_sentence, most_similar_sentence_category = algorithm(sent, expert_sentences, expert_categories)
-        categories_and_scores_most_similar_sentences[most_similar_sentence_category].append(score_most_similar_sentence)
-        #print result on screen depending on threshold
-        if score_most_similar_sentence >= threshold:
-            print(sent, '\t', score_most_similar_sentence, '\t', most_similar_sentence, '\n')
-        else:
-            print(sent, '\t', score_most_similar_sentence, '\n')
-        #store results to outfile if argument -o was chosen
-        if args['outfile']:
-            with open(outname, 'a') as out:
-                to_print = sent + '\t' + str(score_most_similar_sentence) + '\t' + most_similar_sentence + '\t' + most_similar_sentence_category + '\n'
-                out.write(to_print)
+        outname = args['filename_student'][:-4] + '_outfile' + EXTENSIONS[args['output_format']]
+        writer = get_result_writer(outname, args['output_format'])
+    try:
+        #read, preprocess and score the student sentences chunk by chunk
+        student_chunks = iterate_student_statements(args['filename_student'], subcategory, abbreviations, patient_name, args['chunk_size'])
+        while True:
+            with instrumentation.timer('main.student_statements'):
+                student_sentences = next(student_chunks, None)
+            if student_sentences is None:
+                break
+            with instrumentation.timer('main.scoring'):
+                all_matches = algorithm_batch(student_sentences, expert_sentences, expert_categories, args['top_k'])
+            for sent, matches in zip(student_sentences, all_matches):
+                score_most_similar_sentence, most_similar_sentence, most_similar_sentence_category = matches[0]
+                categories_and_scores_most_similar_sentences[most_similar_sentence_category][0] += 1
+                categories_and_scores_most_similar_sentences[most_similar_sentence_category][1] += score_most_similar_sentence
+                #print result on screen depending on threshold
+                if score_most_similar_sentence >= threshold:
+                    print(sent, '\t', score_most_similar_sentence, '\t', most_similar_sentence, '\n')
+                else:
+                    print(sent, '\t', score_most_similar_sentence, '\n')
+                #print the other most similar sentences if argument -k was chosen
+                for score, similar_sentence, similar_sentence_category in matches[1:]:
+                    print('\t', score, '\t', similar_sentence, '\t', similar_sentence_category, '\n')
+                #store results to outfile if argument -o was chosen
+                if writer:
+                    writer.write((sent, score_most_similar_sentence, most_similar_sentence, most_similar_sentence_category))
+            #the results of every chunk are on disk before the next chunk is read
+            if writer:
+                writer.flush()
+    finally:
+        if writer:
+            writer.close()
 #use student input from command line if argument -w was chosen
 elif args['write_sentence']:
     #create outfile if argument -o was chosen
+    writer = None
     if args['outfile']:
-        outname = 'command_line_sentences_outfile.txt'
-        with open(outname, 'w') as out:
-            out.write('Student_sentence \t Similarity_score \t Most_sililar_sentence \t Category\n')
-    while True:
-        sent = input('Statement (write Stop to end the program):\t')
-        if sent == 'Stop':
-            break
-        else:
-            score_most_similar_sentence, most_similar_sentence, most_similar_sentence_category = algorithm(sent, expert_sentences, expert_categories)
-            if most_similar_sentence_category in categories_and_scores_most_similar_sentences:
-                categories_and_scores_most_similar_sentences[most_similar_sentence_category].append(score_most_similar_sentence)
-            else:
-                categories_and_scores_most_similar_sentences[most_similar_sentence_category] = [score_most_similar_sentence]
-            #print result on screen depending on threshold
-            if score_most_similar_sentence >= threshold:
-                print(score_most_similar_sentence, '\t', most_similar_sentence, '\n')
+        outname = 'command_line_sentences_outfile' + EXTENSIONS[args['output_format']]
+        writer = get_result_writer(outname, args['output_format'])
+    try:
+        while True:
+            sent = input('Statement (write Stop to end the program):\t')
+            if sent == 'Stop':
+                break
             else:
-                print(score_most_similar_sentence, '\n')
-            #store results to outfile if argument -o was chosen
-            if args['outfile']:
-                with open(outname, 'a') as out:
-                    to_print = sent + '\t' + str(score_most_similar_sentence) + '\t' + most_similar_sentence + '\t' + most_similar_sentence_category + '\n'
-                    out.write(to_print)
+                with instrumentation.timer('main.scoring'):
+                    score_most_similar_sentence, most_similar_sentence, most_similar_sentence_category = algorithm(sent, expert_sentences, expert_categories)
+                if most_similar_sentence_category not in categories_and_scores_most_similar_sentences:
+                    categories_and_scores_most_similar_sentences[most_similar_sentence_category] = [0, 0.0]
+                categories_and_scores_most_similar_sentences[most_similar_sentence_category][0] += 1
+                categories_and_scores_most_similar_sentences[most_similar_sentence_category][1] += score_most_similar_sentence
+                #print result on screen depending on threshold
+                if score_most_similar_sentence >= threshold:
+                    print(score_most_similar_sentence, '\t', most_similar_sentence, '\n')
+                else:
+                    print(score_most_similar_sentence, '\n')
+                #store results to outfile if argument -o was chosen
+                if writer:
+                    writer.write((sent, score_most_similar_sentence, most_similar_sentence, most_similar_sentence_category))
+                    writer.flush()
+    finally:
+        if writer:
+            writer.close()
 
 print('\n\n***************************************************************************************')
 print('FINAL REPORT')
 print('***************************************************************************************')
 print ("{:^30s} {:^30s} {:^30s}".format('CATEGORY', 'NR. ELEMENTS', 'AVERAGE'))
-for key, value in categories_and_scores_most_similar_sentences.items():
-    if len(value) != 0:
-        print ("{:^30s} {:^30s} {:^30s}".format(key, str(len(value)), str(round(np.average(value),3))))
+for key, (count, total) in categories_and_scores_most_similar_sentences.items():
+    if count != 0:
+        print ("{:^30s} {:^30s} {:^30s}".format(key, str(count), str(round(total / count, 3))))
     else:
         print ("{:^30s} {:^30s} {:^30s}".format(key, str(0), str(0)))
-print('***************************************************************************************')
\ No newline at end of file
+print('***************************************************************************************')
+print_result_cache_statistics()
+
+#print cache statistics if argument --cache_statistics was chosen
+if args['cache_statistics']:
+    correction_statistics = get_correction_statistics()
+    print('SPELL CORRECTION CACHE')
+    print ("{:^22s} {:^22s} {:^22s} {:^22s}".format('TOKENS', 'MEMORY HITS', 'LEXICON HITS', 'CORRECTIONS'))
+    print ("{:^22s} {:^22s} {:^22s} {:^22s}".format(str(correction_statistics['calls']), str(correction_statistics['memory_hits']), str(correction_statistics['lexicon_hits']), str(correction_statistics['corrections'])))
+    print('Hit rate:', correction_statistics['hit_rate'])
+    print('***************************************************************************************')
+
+#print counters and timings if argument --profile was chosen
+if args['profile']:
+    instrumentation.print_profile()
+#write counters and timings if argument --metrics_out was chosen
+if args['metrics_out']:
+    instrumentation.write_metrics(args['metrics_out'])
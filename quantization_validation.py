@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Thu Oct 22 10:38:12 2026
+
+@author: micaelavieira
+"""
+
+"""
+Validation of the int8 (and of smaller, e.g. distilled) sentencebert models against the fp32 model.
+
+Every mode runs in its own process and scores all shipped student files against the expert
+statements of their category, for every subcategory. The report compares, with respect to the
+first mode: score differences, agreement of the best expert match and of its category, and the
+Spearman correlation with the human ratings of AnamBeob_Ratings.tsv. Load time, throughput,
+latency of single sentences and peak memory are reported for every mode.
+
+Usage:
+    python quantization_validation.py report [--modes fp32 int8 other-model:fp32] [--output validation.json]
+"""
+
+import argparse
+from cohort import get_student_files, infer_category
+from expert_corpus import CATEGORIES, load_expert_statements_and_categories, SUBCATEGORIES
+from instrumentation import peak_memory_mb
+import json
+import numpy as np
+from preprocessing import get_student_statements
+import sentencebert
+from similarity import normalize_rows, spearman_correlation
+import subprocess
+import sys
+import time
+
+#file with pairs of expert and student sentences rated by humans
+RATINGS_FILENAME = 'AnamBeob_Ratings.tsv'
+
+def parse_mode(mode: str) -> tuple[str, str]:
+    """
+    Purpose
+    -------
+    Split a mode (fp32, int8, or model:precision) in name of the model and precision.
+
+    Parameters
+    ----------
+    mode : str
+        Mode to split.
+
+    Returns
+    -------
+    tuple
+        Name of the model and precision.
+    """
+    if ':' in mode:
+        model_name, precision = mode.rsplit(':', 1)
+    else:
+        model_name, precision = sentencebert.MODEL_NAME, mode
+    return model_name, precision
+
+def measure(mode: str, abbreviation_list: list, substitution_name: str, latency_calls: int = 20) -> dict:
+    """
+    Purpose
+    -------
+    Load the model of a mode, score the shipped student files and the rated pairs, and measure
+    time and memory.
+
+    Parameters
+    ----------
+    mode : str
+        Mode (fp32, int8, or model:precision).
+    abbreviation_list : list
+        List of abbreviations to keep unchanged during preprocessing.
+    substitution_name : str
+        Name to use to substitute the initial character of the real name of the patient.
+    latency_calls : int, optional
+        Number of single sentences encoded to measure the latency (default: 20).
+
+    Returns
+    -------
+    measurements : dict
+        Dictionary with the measurements and, for every file and subcategory, the best matches.
+    """
+    from sentencebert_finetuning_try import get_train_examples
+    model_name, precision = parse_mode(mode)
+    sentencebert.set_model_name(model_name)
+    sentencebert.set_precision(precision)
+    start = time.perf_counter()
+    sentencebert.load_model()
+    load_time = time.perf_counter() - start
+    matches = {}
+    scored_sentences = 0
+    scoring_time = 0
+    student_files = get_student_files('students')
+    latency_sentences = []
+    for category in CATEGORIES:
+        for subcategory in SUBCATEGORIES:
+            expert_sentences, expert_categories = load_expert_statements_and_categories(category, subcategory, abbreviation_list, substitution_name)
+            for filename in student_files:
+                if infer_category(filename) != category:
+                    continue
+                student_sentences = get_student_statements(filename, subcategory, abbreviation_list, substitution_name)
+                latency_sentences.extend(student_sentences)
+                #without category and subcategory the expert embeddings are not read from the persistent index
+                start = time.perf_counter()
+                file_matches = sentencebert.sentencebert_score_batch(student_sentences, expert_sentences, expert_categories)
+                scoring_time += time.perf_counter() - start
+                scored_sentences += len(student_sentences)
+                matches[filename + ' ' + subcategory] = [list(sentence_matches[0]) for sentence_matches in file_matches]
+    latencies = []
+    for sent in latency_sentences[:latency_calls]:
+        start = time.perf_counter()
+        sentencebert.encode([sent])
+        latencies.append(time.perf_counter() - start)
+    examples = get_train_examples(RATINGS_FILENAME)
+    expert_embeddings = sentencebert.encode([example.texts[0] for example in examples])
+    student_embeddings = sentencebert.encode([example.texts[1] for example in examples])
+    similarities = np.sum(normalize_rows(expert_embeddings) * normalize_rows(student_embeddings), axis=1)
+    peak_memory = peak_memory_mb()
+    p50, p95 = np.percentile(np.array(latencies) * 1000, [50, 95]) if latencies else (0, 0)
+    measurements = {'mode': mode, 'load_seconds': round(load_time, 3),
+                    'sentences_per_second': round(scored_sentences / scoring_time, 1) if scoring_time else None,
+                    'p50_ms': round(float(p50), 2), 'p95_ms': round(float(p95), 2), 'peak_rss_mb': round(peak_memory, 1),
+                    'spearman': round(spearman_correlation(similarities, [example.label for example in examples]), 4),
+                    'matches': matches}
+    return measurements
+
+def compare_matches(reference: dict, other: dict) -> dict:
+    """
+    Purpose
+    -------
+    Compare the best matches of a mode with those of the reference mode.
+
+    Parameters
+    ----------
+    reference : dict
+        Matches of the reference mode (see measure).
+    other : dict
+        Matches of the compared mode.
+
+    Returns
+    -------
+    comparison : dict
+        Dictionary with mean and maximum absolute score difference and fraction of student
+        sentences with the same best match and with the same category.
+    """
+    score_differences, same_match, same_category = [], 0, 0
+    for key, reference_matches in reference.items():
+        for (reference_score, reference_sentence, reference_category), (score, sentence, category) in zip(reference_matches, other[key]):
+            score_differences.append(abs(reference_score - score))
+            same_match += reference_sentence == sentence
+            same_category += reference_category == category
+    count = len(score_differences)
+    comparison = {'mean_score_difference': round(float(np.mean(score_differences)), 4) if count else 0,
+                  'max_score_difference': round(float(np.max(score_differences)), 4) if count else 0,
+                  'best_match_agreement': round(same_match / count, 4) if count else 0,
+                  'category_agreement': round(same_category / count, 4) if count else 0}
+    return comparison
+
+def report(modes: list, abbreviations: str, substitution_name: str, output: str = None):
+    """
+    Purpose
+    -------
+    Measure every mode in its own process (so that the memory of one does not affect the others)
+    and print the comparison with the first mode.
+
+    Parameters
+    ----------
+    modes : list
+        List of modes (fp32, int8, or model:precision); the first one is the reference.
+    abbreviations : str
+        List of abbreviations, as given on the command line.
+    substitution_name : str
+        Name to use to substitute the initial character of the real name of the patient.
+    output : str, optional
+        Json file where to store all measurements.
+    """
+    results = []
+    for mode in modes:
+        completed_process = subprocess.run([sys.executable, __file__, 'measure', mode, '-a', abbreviations, '-p', substitution_name], capture_output=True, text=True)
+        if completed_process.returncode != 0:
+            print(mode, 'failed:', completed_process.stderr.strip().split('\n')[-1])
+            continue
+        results.append(json.loads(completed_process.stdout.strip().split('\n')[-1]))
+    if not results:
+        return
+    print ("{:^30s} {:^12s} {:^12s} {:^12s} {:^12s} {:^14s} {:^12s}".format('MODE', 'LOAD (S)', 'SENT/S', 'P50 (MS)', 'P95 (MS)', 'PEAK RSS (MB)', 'SPEARMAN'))
+    for measurements in results:
+        print ("{:^30s} {:^12s} {:^12s} {:^12s} {:^12s} {:^14s} {:^12s}".format(measurements['mode'], str(measurements['load_seconds']), str(measurements['sentences_per_second']),
+                                                                            str(measurements['p50_ms']), str(measurements['p95_ms']), str(measurements['peak_rss_mb']), str(measurements['spearman'])))
+    print('Compared with', results[0]['mode'] + ':')
+    print ("{:^30s} {:^16s} {:^16s} {:^20s} {:^20s}".format('MODE', 'MEAN |DIFF|', 'MAX |DIFF|', 'SAME BEST MATCH', 'SAME CATEGORY'))
+    for measurements in results[1:]:
+        measurements['comparison'] = compare_matches(results[0]['matches'], measurements['matches'])
+        comparison = measurements['comparison']
+        print ("{:^30s} {:^16s} {:^16s} {:^20s} {:^20s}".format(measurements['mode'], str(comparison['mean_score_difference']), str(comparison['max_score_difference']),
+                                                               str(comparison['best_match_agreement']), str(comparison['category_agreement'])))
+    if output:
+        with open(output, 'w') as out:
+            json.dump(results, out, indent=2, ensure_ascii=False)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare quantized or smaller sentencebert models with the fp32 model.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    report_parser = subparsers.add_parser('report', help='Measure all modes and compare them with the first one')
+    report_parser.add_argument('--modes', nargs='+', default=['fp32', 'int8'], help='Modes to compare: fp32, int8, or model:precision; the first one is the reference (default: fp32 int8)')
+    report_parser.add_argument('--output', help='Json file where to store all measurements')
+    measure_parser = subparsers.add_parser('measure')
+    measure_parser.add_argument('mode')
+    for command_parser in [report_parser, measure_parser]:
+        command_parser.add_argument('-a', '--abbreviations', default='["d.h.", "s.a.", "u.a.", "z.B."]', help='List of abbreviations not to preprocess (default: ["d.h.", "s.a.", "u.a.", "z.B."])')
+        command_parser.add_argument('-p', '--patient', default='Andreas', help='Patient name (default: Andreas)')
+    args = vars(parser.parse_args())
+    if args['command'] == 'report':
+        report(args['modes'], args['abbreviations'], args['patient'], args['output'])
+    elif args['command'] == 'measure':
+        abbreviations = args['abbreviations'].replace('"', '').replace('[', '').replace(']', '').split(', ')
+        print(json.dumps(measure(args['mode'], abbreviations, args['patient']), ensure_ascii=False))
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Fri Oct 23 09:12:47 2026
+
+@author: micaelavieira
+"""
+
+"""
+Persistent cache of the matches of the preprocessed student sentences.
+
+Matches are stored in a SQLite database, keyed by the fingerprint of the algorithm (model and
+options that change the scores, see backends.get_algorithm_fingerprint), the hash of the expert
+corpus, the number of matches and the student sentence. When the cache holds more than
+max_entries results, the least recently used ones are evicted.
+"""
+
+from cache_utils import cache_path, hash_strings
+from instrumentation import increment
+import json
+import sqlite3
+import time
+
+class ResultCache:
+    """
+    SQLite cache of the matches of student sentences, with least-recently-used eviction.
+    """
+
+    def __init__(self, filename: str = None, max_entries: int = 100000):
+        self.filename = filename or cache_path('results.sqlite')
+        self.max_entries = max_entries
+        self.statistics = {'hits': 0, 'misses': 0, 'evictions': 0}
+        self.connection = sqlite3.connect(self.filename, check_same_thread=False)
+        self.connection.execute('CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, matches TEXT, last_used REAL)')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used)')
+        self.connection.commit()
+
+    def get_keys(self, algorithm_fingerprint: str, corpus_hash: str, top_k: int, list_of_single_sentences: list) -> dict:
+        """
+        Purpose
+        -------
+        Compute the key of every sentence.
+
+        Parameters
+        ----------
+        algorithm_fingerprint : str
+            Fingerprint of the algorithm.
+        corpus_hash : str
+            Hash of the expert sentences and categories.
+        top_k : int
+            Number of matches of every sentence.
+        list_of_single_sentences : list
+            List containing the preprocessed student sentences.
+
+        Returns
+        -------
+        keys : dict
+            Dictionary mapping every distinct sentence to its key.
+        """
+        keys = {sent: hash_strings([algorithm_fingerprint, corpus_hash, top_k, sent]) for sent in dict.fromkeys(list_of_single_sentences)}
+        return keys
+
+    def get(self, algorithm_fingerprint: str, corpus_hash: str, top_k: int, list_of_single_sentences: list) -> dict:
+        """
+        Purpose
+        -------
+        Look up the matches of a list of sentences.
+
+        Parameters
+        ----------
+        algorithm_fingerprint : str
+            Fingerprint of the algorithm.
+        corpus_hash : str
+            Hash of the expert sentences and categories.
+        top_k : int
+            Number of matches of every sentence.
+        list_of_single_sentences : list
+            List containing the preprocessed student sentences.
+
+        Returns
+        -------
+        cached_matches : dict
+            Dictionary mapping the sentences found in the cache to their list of matches.
+        """
+        keys = self.get_keys(algorithm_fingerprint, corpus_hash, top_k, list_of_single_sentences)
+        cached_matches = {}
+        for sent, key in keys.items():
+            row = self.connection.execute('SELECT matches FROM results WHERE key = ?', (key,)).fetchone()
+            if row is not None:
+                cached_matches[sent] = [tuple(match) for match in json.loads(row[0])]
+        if cached_matches:
+            self.connection.executemany('UPDATE results SET last_used = ? WHERE key = ?', [(time.time(), keys[sent]) for sent in cached_matches])
+            self.connection.commit()
+        self.statistics['hits'] += len(cached_matches)
+        self.statistics['misses'] += len(keys) - len(cached_matches)
+        increment('result_cache.hits', len(cached_matches))
+        increment('result_cache.misses', len(keys) - len(cached_matches))
+        return cached_matches
+
+    def put(self, algorithm_fingerprint: str, corpus_hash: str, top_k: int, matches_of_sentences: dict):
+        """
+        Purpose
+        -------
+        Store the matches of a list of sentences, then evict the least recently used results if
+        the cache is full.
+
+        Parameters
+        ----------
+        algorithm_fingerprint : str
+            Fingerprint of the algorithm.
+        corpus_hash : str
+            Hash of the expert sentences and categories.
+        top_k : int
+            Number of matches of every sentence.
+        matches_of_sentences : dict
+            Dictionary mapping every sentence to its list of matches.
+        """
+        keys = self.get_keys(algorithm_fingerprint, corpus_hash, top_k, list(matches_of_sentences))
+        now = time.time()
+        self.connection.executemany('INSERT OR REPLACE INTO results VALUES (?, ?, ?)',
+                                    [(keys[sent], json.dumps(matches, ensure_ascii=False), now) for sent, matches in matches_of_sentences.items()])
+        number_of_entries = self.connection.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+        if number_of_entries > self.max_entries:
+            excess = number_of_entries - self.max_entries
+            self.connection.execute('DELETE FROM results WHERE key IN (SELECT key FROM results ORDER BY last_used LIMIT ?)', (excess,))
+            self.statistics['evictions'] += excess
+        self.connection.commit()
+
+    def get_statistics(self) -> dict:
+        """
+        Purpose
+        -------
+        Report the hits, misses and evictions of this run.
+
+        Returns
+        -------
+        statistics : dict
+            Dictionary containing hits, misses, evictions, hit rate and number of stored results.
+        """
+        lookups = self.statistics['hits'] + self.statistics['misses']
+        statistics = dict(self.statistics, hit_rate=round(self.statistics['hits'] / lookups, 3) if lookups else 0,
+                          entries=self.connection.execute('SELECT COUNT(*) FROM results').fetchone()[0])
+        return statistics
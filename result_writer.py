@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Wed Oct 21 09:26:44 2026
+
+@author: micaelavieira
+"""
+
+"""
+Writers of the scored student sentences, in tsv (the columns of the original outfile), jsonl or
+parquet format.
+
+A writer keeps its file open for the whole run and buffers the rows; flush is called after every
+scored batch, so the rows already scored survive an interrupted run (for parquet, every flush
+writes a row group and the file is readable once the writer is closed).
+"""
+
+import json
+
+#columns of the output files
+COLUMNS = ['Student_sentence', 'Similarity_score', 'Most_sililar_sentence', 'Category']
+#extension of the output files in each format
+EXTENSIONS = {'tsv': '.txt', 'jsonl': '.jsonl', 'parquet': '.parquet'}
+
+class ResultWriter:
+    """
+    Base class of the writers; rows are tuples (student sentence, score, most similar sentence, category).
+    """
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        self.rows = []
+
+    def write(self, row: tuple):
+        """
+        Purpose
+        -------
+        Add a row to the buffer.
+
+        Parameters
+        ----------
+        row : tuple
+            Tuple (student sentence, score, most similar sentence, category).
+        """
+        self.rows.append(row)
+
+    def flush(self):
+        """
+        Purpose
+        -------
+        Write the buffered rows to the file.
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """
+        Purpose
+        -------
+        Write the buffered rows and close the file.
+        """
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.close()
+        return False
+
+class TsvResultWriter(ResultWriter):
+    """
+    Writer of tab-separated rows, with the header of the original outfile.
+    """
+
+    def __init__(self, filename: str):
+        super().__init__(filename)
+        self.out = open(filename, 'w')
+        self.out.write('Student_sentence \t Similarity_score \t Most_sililar_sentence \t Category\n')
+
+    def flush(self):
+        self.out.writelines(sent + '\t' + str(score) + '\t' + most_similar_sentence + '\t' + category + '\n' for sent, score, most_similar_sentence, category in self.rows)
+        self.out.flush()
+        self.rows = []
+
+    def close(self):
+        self.flush()
+        self.out.close()
+
+class JsonlResultWriter(ResultWriter):
+    """
+    Writer of one json object per row.
+    """
+
+    def __init__(self, filename: str):
+        super().__init__(filename)
+        self.out = open(filename, 'w', encoding='utf-8')
+
+    def flush(self):
+        self.out.writelines(json.dumps(dict(zip(COLUMNS, row)), ensure_ascii=False) + '\n' for row in self.rows)
+        self.out.flush()
+        self.rows = []
+
+    def close(self):
+        self.flush()
+        self.out.close()
+
+class ParquetResultWriter(ResultWriter):
+    """
+    Writer of a parquet file (requires pyarrow); every flush writes a row group.
+    """
+
+    def __init__(self, filename: str):
+        super().__init__(filename)
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        self.pa = pa
+        self.schema = pa.schema([(COLUMNS[0], pa.string()), (COLUMNS[1], pa.float64()), (COLUMNS[2], pa.string()), (COLUMNS[3], pa.string())])
+        self.out = pq.ParquetWriter(filename, self.schema)
+
+    def flush(self):
+        if self.rows:
+            columns = [list(column) for column in zip(*self.rows)]
+            self.out.write_table(self.pa.Table.from_arrays([self.pa.array(column, type=field.type) for column, field in zip(columns, self.schema)], schema=self.schema))
+        self.rows = []
+
+    def close(self):
+        self.flush()
+        self.out.close()
+
+def get_result_writer(filename: str, output_format: str = 'tsv') -> ResultWriter:
+    """
+    Purpose
+    -------
+    Create a writer by format.
+
+    Parameters
+    ----------
+    filename : str
+        Name of the output file.
+    output_format : str, optional
+        Format of the output file: tsv, jsonl, or parquet (default: tsv).
+
+    Returns
+    -------
+    writer : ResultWriter
+        Writer.
+    """
+    if output_format == 'tsv':
+        writer = TsvResultWriter(filename)
+    elif output_format == 'jsonl':
+        writer = JsonlResultWriter(filename)
+    elif output_format == 'parquet':
+        writer = ParquetResultWriter(filename)
+    else:
+        raise ValueError('Unknown output format: ' + output_format)
+    return writer
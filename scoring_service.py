@@ -0,0 +1,388 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 11:05:49 2026
+
+@author: micaelavieira
+"""
+
+"""
+Local HTTP/JSON scoring service keeping the algorithm and the expert statements in memory.
+
+Statements sent within a short time window by different students are grouped and scored with a
+single batched call of the algorithm.
+
+Endpoints:
+    POST /score    {"session": "...", "category": "anamnese", "subcategory": "beobachtungen", "statements": ["...", ...]}
+                   -> {"results": [{"student_sentence", "score", "most_similar_sentence", "category", "above_threshold"}, ...]}
+    GET  /report?session=...   -> per category, subcategory and expert category number of elements and average score,
+                                  as in the FINAL REPORT
+    GET  /metrics              -> request latency percentiles, batch sizes, sessions and session evictions
+
+At most --max_sessions sessions are kept: the least recently used ones are forgotten.
+
+Usage:
+    python scoring_service.py [-A ALGORITHM] [--host HOST] [--port PORT] [--batch_window SECONDS]
+"""
+
+import argparse
+import asyncio
+from backends import get_scoring_functions, warm_up
+from collections import deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from expert_corpus import CATEGORIES, load_expert_statements_and_categories, SUBCATEGORIES
+import json
+import numpy as np
+from preprocessing import sentence_preprocessing
+import time
+from urllib.parse import parse_qs, urlparse
+
+#threshold above which the most similar expert sentence is displayed by the command line
+THRESHOLD = 0.9
+
+class ScoringService:
+    """
+    Scoring service: keeps the algorithm warm and groups concurrent requests into batches.
+    """
+
+    def __init__(self, algorithm_name: str, abbreviation_list: list, substitution_name: str, batch_window: float = 0.01, max_batch_size: int = 256,
+                 max_sessions: int = 10000, **options):
+        self.algorithm_name = algorithm_name
+        self.abbreviation_list = abbreviation_list
+        self.substitution_name = substitution_name
+        self.batch_window = batch_window
+        self.max_batch_size = max_batch_size
+        self.max_sessions = max_sessions
+        self.options = options
+        #scoring functions and expert statements, keyed by (category, subcategory)
+        self.algorithms = {}
+        self.experts = {}
+        #per session and category: number of scored sentences and sum of their scores; the least
+        #recently used sessions are forgotten when there are more than max_sessions (see get_session)
+        self.sessions = OrderedDict()
+        self.session_evictions = 0
+        self.latencies = {'score': deque(maxlen=10000), 'report': deque(maxlen=10000)}
+        self.batch_sizes = deque(maxlen=10000)
+        #queue of the requests waiting to be batched and single thread running the algorithm (see serve)
+        self.queue = None
+        self.executor = None
+
+    def get_experts_and_algorithm(self, category: str, subcategory: str) -> tuple:
+        """
+        Purpose
+        -------
+        Return the expert statements, their categories and the batch scoring function of a
+        category and subcategory, loading them the first time.
+
+        Parameters
+        ----------
+        category : str
+            Category (either anamnese or spielsituation).
+        subcategory : str
+            Subcategory (beobachtungen, herausforderungen, or ressourcen).
+
+        Returns
+        -------
+        tuple
+            Expert sentences, expert categories, and batch scoring function.
+        """
+        key = (category, subcategory)
+        if key not in self.experts:
+            self.experts[key] = load_expert_statements_and_categories(category, subcategory, self.abbreviation_list, self.substitution_name)
+            self.algorithms[key] = get_scoring_functions(self.algorithm_name, category, subcategory, **self.options)[1]
+        expert_sentences, expert_categories = self.experts[key]
+        return expert_sentences, expert_categories, self.algorithms[key]
+
+    def preload(self):
+        """
+        Purpose
+        -------
+        Load the algorithm and score one sentence for every category and subcategory, so that
+        models and expert indexes are ready before the first request.
+        """
+        for category in CATEGORIES:
+            for subcategory in SUBCATEGORIES:
+                expert_sentences, expert_categories, algorithm_batch = self.get_experts_and_algorithm(category, subcategory)
+                algorithm_batch(expert_sentences[:1], expert_sentences, expert_categories)
+
+    def score_batch(self, key: tuple, list_of_sentences: list) -> list:
+        """
+        Purpose
+        -------
+        Score preprocessed student sentences of one category and subcategory in one call.
+
+        Parameters
+        ----------
+        key : tuple
+            (category, subcategory) of the sentences.
+        list_of_sentences : list
+            List containing the preprocessed student sentences.
+
+        Returns
+        -------
+        matches : list
+            List containing, for each sentence, the tuple (score, most similar sentence, category).
+        """
+        expert_sentences, expert_categories, algorithm_batch = self.get_experts_and_algorithm(*key)
+        matches = [sentence_matches[0] for sentence_matches in algorithm_batch(list_of_sentences, expert_sentences, expert_categories)]
+        return matches
+
+    async def batcher(self):
+        """
+        Purpose
+        -------
+        Collect the requests arriving within batch_window and score them together, grouped by
+        category and subcategory. The algorithm runs in a single worker thread, so the event
+        loop keeps accepting requests meanwhile.
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            pending = [await self.queue.get()]
+            number_of_sentences = len(pending[0][1])
+            deadline = loop.time() + self.batch_window
+            while number_of_sentences < self.max_batch_size:
+                try:
+                    pending.append(await asyncio.wait_for(self.queue.get(), max(deadline - loop.time(), 0)))
+                    number_of_sentences += len(pending[-1][1])
+                except asyncio.TimeoutError:
+                    break
+            groups = {}
+            for key, list_of_sentences, future in pending:
+                groups.setdefault(key, []).append((list_of_sentences, future))
+            for key, requests in groups.items():
+                all_sentences = [sent for list_of_sentences, _ in requests for sent in list_of_sentences]
+                self.batch_sizes.append(len(all_sentences))
+                try:
+                    matches = await loop.run_in_executor(self.executor, self.score_batch, key, all_sentences)
+                except Exception as error:
+                    for _, future in requests:
+                        if not future.done():
+                            future.set_exception(error)
+                    continue
+                start = 0
+                for list_of_sentences, future in requests:
+                    #the client may have disconnected in the meantime
+                    if not future.done():
+                        future.set_result(matches[start:start + len(list_of_sentences)])
+                    start += len(list_of_sentences)
+
+    def get_session(self, session_id: str, create: bool = False) -> dict:
+        """
+        Purpose
+        -------
+        Return the aggregates of a session and mark it as recently used.
+
+        Parameters
+        ----------
+        session_id : str
+            Identifier of the session.
+        create : bool, optional
+            Whether to create the session if it does not exist, evicting the least recently used
+            session if there are too many (default: False).
+
+        Returns
+        -------
+        session : dict
+            Dictionary mapping (category, subcategory) to the aggregates of every expert category
+            (empty if the session does not exist and create is False).
+        """
+        if session_id in self.sessions:
+            self.sessions.move_to_end(session_id)
+            return self.sessions[session_id]
+        if not create:
+            return {}
+        while len(self.sessions) >= self.max_sessions:
+            self.sessions.popitem(last=False)
+            self.session_evictions += 1
+        session = self.sessions[session_id] = {}
+        return session
+
+    async def score(self, request: dict) -> dict:
+        """
+        Purpose
+        -------
+        Preprocess and score the statements of a request and update the aggregates of its session.
+
+        Parameters
+        ----------
+        request : dict
+            Dictionary with session, category, subcategory and statements.
+
+        Returns
+        -------
+        response : dict
+            Dictionary with the results, one per statement.
+        """
+        if not isinstance(request, dict):
+            raise ValueError('the body must be a json object')
+        category = request.get('category', 'anamnese')
+        subcategory = request.get('subcategory', 'beobachtungen')
+        if category not in CATEGORIES or subcategory not in SUBCATEGORIES:
+            raise ValueError('unknown category or subcategory')
+        statements = request.get('statements', [])
+        if not isinstance(statements, list) or not all(isinstance(sent, str) for sent in statements):
+            raise ValueError('statements must be a list of strings')
+        statements = [sent for sent in statements if sent.strip()]
+        loop = asyncio.get_running_loop()
+        student_sentences = await loop.run_in_executor(None, lambda: [sentence_preprocessing(sent, subcategory, self.abbreviation_list, self.substitution_name) for sent in statements])
+        if not student_sentences:
+            return {'results': []}
+        future = loop.create_future()
+        await self.queue.put(((category, subcategory), student_sentences, future))
+        matches = await future
+        #expert category names repeat across categories and subcategories, so they are aggregated separately
+        session = self.get_session(str(request.get('session', 'default')), create=True).setdefault((category, subcategory), {})
+        for expert_category in set(self.experts[(category, subcategory)][1]):
+            session.setdefault(expert_category, [0, 0.0])
+        results = []
+        for sent, (score_most_similar_sentence, most_similar_sentence, most_similar_sentence_category) in zip(student_sentences, matches):
+            session[most_similar_sentence_category][0] += 1
+            session[most_similar_sentence_category][1] += score_most_similar_sentence
+            results.append({'student_sentence': sent, 'score': score_most_similar_sentence,
+                            'most_similar_sentence': most_similar_sentence, 'category': most_similar_sentence_category,
+                            'above_threshold': score_most_similar_sentence >= THRESHOLD})
+        response = {'results': results}
+        return response
+
+    def report(self, session_id: str) -> dict:
+        """
+        Purpose
+        -------
+        Aggregate the scores of a session per category, as in the FINAL REPORT of the command line.
+
+        Parameters
+        ----------
+        session_id : str
+            Identifier of the session.
+
+        Returns
+        -------
+        response : dict
+            Dictionary mapping every category and subcategory to a dictionary mapping every expert
+            category to the number of elements and the average score.
+        """
+        session = self.get_session(session_id)
+        categories = {}
+        for (category, subcategory), totals in session.items():
+            categories.setdefault(category, {})[subcategory] = {key: {'nr_elements': count, 'average': round(total / count, 3) if count else 0}
+                                                                for key, (count, total) in totals.items()}
+        response = {'session': session_id, 'categories': categories}
+        return response
+
+    def metrics(self) -> dict:
+        """
+        Purpose
+        -------
+        Report latency percentiles (in milliseconds) of the endpoints and the sizes of the batches.
+
+        Returns
+        -------
+        response : dict
+            Dictionary with the metrics.
+        """
+        response = {'latency_ms': {}, 'batches': len(self.batch_sizes),
+                    'average_batch_size': round(float(np.mean(self.batch_sizes)), 2) if self.batch_sizes else 0,
+                    'sessions': len(self.sessions), 'session_evictions': self.session_evictions}
+        for endpoint, latencies in self.latencies.items():
+            if latencies:
+                p50, p90, p95, p99 = np.percentile(np.array(latencies) * 1000, [50, 90, 95, 99])
+                response['latency_ms'][endpoint] = {'count': len(latencies), 'p50': round(p50, 2), 'p90': round(p90, 2), 'p95': round(p95, 2), 'p99': round(p99, 2)}
+        return response
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """
+        Purpose
+        -------
+        Read one HTTP request, dispatch it to the endpoint and write the JSON response.
+
+        Parameters
+        ----------
+        reader : asyncio.StreamReader
+            Stream of the request.
+        writer : asyncio.StreamWriter
+            Stream of the response.
+        """
+        start = time.perf_counter()
+        status, response, endpoint = 200, {}, None
+        try:
+            request_line = (await reader.readline()).decode('latin-1').split()
+            headers = {}
+            while True:
+                line = (await reader.readline()).decode('latin-1').strip()
+                if not line:
+                    break
+                name, _, value = line.partition(':')
+                headers[name.strip().lower()] = value.strip()
+            body = await reader.readexactly(int(headers.get('content-length', 0)))
+            method, url = request_line[0], urlparse(request_line[1])
+            if method == 'POST' and url.path == '/score':
+                endpoint = 'score'
+                response = await self.score(json.loads(body or b'{}'))
+            elif method == 'GET' and url.path == '/report':
+                endpoint = 'report'
+                response = self.report(parse_qs(url.query).get('session', ['default'])[0])
+            elif method == 'GET' and url.path == '/metrics':
+                response = self.metrics()
+            else:
+                status, response = 404, {'error': 'not found'}
+        except (ValueError, IndexError, KeyError) as error:
+            status, response = 400, {'error': str(error)}
+        except Exception as error:
+            status, response = 500, {'error': str(error)}
+        payload = json.dumps(response, ensure_ascii=False).encode('utf-8')
+        reason = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 500: 'Internal Server Error'}[status]
+        writer.write(('HTTP/1.1 %d %s\r\nContent-Type: application/json; charset=utf-8\r\nContent-Length: %d\r\nConnection: close\r\n\r\n' % (status, reason, len(payload))).encode('latin-1') + payload)
+        try:
+            await writer.drain()
+        finally:
+            writer.close()
+        if endpoint is not None and status == 200:
+            self.latencies[endpoint].append(time.perf_counter() - start)
+
+    async def serve(self, host: str, port: int):
+        """
+        Purpose
+        -------
+        Start the batcher and serve requests until the process is stopped.
+
+        Parameters
+        ----------
+        host : str
+            Address to listen on.
+        port : int
+            Port to listen on.
+        """
+        self.queue = asyncio.Queue()
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        batcher = asyncio.create_task(self.batcher())
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        print('Serving on http://%s:%d' % (host, port))
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            batcher.cancel()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Scoring service for computer-aided exercises in psychomotor diagnosis.')
+    parser.add_argument('-A', '--algorithm', choices=['sentencebert', 'doc2vec', 'infersent'], default='sentencebert', help='Algorithm to use (default: sentencebert)')
+    parser.add_argument('-a', '--abbreviations', default='["d.h.", "s.a.", "u.a.", "z.B."]', help='List of abbreviations not to preprocess (default: ["d.h.", "s.a.", "u.a.", "z.B."])')
+    parser.add_argument('-p', '--patient', default='Andreas', help='Patient name (default: Andreas)')
+    parser.add_argument('--host', default='127.0.0.1', help='Address to listen on (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8080, help='Port to listen on (default: 8080)')
+    parser.add_argument('--batch_window', type=float, default=0.01, help='Seconds to wait for other requests before scoring a batch (default: 0.01)')
+    parser.add_argument('--max_batch_size', type=int, default=256, help='Maximum number of sentences scored together (default: 256)')
+    parser.add_argument('--max_sessions', type=int, default=10000, help='Maximum number of sessions kept; the least recently used are forgotten (default: 10000)')
+    parser.add_argument('--no_preload', action='store_true', help='Do not load models and expert statements before the first request')
+    parser.add_argument('-m', '--model', help='Name or directory of the sentencebert model (default: gbert-large)')
+    parser.add_argument('--precision', choices=['fp32', 'int8'], default='fp32', help='Precision of the sentencebert model (default: fp32)')
+    parser.add_argument('-t', '--translator', choices=['google', 'identity', 'dictionary'], default='google', help='Translator to English used by infersent (default: google)')
+    parser.add_argument('--translation_dictionary', help='Tsv file with the translations used by the dictionary translator')
+    args = vars(parser.parse_args())
+    warm_up(args['algorithm'], args['model'], args['precision'])
+    abbreviations = args['abbreviations'].replace('"', '').replace('[', '').replace(']', '').split(', ')
+    service = ScoringService(args['algorithm'], abbreviations, args['patient'], args['batch_window'], args['max_batch_size'], args['max_sessions'],
+                             model_name=args['model'], precision=args['precision'], translator=args['translator'], translation_dictionary=args['translation_dictionary'])
+    if not args['no_preload']:
+        service.preload()
+    asyncio.run(service.serve(args['host'], args['port']))
@@ -6,13 +6,220 @@ Created on Sun Nov 28 12:18:36 2021
 @author: micaelavieira
 """
 
+from cache_utils import hash_list, hash_strings
+from embedding_index import get_compact_expert_embeddings, get_expert_embeddings
+from instrumentation import increment, observe, timer
 import numpy as np
-from sentence_transformers import SentenceTransformer
-model = SentenceTransformer('gbert-large')
-from sklearn.metrics.pairwise import cosine_similarity
+import os
+from nn_index import build_index
+from similarity import matches_from_search, normalize_rows
+import threading
 from typing import Tuple
 
-def sentencebert_score(single_sentence: str, list_of_sentences: list, list_of_categories: list) -> Tuple[float, str, str]:
+MODEL_NAME = 'gbert-large'
+#precision of the model: fp32, or int8 for the linear layers quantized dynamically (smaller and faster on CPU)
+PRECISION = 'fp32'
+#number of sentences encoded together by the model
+BATCH_SIZE = 32
+
+#the model is loaded on first use (see load_model)
+model = None
+model_lock = threading.Lock()
+#nearest-neighbour indexes over the expert embeddings, keyed by hash of the sentences and labels, kind of index and storage
+expert_indexes = {}
+#name of the model and version of its files (see get_model_fingerprint)
+model_fingerprint = None
+
+def load_model():
+    """
+    Purpose
+    -------
+    Load the sentenceBERT model, only the first time the function is called. In int8 precision
+    the weights of the linear layers are quantized to 8 bits, and activations are quantized on
+    the fly.
+
+    Returns
+    -------
+    model : SentenceTransformer
+        Loaded model.
+    """
+    global model
+    with model_lock:
+        if model is None:
+            with timer('sentencebert.load_model'):
+                from sentence_transformers import SentenceTransformer
+                if PRECISION == 'int8':
+                    import torch
+                    #dynamic quantization runs only on CPU
+                    model = torch.quantization.quantize_dynamic(SentenceTransformer(MODEL_NAME, device='cpu'), {torch.nn.Linear}, dtype=torch.qint8)
+                else:
+                    model = SentenceTransformer(MODEL_NAME)
+    return model
+
+def set_model_name(model_name: str):
+    """
+    Purpose
+    -------
+    Select the model to load (e.g. the directory of a model fine-tuned with
+    sentencebert_finetuning.py). A model already loaded with another name is discarded.
+
+    Parameters
+    ----------
+    model_name : str
+        Name or path of the model.
+    """
+    global MODEL_NAME, model, model_fingerprint
+    with model_lock:
+        if model_name != MODEL_NAME:
+            MODEL_NAME = model_name
+            model = None
+            model_fingerprint = None
+            expert_indexes.clear()
+
+def set_precision(precision: str):
+    """
+    Purpose
+    -------
+    Select the precision of the model to load. A model already loaded with another precision is discarded.
+
+    Parameters
+    ----------
+    precision : str
+        Either fp32 or int8.
+    """
+    global PRECISION, model, model_fingerprint
+    if precision not in ['fp32', 'int8']:
+        raise ValueError('Unknown precision: ' + precision)
+    with model_lock:
+        if precision != PRECISION:
+            PRECISION = precision
+            model = None
+            model_fingerprint = None
+            expert_indexes.clear()
+
+def get_model_fingerprint() -> str:
+    """
+    Purpose
+    -------
+    Return the name of the model followed, for a model stored in a local directory, by a hash of
+    the size and modification time of its files, and by the precision. Persistent indexes are
+    named after it, so a model fine-tuned again in the same directory, or quantized, does not
+    reuse the embeddings of another version.
+
+    Returns
+    -------
+    model_fingerprint : str
+        Fingerprint of the model.
+    """
+    global model_fingerprint
+    if model_fingerprint is None:
+        file_versions = []
+        if os.path.isdir(MODEL_NAME):
+            for entry in sorted(os.scandir(MODEL_NAME), key=lambda entry: entry.name):
+                if entry.is_file():
+                    file_versions.append('%s %d %d' % (entry.name, entry.stat().st_size, entry.stat().st_mtime_ns))
+        model_fingerprint = MODEL_NAME + ('@' + hash_strings(file_versions)[:12] if file_versions else '') + '#' + PRECISION
+    return model_fingerprint
+
+def encode(list_of_sentences: list) -> np.ndarray:
+    """
+    Purpose
+    -------
+    Encode a list of sentences with the sentenceBERT model.
+
+    Parameters
+    ----------
+    list_of_sentences : list
+        List containing the sentences to encode.
+
+    Returns
+    -------
+    sentences_embeddings : np.ndarray
+        Matrix whose rows are the embeddings of the sentences.
+    """
+    increment('sentencebert.sentences_encoded', len(list_of_sentences))
+    observe('sentencebert.batch_size', len(list_of_sentences))
+    with timer('sentencebert.encode'):
+        sentences_embeddings = load_model().encode(list_of_sentences, batch_size=BATCH_SIZE, convert_to_numpy=True)
+    return sentences_embeddings
+
+def sentencebert_score_batch(list_of_single_sentences: list, list_of_sentences: list, list_of_categories: list, top_k: int = 1, category: str = None, subcategory: str = None, index_kind: str = 'exact', nprobe: int = None,
+                             storage: str = 'float32', pca_dimension: int = None, list_of_labels: list = None, label: str = None) -> list:
+    """
+    Purpose
+    -------
+    Find the most similar sentences to each target sentence with the sentenceBERT method.
+    All target sentences are encoded in batches and searched in a nearest-neighbour index over
+    the expert embeddings (see nn_index.py).
+
+    Parameters
+    ----------
+    list_of_single_sentences : list
+        List containing the target sentences.
+    list_of_sentences : list
+        List containing sentences as strings among which to find the most similar to each target sentence.
+    list_of_categories : list
+        List containing categories of the sentences in list_of_sentences.
+    top_k : int, optional
+        Number of most similar sentences to return for each target sentence (default: 1).
+    category : str, optional
+        Category of the sentences in list_of_sentences; together with subcategory it names the
+        persistent index of their embeddings (see embedding_index.py).
+    subcategory : str, optional
+        Subcategory of the sentences in list_of_sentences.
+    index_kind : str, optional
+        Nearest-neighbour index: exact, or ivf for approximate search in large expert banks (default: exact).
+    nprobe : int, optional
+        Number of clusters scanned by the ivf index: higher is slower but more accurate (default: 8).
+    storage : str, optional
+        Type of the stored expert embeddings: float32, or float16 for half the memory (default: float32).
+    pca_dimension : int, optional
+        Number of principal components on which expert and target embeddings are projected
+        (default: no projection).
+    list_of_labels : list, optional
+        Label of every sentence in list_of_sentences (e.g. category_subcategory), for expert banks
+        pooled across categories (default: no labels).
+    label : str, optional
+        If given together with list_of_labels, only the sentences with this label are searched.
+
+    Returns
+    -------
+    matches : list
+        List containing, for each target sentence, a list of top_k tuples
+        (score_most_similar_sentence, most_similar_sentence, most_similar_sentence_category).
+    """
+    if not list_of_single_sentences:
+        return []
+    components = None
+    #the expert sentences are the same list for every batch, so they are hashed only once
+    content_hash = hash_list(list_of_sentences)
+    with timer('sentencebert.expert_embeddings'):
+        if storage == 'float32' and not pca_dimension:
+            sentences_embeddings = get_expert_embeddings(list_of_sentences, encode, get_model_fingerprint(), category, subcategory, content_hash)
+        else:
+            #compact copy (see embedding_index.py): similarities are computed on it directly
+            sentences_embeddings, components = get_compact_expert_embeddings(list_of_sentences, encode, get_model_fingerprint(), category, subcategory, storage, pca_dimension,
+                                                                              content_hash=content_hash)
+    if list_of_labels is None:
+        label = None
+    elif label is not None and label not in list_of_labels:
+        raise ValueError('No expert sentences with label ' + label)
+    index_key = (content_hash, hash_list(list_of_labels) if list_of_labels is not None else None, index_kind, storage, pca_dimension)
+    if index_key not in expert_indexes:
+        with timer('sentencebert.build_index'):
+            expert_indexes[index_key] = build_index(sentences_embeddings, list_of_labels, kind=index_kind)
+    encoded_sentences = encode(list_of_single_sentences)
+    if components is not None:
+        encoded_sentences = normalize_rows(encoded_sentences) @ components.T
+    with timer('sentencebert.search'):
+        if index_kind == 'ivf':
+            scores, indices = expert_indexes[index_key].search(encoded_sentences, top_k, label, nprobe=nprobe)
+        else:
+            scores, indices = expert_indexes[index_key].search(encoded_sentences, top_k, label)
+    matches = matches_from_search(scores, indices, list_of_sentences, list_of_categories)
+    return matches
+
+def sentencebert_score(single_sentence: str, list_of_sentences: list, list_of_categories: list, category: str = None, subcategory: str = None) -> Tuple[float, str, str]:
     """
     Purpose
     -------
@@ -26,6 +233,11 @@ def sentencebert_score(single_sentence: str, list_of_sentences: list, list_of_ca
         List containing sentences as strings among which to find the most similar to single_sentence.
     list_of_categories : list
         List containing categories of the sentences in list_of_sentences.
+    category : str, optional
+        Category of the sentences in list_of_sentences; together with subcategory it names the
+        persistent index of their embeddings (see embedding_index.py).
+    subcategory : str, optional
+        Subcategory of the sentences in list_of_sentences.
 
     Returns
     -------
@@ -36,11 +248,5 @@ def sentencebert_score(single_sentence: str, list_of_sentences: list, list_of_ca
     most_similar_sentence_category : str
         Category of the most_similar_sentence.
     """
-    sentences_embeddings = model.encode(list_of_sentences)
-    encoded_sentence = model.encode([single_sentence])
-    score_most_similar_sentence = max(cosine_similarity(encoded_sentence, sentences_embeddings)[0])
-    index_most_similar_sentence = np.where(cosine_similarity(encoded_sentence, sentences_embeddings)[0] == score_most_similar_sentence)[0][0]
-    most_similar_sentence = list_of_sentences[index_most_similar_sentence]
-    score_most_similar_sentence = round(score_most_similar_sentence, 2)
-    most_similar_sentence_category = list_of_categories[index_most_similar_sentence]
-    return score_most_similar_sentence, most_similar_sentence, most_similar_sentence_category
\ No newline at end of file
+    score_most_similar_sentence, most_similar_sentence, most_similar_sentence_category = sentencebert_score_batch([single_sentence], list_of_sentences, list_of_categories, 1, category, subcategory)[0][0]
+    return score_most_similar_sentence, most_similar_sentence, most_similar_sentence_category
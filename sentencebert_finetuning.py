@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Wed Oct 21 14:03:29 2026
+
+@author: micaelavieira
+"""
+
+"""
+Fine-tuning of the sentenceBERT model on the similarity ratings of AnamBeob_Ratings.tsv.
+
+Compared with sentencebert_finetuning_try.py, examples are grouped in batches of similar length
+(so that padding stays short), gradients can be accumulated over several batches, checkpoints
+are stored periodically and training can be resumed from the last one. Part of the expert
+sentences (with all their student sentences) is held out to measure the Spearman correlation
+between the cosine similarities of the model and the human ratings, before and after training.
+
+Usage:
+    python sentencebert_finetuning.py [-m gbert-large] [-o gbert-large-finetuned] [--epochs 1] [--resume]
+The fine-tuned model is then used with:
+    python psychomotor_diagnosis_main.py --model gbert-large-finetuned ...
+"""
+
+import argparse
+import json
+import math
+import numpy as np
+import os
+import shutil
+from sentence_transformers import losses, SentenceTransformer
+from sentencebert_finetuning_try import get_train_examples
+from similarity import normalize_rows, spearman_correlation
+import time
+import torch
+from transformers import get_linear_schedule_with_warmup
+
+#name of the directory of the last checkpoint, inside the output directory
+CHECKPOINT_DIRECTORY = 'checkpoint'
+#file with the state of optimizer, scheduler and position in the training, inside the checkpoint
+TRAINING_STATE = 'training_state.pt'
+
+def split_examples(examples: list, held_out_fraction: float = 0.2, seed: int = 42) -> tuple[list, list]:
+    """
+    Purpose
+    -------
+    Split the examples in a training and a held-out set. Examples sharing the expert sentence
+    end up in the same set, so that the held-out expert sentences are never seen in training.
+
+    Parameters
+    ----------
+    examples : list
+        List of InputExample (see sentencebert_finetuning_try.get_train_examples).
+    held_out_fraction : float, optional
+        Minimum fraction of examples to hold out (default: 0.2).
+    seed : int, optional
+        Seed of the random generator (default: 42).
+
+    Returns
+    -------
+    tuple
+        List of training examples and list of held-out examples.
+    """
+    groups = {}
+    for example in examples:
+        groups.setdefault(example.texts[0], []).append(example)
+    expert_sentences = list(groups)
+    np.random.default_rng(seed).shuffle(expert_sentences)
+    train_examples, held_out_examples = [], []
+    for expert_sentence in expert_sentences:
+        if len(held_out_examples) < held_out_fraction * len(examples):
+            held_out_examples.extend(groups[expert_sentence])
+        else:
+            train_examples.extend(groups[expert_sentence])
+    return train_examples, held_out_examples
+
+def evaluate(model: SentenceTransformer, examples: list, batch_size: int = 32) -> float:
+    """
+    Purpose
+    -------
+    Compute the Spearman correlation between the cosine similarities of the model and the ratings.
+
+    Parameters
+    ----------
+    model : SentenceTransformer
+        Model to evaluate.
+    examples : list
+        List of InputExample.
+    batch_size : int, optional
+        Number of sentences encoded together (default: 32).
+
+    Returns
+    -------
+    float
+        Spearman correlation.
+    """
+    expert_embeddings = normalize_rows(model.encode([example.texts[0] for example in examples], batch_size=batch_size, convert_to_numpy=True))
+    student_embeddings = normalize_rows(model.encode([example.texts[1] for example in examples], batch_size=batch_size, convert_to_numpy=True))
+    similarities = np.sum(expert_embeddings * student_embeddings, axis=1)
+    return spearman_correlation(similarities, [example.label for example in examples])
+
+def get_length_batches(lengths: list, batch_size: int, seed: int) -> list:
+    """
+    Purpose
+    -------
+    Group the examples in batches of similar length, in random order. Examples are shuffled
+    before sorting by length, so that examples of the same length change batch at every epoch.
+
+    Parameters
+    ----------
+    lengths : list
+        Number of tokens of every example.
+    batch_size : int
+        Number of examples in a batch.
+    seed : int
+        Seed of the random generator (the same seed gives the same batches, see train).
+
+    Returns
+    -------
+    batches : list
+        List of lists of indices of examples.
+    """
+    random_generator = np.random.default_rng(seed)
+    order = sorted(random_generator.permutation(len(lengths)).tolist(), key=lambda index: lengths[index])
+    batches = [order[start:start + batch_size] for start in range(0, len(order), batch_size)]
+    random_generator.shuffle(batches)
+    return batches
+
+def get_features(model: SentenceTransformer, batch_examples: list) -> tuple[list, torch.Tensor]:
+    """
+    Purpose
+    -------
+    Tokenize a batch of examples, padding only to the longest sentence of the batch.
+
+    Parameters
+    ----------
+    model : SentenceTransformer
+        Model being trained.
+    batch_examples : list
+        List of InputExample.
+
+    Returns
+    -------
+    tuple
+        Features of the expert and of the student sentences, and tensor of the ratings.
+    """
+    features = []
+    for position in range(2):
+        tokenized_sentences = model.tokenize([example.texts[position] for example in batch_examples])
+        features.append({key: value.to(model.device) for key, value in tokenized_sentences.items()})
+    labels = torch.tensor([example.label for example in batch_examples], dtype=torch.float, device=model.device)
+    return features, labels
+
+def save_checkpoint(model: SentenceTransformer, output_path: str, training_state: dict):
+    """
+    Purpose
+    -------
+    Store model and training state in the checkpoint directory, replacing the previous checkpoint
+    only once the new one is complete.
+
+    Parameters
+    ----------
+    model : SentenceTransformer
+        Model being trained.
+    output_path : str
+        Output directory of the training.
+    training_state : dict
+        Dictionary with epoch, batch, step, optimizer and scheduler.
+    """
+    checkpoint_path = os.path.join(output_path, CHECKPOINT_DIRECTORY)
+    temporary_path = checkpoint_path + '.tmp'
+    shutil.rmtree(temporary_path, ignore_errors=True)
+    model.save(temporary_path)
+    torch.save(training_state, os.path.join(temporary_path, TRAINING_STATE))
+    shutil.rmtree(checkpoint_path, ignore_errors=True)
+    os.replace(temporary_path, checkpoint_path)
+
+def train(model: SentenceTransformer, train_examples: list, output_path: str, epochs: int = 1, batch_size: int = 16, accumulation_steps: int = 1,
+          learning_rate: float = 2e-5, warmup_steps: int = 20, checkpoint_steps: int = 50, seed: int = 42, resume: bool = False) -> dict:
+    """
+    Purpose
+    -------
+    Fine-tune the model with the cosine similarity loss. The optimizer makes a step every
+    accumulation_steps batches (the effective batch size is batch_size * accumulation_steps)
+    and a checkpoint is stored every checkpoint_steps steps and at the end of every epoch.
+
+    Parameters
+    ----------
+    model : SentenceTransformer
+        Model to train (loaded from the checkpoint when resuming, see main).
+    train_examples : list
+        List of InputExample.
+    output_path : str
+        Output directory of the training.
+    epochs : int, optional
+        Number of epochs (default: 1).
+    batch_size : int, optional
+        Number of examples in a batch (default: 16).
+    accumulation_steps : int, optional
+        Number of batches whose gradients are accumulated before a step (default: 1).
+    learning_rate : float, optional
+        Peak learning rate (default: 2e-5).
+    warmup_steps : int, optional
+        Number of steps of linear warm up of the learning rate (default: 20).
+    checkpoint_steps : int, optional
+        Number of steps between checkpoints (default: 50).
+    seed : int, optional
+        Seed of the order of the batches (default: 42).
+    resume : bool, optional
+        Whether to continue from the state stored in the checkpoint (default: False).
+
+    Returns
+    -------
+    statistics : dict
+        Dictionary with the number of examples, seconds and examples per second of the training.
+    """
+    loss_function = losses.CosineSimilarityLoss(model)
+    optimizer = torch.optim.AdamW(model.parameters(), lr=learning_rate)
+    batches_per_epoch = math.ceil(len(train_examples) / batch_size)
+    total_steps = math.ceil(batches_per_epoch / accumulation_steps) * epochs
+    scheduler = get_linear_schedule_with_warmup(optimizer, min(warmup_steps, total_steps), total_steps)
+    training_state = {'epoch': 0, 'batch': 0, 'step': 0}
+    state_filename = os.path.join(output_path, CHECKPOINT_DIRECTORY, TRAINING_STATE)
+    if resume and os.path.exists(state_filename):
+        training_state = torch.load(state_filename)
+        optimizer.load_state_dict(training_state['optimizer'])
+        scheduler.load_state_dict(training_state['scheduler'])
+        print('Resuming from epoch', training_state['epoch'] + 1, 'batch', training_state['batch'], 'step', training_state['step'])
+    #lengths are measured once; the longer sentence of the pair decides the padding
+    lengths = [max(len(model.tokenizer.tokenize(text)) for text in example.texts) for example in train_examples]
+    model.train()
+    trained_examples = 0
+    start = time.perf_counter()
+    for epoch in range(training_state['epoch'], epochs):
+        #the batches of an epoch depend only on the seed and the epoch, so they are the same when resuming
+        batches = get_length_batches(lengths, batch_size, seed + epoch)
+        first_batch = training_state['batch'] if epoch == training_state['epoch'] else 0
+        for batch_number in range(first_batch, len(batches)):
+            features, labels = get_features(model, [train_examples[index] for index in batches[batch_number]])
+            loss_value = loss_function(features, labels) / accumulation_steps
+            loss_value.backward()
+            trained_examples += len(batches[batch_number])
+            #make a step every accumulation_steps batches and at the end of the epoch
+            if (batch_number + 1) % accumulation_steps == 0 or batch_number + 1 == len(batches):
+                torch.nn.utils.clip_grad_norm_(model.parameters(), 1.0)
+                optimizer.step()
+                scheduler.step()
+                optimizer.zero_grad()
+                training_state['step'] += 1
+                if training_state['step'] % checkpoint_steps == 0 and batch_number + 1 < len(batches):
+                    save_checkpoint(model, output_path, {'epoch': epoch, 'batch': batch_number + 1, 'step': training_state['step'],
+                                                         'optimizer': optimizer.state_dict(), 'scheduler': scheduler.state_dict()})
+        elapsed_time = time.perf_counter() - start
+        print('Epoch', epoch + 1, 'of', epochs, '-', trained_examples, 'examples,', round(trained_examples / elapsed_time, 2), 'examples/sec')
+        save_checkpoint(model, output_path, {'epoch': epoch + 1, 'batch': 0, 'step': training_state['step'],
+                                             'optimizer': optimizer.state_dict(), 'scheduler': scheduler.state_dict()})
+    model.eval()
+    elapsed_time = time.perf_counter() - start
+    statistics = {'examples': trained_examples, 'seconds': round(elapsed_time, 2),
+                  'examples_per_second': round(trained_examples / elapsed_time, 2) if elapsed_time else None}
+    return statistics
+
+def main():
+    parser = argparse.ArgumentParser(description='Fine-tune the sentenceBERT model on the similarity ratings.')
+    parser.add_argument('-m', '--model', default='gbert-large', help='Model to fine-tune (default: gbert-large)')
+    parser.add_argument('-i', '--ratings', default='AnamBeob_Ratings.tsv', help='Tsv file with expert sentences, student sentences and ratings (default: AnamBeob_Ratings.tsv)')
+    parser.add_argument('-o', '--output', default='gbert-large-finetuned', help='Directory of the fine-tuned model and of its checkpoint (default: gbert-large-finetuned)')
+    parser.add_argument('--epochs', type=int, default=1, help='Number of epochs (default: 1)')
+    parser.add_argument('--batch_size', type=int, default=16, help='Number of examples in a batch (default: 16)')
+    parser.add_argument('--accumulation_steps', type=int, default=1, help='Number of batches whose gradients are accumulated before a step (default: 1)')
+    parser.add_argument('--learning_rate', type=float, default=2e-5, help='Peak learning rate (default: 2e-5)')
+    parser.add_argument('--warmup_steps', type=int, default=20, help='Number of steps of warm up of the learning rate (default: 20)')
+    parser.add_argument('--checkpoint_steps', type=int, default=50, help='Number of steps between checkpoints (default: 50)')
+    parser.add_argument('--held_out', type=float, default=0.2, help='Fraction of examples held out for evaluation (default: 0.2)')
+    parser.add_argument('--threads', type=int, help='Number of threads used by torch on CPU (default: torch default)')
+    parser.add_argument('--seed', type=int, default=42, help='Seed of split, initialisation and order of the batches (default: 42)')
+    parser.add_argument('--resume', action='store_true', help='Continue from the last checkpoint in the output directory')
+    args = vars(parser.parse_args())
+    if args['threads']:
+        torch.set_num_threads(args['threads'])
+    torch.manual_seed(args['seed'])
+    train_examples, held_out_examples = split_examples(get_train_examples(args['ratings']), args['held_out'], args['seed'])
+    print('Training examples:', len(train_examples), '- held-out examples:', len(held_out_examples))
+    checkpoint_path = os.path.join(args['output'], CHECKPOINT_DIRECTORY)
+    resume = args['resume'] and os.path.exists(os.path.join(checkpoint_path, TRAINING_STATE))
+    model = SentenceTransformer(checkpoint_path if resume else args['model'])
+    report = {'model': args['model'], 'train_examples': len(train_examples), 'held_out_examples': len(held_out_examples)}
+    if held_out_examples and not resume:
+        report['spearman_before'] = round(evaluate(model, held_out_examples), 4)
+        print('Held-out Spearman correlation before training:', report['spearman_before'])
+    report.update(train(model, train_examples, args['output'], args['epochs'], args['batch_size'], args['accumulation_steps'],
+                        args['learning_rate'], args['warmup_steps'], args['checkpoint_steps'], args['seed'], resume))
+    if held_out_examples:
+        report['spearman_after'] = round(evaluate(model, held_out_examples), 4)
+        print('Held-out Spearman correlation after training:', report['spearman_after'])
+    model.save(args['output'])
+    with open(os.path.join(args['output'], 'finetuning_report.json'), 'w') as out:
+        json.dump(report, out, indent=2)
+    print('Fine-tuned model stored in', args['output'], '(use it with --model', args['output'] + ')')
+
+if __name__ == '__main__':
+    main()
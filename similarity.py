@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 16:02:51 2026
+
+@author: micaelavieira
+"""
+
+"""
+Vectorised similarity functions shared by the three algorithms.
+"""
+
+import numpy as np
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """
+    Purpose
+    -------
+    Scale every row of a matrix to unit length, so that cosine similarity becomes a dot product.
+
+    Parameters
+    ----------
+    matrix : np.ndarray
+        Matrix whose rows are embeddings.
+
+    Returns
+    -------
+    normalized_matrix : np.ndarray
+        Matrix with rows of unit length (rows of zeros are left unchanged).
+    """
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    normalized_matrix = matrix / norms
+    return normalized_matrix
+
+def cosine_similarities(query_embeddings: np.ndarray, sentences_embeddings: np.ndarray, normalized: bool = False) -> np.ndarray:
+    """
+    Purpose
+    -------
+    Compute the cosine similarity between every query and every sentence with one matrix product.
+
+    Parameters
+    ----------
+    query_embeddings : np.ndarray
+        Matrix whose rows are the embeddings of the queries.
+    sentences_embeddings : np.ndarray
+        Matrix whose rows are the embeddings of the sentences.
+    normalized : bool, optional
+        True if sentences_embeddings has already unit-length rows (default: False).
+
+    Returns
+    -------
+    similarities : np.ndarray
+        Matrix of shape (number of queries, number of sentences).
+    """
+    if not normalized:
+        sentences_embeddings = normalize_rows(sentences_embeddings)
+    similarities = normalize_rows(query_embeddings) @ np.asarray(sentences_embeddings).T
+    return similarities
+
+def best_matches(similarities: np.ndarray, list_of_sentences: list, list_of_categories: list, top_k: int = 1) -> list:
+    """
+    Purpose
+    -------
+    Extract, for every row of a similarity matrix, the top_k most similar sentences with their
+    (rounded) scores and categories. Ties are broken in favour of the first sentence.
+
+    Parameters
+    ----------
+    similarities : np.ndarray
+        Matrix of shape (number of queries, number of sentences).
+    list_of_sentences : list
+        List containing the sentences corresponding to the columns of similarities.
+    list_of_categories : list
+        List containing categories of the sentences in list_of_sentences.
+    top_k : int, optional
+        Number of matches to return for every query (default: 1).
+
+    Returns
+    -------
+    matches : list
+        List containing, for every query, a list of top_k tuples
+        (score_most_similar_sentence, most_similar_sentence, most_similar_sentence_category)
+        sorted from the most to the least similar.
+    """
+    top_k = min(top_k, similarities.shape[1])
+    if top_k == 1:
+        top_indices = np.argmax(similarities, axis=1)[:, np.newaxis]
+    else:
+        candidate_indices = np.argpartition(-similarities, top_k - 1, axis=1)[:, :top_k]
+        matches_indices = []
+        for row, candidates in enumerate(candidate_indices):
+            #sort by decreasing score, then by position in list_of_sentences
+            order = np.lexsort((candidates, -similarities[row, candidates]))
+            matches_indices.append(candidates[order])
+        top_indices = np.array(matches_indices)
+    matches = []
+    for row, indices in enumerate(top_indices):
+        matches.append([(round(float(similarities[row, index]), 2), list_of_sentences[index], list_of_categories[index]) for index in indices])
+    return matches
+
+def matches_from_search(scores: np.ndarray, indices: np.ndarray, list_of_sentences: list, list_of_categories: list) -> list:
+    """
+    Purpose
+    -------
+    Convert the result of a nearest-neighbour search (see nn_index.py) into matches, in the same
+    format as best_matches. Missing results (index -1) are skipped.
+
+    Parameters
+    ----------
+    scores : np.ndarray
+        Matrix of shape (number of queries, k) with the similarities, in decreasing order.
+    indices : np.ndarray
+        Matrix of shape (number of queries, k) with the indices of the sentences.
+    list_of_sentences : list
+        List containing the sentences indexed by indices.
+    list_of_categories : list
+        List containing categories of the sentences in list_of_sentences.
+
+    Returns
+    -------
+    matches : list
+        List containing, for every query, a list of tuples
+        (score_most_similar_sentence, most_similar_sentence, most_similar_sentence_category).
+    """
+    matches = []
+    for row_scores, row_indices in zip(scores, indices):
+        matches.append([(round(float(score), 2), list_of_sentences[index], list_of_categories[index]) for score, index in zip(row_scores, row_indices) if index >= 0])
+    return matches
+
+def average_ranks(values: np.ndarray) -> np.ndarray:
+    """
+    Purpose
+    -------
+    Rank values from 1 to n; tied values get the average of their ranks.
+
+    Parameters
+    ----------
+    values : np.ndarray
+        Values to rank.
+
+    Returns
+    -------
+    ranks : np.ndarray
+        Rank of every value.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    order = np.argsort(values, kind='mergesort')
+    sorted_values = values[order]
+    #positions where a new value starts in sorted_values
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(sorted_values)) + 1))
+    ends = np.concatenate((starts[1:], [len(values)]))
+    ranks = np.empty(len(values), dtype=np.float64)
+    for start, end in zip(starts, ends):
+        ranks[order[start:end]] = (start + end + 1) / 2
+    return ranks
+
+def spearman_correlation(first_values: np.ndarray, second_values: np.ndarray) -> float:
+    """
+    Purpose
+    -------
+    Compute the Spearman correlation between two lists of values (Pearson correlation of their ranks).
+
+    Parameters
+    ----------
+    first_values : np.ndarray
+        First list of values.
+    second_values : np.ndarray
+        Second list of values.
+
+    Returns
+    -------
+    float
+        Spearman correlation (nan if one of the lists is constant).
+    """
+    first_ranks = average_ranks(first_values) - (len(first_values) + 1) / 2
+    second_ranks = average_ranks(second_values) - (len(second_values) + 1) / 2
+    denominator = np.sqrt(np.sum(first_ranks ** 2) * np.sum(second_ranks ** 2))
+    return float(np.sum(first_ranks * second_ranks) / denominator) if denominator else float('nan')
@@ -0,0 +1,27 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests of the comparison of benchmark results with a baseline.
+"""
+
+from benchmark import compare_with_baseline
+
+def test_higher_throughput_is_not_a_regression():
+    results = {'runs': {'x': {'throughput_sentences_per_s': 200.0}}}
+    baseline = {'runs': {'x': {'throughput_sentences_per_s': 100.0}}}
+    assert compare_with_baseline(results, baseline, 0.2) == []
+
+def test_lower_throughput_is_a_regression():
+    results = {'runs': {'x': {'throughput_sentences_per_s': 50.0}}}
+    baseline = {'runs': {'x': {'throughput_sentences_per_s': 100.0}}}
+    assert compare_with_baseline(results, baseline, 0.2) == ['runs/x/throughput_sentences_per_s: 50.0 < 100.0']
+
+def test_latencies_regress_when_they_increase():
+    results = {'runs': {'x': {'p95_ms': 20.0, 'stages_s': {'encode': 0.5}}}}
+    baseline = {'runs': {'x': {'p95_ms': 10.0, 'stages_s': {'encode': 1.0}}}}
+    assert compare_with_baseline(results, baseline, 0.2) == ['runs/x/p95_ms: 20.0 > 10.0']
+
+def test_peak_memory_regresses_when_it_increases():
+    results = {'runs': {'x': {'peak_rss_mb': 300.0}, 'y': {'peak_rss_mb': 90.0}}}
+    baseline = {'runs': {'x': {'peak_rss_mb': 200.0}, 'y': {'peak_rss_mb': 100.0}}}
+    assert compare_with_baseline(results, baseline, 0.2) == ['runs/x/peak_rss_mb: 300.0 > 200.0']
@@ -0,0 +1,26 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests of the label filter of the nearest-neighbour indexes.
+"""
+
+import numpy as np
+from nn_index import ExactIndex, generate_clustered_embeddings, IVFIndex
+
+def test_filtered_ivf_search_returns_k_results_of_the_label():
+    embeddings = generate_clustered_embeddings(2000, 32, number_of_clusters=50)
+    #a label with only a few rows, spread over many lists
+    labels = ['rare' if row % 400 == 0 else 'common' for row in range(2000)]
+    queries = embeddings[:20]
+    ivf_index = IVFIndex(embeddings, labels, nprobe=1)
+    scores, indices = ivf_index.search(queries, 3, label='rare')
+    exact_scores, exact_indices = ExactIndex(embeddings, labels).search(queries, 3, label='rare')
+    assert np.all(indices >= 0)
+    assert all(labels[index] == 'rare' for index in indices.ravel())
+    assert np.array_equal(indices, exact_indices)
+
+def test_filtered_search_with_fewer_rows_than_k():
+    embeddings = generate_clustered_embeddings(500, 16, number_of_clusters=10)
+    labels = ['a'] * 498 + ['b'] * 2
+    scores, indices = IVFIndex(embeddings, labels, nprobe=1).search(embeddings[:5], 4, label='b')
+    assert np.all(indices[:, :2] >= 0) and np.all(indices[:, 2:] == -1)
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 17:21:05 2026
+
+@author: micaelavieira
+"""
+
+"""
+Translators used to bring the German remarks to English for the infersent method.
+
+Every translator maps a list of sentences to a list of translations. CachedTranslator stores
+the translations of another translator in a SQLite database, so each sentence is sent to the
+online service only once; IdentityTranslator and DictionaryTranslator work offline.
+"""
+
+from cache_utils import cache_path
+from instrumentation import increment
+import sqlite3
+
+class Translator:
+    """
+    Base class of the translators.
+    """
+    name = 'translator'
+
+    def translate(self, list_of_sentences: list) -> list:
+        """
+        Purpose
+        -------
+        Translate a list of sentences.
+
+        Parameters
+        ----------
+        list_of_sentences : list
+            List containing the sentences to translate.
+
+        Returns
+        -------
+        translated_sentences : list
+            List containing the translated sentences.
+        """
+        raise NotImplementedError
+
+class GoogleTranslator(Translator):
+    """
+    Online translation to English with Google Translate (through deep_translator).
+    """
+    name = 'google'
+
+    def __init__(self, source: str = 'auto', target: str = 'en'):
+        #import here, so that offline translators do not need deep_translator
+        from deep_translator import GoogleTranslator as DeepGoogleTranslator
+        self.translator = DeepGoogleTranslator(source=source, target=target)
+
+    def translate(self, list_of_sentences: list) -> list:
+        translated_sentences = [self.translator.translate(sent) for sent in list_of_sentences]
+        return translated_sentences
+
+class IdentityTranslator(Translator):
+    """
+    Offline stand-in returning the sentences unchanged.
+    """
+    name = 'identity'
+
+    def translate(self, list_of_sentences: list) -> list:
+        translated_sentences = list(list_of_sentences)
+        return translated_sentences
+
+class DictionaryTranslator(Translator):
+    """
+    Offline stand-in reading the translations from a tsv file (source sentence or word, tab, translation).
+    Sentences not in the file are translated word by word; unknown words are left unchanged.
+    """
+    name = 'dictionary'
+
+    def __init__(self, filename: str):
+        self.dictionary = {}
+        with open(filename, 'r', encoding='utf-8') as infile:
+            for line in infile:
+                splitted_line = line.rstrip('\n').split('\t')
+                if len(splitted_line) >= 2 and splitted_line[0] != '':
+                    self.dictionary[splitted_line[0]] = splitted_line[1]
+
+    def translate(self, list_of_sentences: list) -> list:
+        translated_sentences = []
+        for sent in list_of_sentences:
+            if sent in self.dictionary:
+                translated_sentences.append(self.dictionary[sent])
+            else:
+                translated_sentences.append(' '.join(self.dictionary.get(token, token) for token in sent.split()))
+        return translated_sentences
+
+class CachedTranslator(Translator):
+    """
+    Translator storing the translations of another translator in a SQLite database,
+    keyed by name of the translator and source sentence.
+    """
+
+    def __init__(self, translator: Translator, filename: str = None):
+        self.translator = translator
+        self.name = translator.name
+        self.filename = filename or cache_path('translations.sqlite')
+        self.connection = sqlite3.connect(self.filename, check_same_thread=False)
+        self.connection.execute('CREATE TABLE IF NOT EXISTS translations (translator TEXT, source TEXT, translation TEXT, PRIMARY KEY (translator, source))')
+        self.connection.commit()
+
+    def translate(self, list_of_sentences: list) -> list:
+        cached_translations = {}
+        for sent in set(list_of_sentences):
+            row = self.connection.execute('SELECT translation FROM translations WHERE translator = ? AND source = ?', (self.name, sent)).fetchone()
+            if row is not None:
+                cached_translations[sent] = row[0]
+        #translate only the sentences that are not in the cache yet
+        sentences_to_translate = [sent for sent in dict.fromkeys(list_of_sentences) if sent not in cached_translations]
+        increment('translation.cache_hits', len(cached_translations))
+        increment('translation.cache_misses', len(sentences_to_translate))
+        if sentences_to_translate:
+            new_translations = self.translator.translate(sentences_to_translate)
+            self.connection.executemany('INSERT OR REPLACE INTO translations VALUES (?, ?, ?)',
+                                        [(self.name, sent, translation) for sent, translation in zip(sentences_to_translate, new_translations)])
+            self.connection.commit()
+            cached_translations.update(zip(sentences_to_translate, new_translations))
+        translated_sentences = [cached_translations[sent] for sent in list_of_sentences]
+        return translated_sentences
+
+def get_translator(name: str = 'google', dictionary_filename: str = None, cached: bool = True) -> Translator:
+    """
+    Purpose
+    -------
+    Create a translator by name.
+
+    Parameters
+    ----------
+    name : str, optional
+        Name of the translator: google, identity, or dictionary (default: google).
+    dictionary_filename : str, optional
+        Name of the tsv file with the translations, required by the dictionary translator.
+    cached : bool, optional
+        Whether to store the translations in the persistent cache (default: True).
+
+    Returns
+    -------
+    translator : Translator
+        Translator.
+    """
+    if name == 'google':
+        translator = GoogleTranslator()
+    elif name == 'identity':
+        translator = IdentityTranslator()
+    elif name == 'dictionary':
+        if dictionary_filename is None:
+            raise ValueError('The dictionary translator needs a file with the translations')
+        translator = DictionaryTranslator(dictionary_filename)
+    else:
+        raise ValueError('Unknown translator: ' + name)
+    #offline translators are fast enough not to be cached
+    if cached and name == 'google':
+        translator = CachedTranslator(translator)
+    return translator